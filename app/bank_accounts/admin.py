@@ -1,12 +1,28 @@
+from datetime import datetime, timedelta
 from urllib.parse import urlencode
-from django.contrib import admin
-from bank_accounts.forms import TransactionAdminForm
+from django.contrib import admin, messages
+from django.db import models, transaction
+from django.template.response import TemplateResponse
+from django.utils import timezone
+from bank_accounts.forms import (
+    BULK_ADD_DEFAULT_ROWS,
+    BULK_ADD_MAX_ROWS,
+    BulkTransactionDefaultsForm,
+    TransactionAdminForm,
+    bulk_transaction_formset,
+)
 from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin
-from django.core.exceptions import ValidationError
+from django.core.exceptions import PermissionDenied, ValidationError
 from bank_accounts.models import CardAccountModel, TransactionModel
-from django.http import HttpResponseRedirect
-from django.urls import reverse
+from bank_accounts.services import InsufficientFunds, post_transaction, post_transactions_bulk
+from django.http import HttpResponseRedirect, JsonResponse
+from django.urls import path, reverse
+from bank_accounts.cache import get_card_suggestions
+from bank_accounts.filters import card_prefix_q, filter_card_prefix
+from bank_accounts.pagination import EstimatedCountPaginator
+
+CARD_AUTOCOMPLETE_LIMIT = 10
 
 admin.site.unregister(User)
 
@@ -17,11 +33,110 @@ class CustomUserAdmin(UserAdmin):
     search_fields = ("username", "email")
 
 
+class CardNumberSearchMixin:
+    """
+    Поиск в админке по номеру карты в полях search_fields: цифры — начало номера
+    (или номер целиком), диапазон по индексу этих полей. Стандартный icontains
+    читает всю таблицу.
+    """
+    search_help_text = "Номер карты или его начало, только цифры."
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.replace(" ", "")
+        if not term:
+            return queryset, False
+        if not term.isdigit() or len(term) > 16:
+            return queryset.none(), False
+        condition = models.Q()
+        for field in self.search_fields:
+            condition |= card_prefix_q(field, term)
+        return queryset.filter(condition), False
+
+
+class IndexedDatesQuerySet(models.QuerySet):
+    """
+    QuerySet для date_hierarchy на больших таблицах. Стандартный datetimes() — DISTINCT
+    по всем строкам, а aggregate(Min, Max) в одном SELECT SQLite выполняет полным чтением.
+    Здесь границы берутся поиском по индексу (ORDER BY ... LIMIT 1), а каждый год / месяц / день
+    между ними проверяется через exists() — число запросов зависит от периода, не от числа строк.
+    """
+
+    def _edge(self, field_name, last):
+        # date_hierarchy спрашивает границы у одного и того же QuerySet дважды (aggregate и datetimes)
+        edges = self.__dict__.setdefault("_edges", {})
+        if (field_name, last) not in edges:
+            ordering = f"-{field_name}" if last else field_name
+            edges[field_name, last] = (
+                self.filter(**{f"{field_name}__isnull": False})
+                .order_by(ordering).values_list(field_name, flat=True).first()
+            )
+        return edges[field_name, last]
+
+    def aggregate(self, *args, **kwargs):
+        simple = kwargs and not args and all(
+            isinstance(aggregate, (models.Min, models.Max))
+            and aggregate.filter is None
+            and isinstance(aggregate.source_expressions[0], models.F)
+            for aggregate in kwargs.values()
+        )
+        if not simple:
+            return super().aggregate(*args, **kwargs)
+        return {
+            name: self._edge(aggregate.source_expressions[0].name, isinstance(aggregate, models.Max))
+            for name, aggregate in kwargs.items()
+        }
+
+    def datetimes(self, field_name, kind, order="ASC", tzinfo=None):
+        if kind not in ("year", "month", "day"):
+            return super().datetimes(field_name, kind, order, tzinfo)
+        first, last = self._edge(field_name, False), self._edge(field_name, True)
+        if first is None:
+            return []
+        tzinfo = tzinfo or timezone.get_current_timezone()
+        first = timezone.localtime(first, tzinfo).replace(tzinfo=None)
+        last = timezone.localtime(last, tzinfo).replace(tzinfo=None)
+
+        periods = []
+        start = _truncate(first, kind)
+        while start <= last:
+            end = _next_period(start, kind)
+            bounds = {
+                f"{field_name}__gte": timezone.make_aware(start, tzinfo),
+                f"{field_name}__lt": timezone.make_aware(end, tzinfo),
+            }
+            if self.filter(**bounds).exists():
+                periods.append(bounds[f"{field_name}__gte"])
+            start = end
+        return periods if order == "ASC" else periods[::-1]
+
+
+def _truncate(moment, kind):
+    if kind == "year":
+        return datetime(moment.year, 1, 1)
+    if kind == "month":
+        return datetime(moment.year, moment.month, 1)
+    return datetime(moment.year, moment.month, moment.day)
+
+
+def _next_period(start, kind):
+    if kind == "year":
+        return start.replace(year=start.year + 1)
+    if kind == "month":
+        return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return start + timedelta(days=1)
+
+
 @admin.register(CardAccountModel)
-class CardAccountAdmin(admin.ModelAdmin):
-    list_display = ("card_number", "balance", "expiration_date")
+class CardAccountAdmin(CardNumberSearchMixin, admin.ModelAdmin):
+    list_display = ("card_number", "user", "balance", "expiration_date")
+    # владелец в списке — одним JOIN, а не запросом на каждую строку
+    list_select_related = ("user",)
+    raw_id_fields = ("user",)
     search_fields = ("card_number",)
     list_filter = ("expiration_date",)
+    ordering = ("card_number",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     fieldsets = (
         ("Владелец", {
@@ -37,12 +152,17 @@ class CardAccountAdmin(admin.ModelAdmin):
 
 
 @admin.register(TransactionModel)
-class TransactionAdmin(admin.ModelAdmin):
+class TransactionAdmin(CardNumberSearchMixin, admin.ModelAdmin):
     form = TransactionAdminForm
 
     list_display = ("id", "operation_type", "to_card", "amount", "balance_after", "timestamp")
     readonly_fields = ("timestamp", "operation_type", "balance_after")
     search_fields = ("from_card", "to_card")
+    date_hierarchy = "timestamp"
+    # порядок индекса tx_timestamp_id_idx; число строк — оценкой, без второго COUNT(*) по всей таблице
+    ordering = ("-timestamp", "-id")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     exclude = ("image_withdraw", "from_card", "to_user")
 
     fields = (
@@ -63,6 +183,109 @@ class TransactionAdmin(admin.ModelAdmin):
             "all": ("https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css",)
         }
 
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return IndexedDatesQuerySet(model=self.model, query=queryset.query, using=queryset._db)
+
+    def get_urls(self):
+        urls = [
+            path(
+                "card-autocomplete/",
+                self.admin_site.admin_view(self.card_autocomplete_view),
+                name="bank_accounts_transactionmodel_card_autocomplete",
+            ),
+            path(
+                "bulk-add/",
+                self.admin_site.admin_view(self.bulk_add_view),
+                name="bank_accounts_transactionmodel_bulk_add",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def bulk_add_view(self, request):
+        """
+        Пакетный ввод: до BULK_ADD_MAX_ROWS строк (карта, сумма, комментарий) с общими
+        банком, инициатором и изображением за одну отправку формы. Сначала проверяются
+        все строки, затем балансы и вставка идут одной транзакцией (post_transactions_bulk);
+        если хоть одна строка не проходит, не сохраняется ничего.
+        """
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+
+        try:
+            rows = min(max(int(request.GET.get("rows", BULK_ADD_DEFAULT_ROWS)), 1), BULK_ADD_MAX_ROWS)
+        except ValueError:
+            rows = BULK_ADD_DEFAULT_ROWS
+        formset_class = bulk_transaction_formset(rows)
+
+        if request.method == "POST":
+            defaults_form = BulkTransactionDefaultsForm(request.POST, request.FILES)
+            formset = formset_class(request.POST, prefix="rows")
+            if defaults_form.is_valid() and formset.is_valid():
+                created = self._bulk_post(defaults_form, formset.filled_forms())
+                if created is not None:
+                    self.message_user(request, f"Добавлено транзакций: {len(created)}.", messages.SUCCESS)
+                    return HttpResponseRedirect(reverse("admin:bank_accounts_transactionmodel_changelist"))
+        else:
+            defaults_form = BulkTransactionDefaultsForm()
+            formset = formset_class(prefix="rows")
+
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Пакетное добавление транзакций",
+            "defaults_form": defaults_form,
+            "formset": formset,
+            "more_rows": min(rows + 10, BULK_ADD_MAX_ROWS),
+            "media": self.media + defaults_form.media + formset.media,
+            "has_view_permission": self.has_view_permission(request),
+        }
+        return TemplateResponse(request, "admin/bank_accounts/transactionmodel/bulk_add.html", context)
+
+    def _bulk_post(self, defaults_form, forms):
+        """
+        Проводит строки пакета; при отказе хотя бы по одной откатывает весь пакет
+        и возвращает None, а ошибки показывает у строк.
+        """
+        defaults = {
+            "bank": defaults_form.cleaned_data["bank"],
+            "cardholder_name": defaults_form.cleaned_data["cardholder_name"],
+            "image_deposit": defaults_form.save_image(),
+        }
+        transactions = [TransactionModel(**defaults, **form.cleaned_data) for form in forms]
+        with transaction.atomic():
+            created, rejected = post_transactions_bulk(transactions)
+            if rejected:
+                transaction.set_rollback(True)
+                for position, message in rejected.items():
+                    forms[position].add_error("amount", message)
+                return None
+        return created
+
+    def card_autocomplete_view(self, request):
+        """
+        Подсказки номеров карт по префиксу: диапазон по индексу card_number,
+        не больше CARD_AUTOCOMPLETE_LIMIT строк, горячие префиксы — из кэша.
+        """
+        if not (self.has_add_permission(request) or self.has_change_permission(request)):
+            raise PermissionDenied
+
+        prefix = request.GET.get("q", "").strip()
+        if not prefix.isdigit() or len(prefix) > 16:
+            return JsonResponse({"results": []})
+
+        def load():
+            cards = filter_card_prefix(CardAccountModel.objects.all(), "card_number", prefix)
+            rows = cards.order_by("card_number").values_list(
+                "card_number", "user__username", "balance"
+            )[:CARD_AUTOCOMPLETE_LIMIT]
+            return [
+                {"card_number": number, "label": f"{username} (₴{balance})"}
+                for number, username, balance in rows
+            ]
+
+        return JsonResponse({"results": get_card_suggestions(prefix, load)})
+
     def get_fields(self, request, obj=None):
         fields = super().get_fields(request, obj)
         if "image_deposit_choice" not in fields:
@@ -87,34 +310,12 @@ class TransactionAdmin(admin.ModelAdmin):
             if obj.amount <= 0:
                 raise ValidationError("Сумма должна быть больше 0.")
 
-            # если нашли карту получателя → пополнение
-            to_card = CardAccountModel.objects.filter(card_number=obj.to_card).first()
-            from_card = CardAccountModel.objects.filter(card_number=obj.from_card).first()
-
-            if to_card and not from_card:
-                obj.operation_type = "deposit"
-                to_card.balance += obj.amount
-                to_card.save()
-
-            elif from_card and not to_card:
-                if from_card.balance < obj.amount:
-                    raise ValidationError("Недостаточно средств для списания.")
-                obj.operation_type = "withdraw"
-                from_card.balance -= obj.amount
-                from_card.save()
-
-            elif from_card and to_card:
-                # внутренний перевод между своими картами
-                if from_card.balance < obj.amount:
-                    raise ValidationError("Недостаточно средств на карте отправителя.")
-                obj.operation_type = "external"  # можно переименовать в "transfer"
-                from_card.balance -= obj.amount
-                to_card.balance += obj.amount
-                from_card.save()
-                to_card.save()
-            else:
-                # если обе карты неизвестны системе
-                obj.operation_type = "external"
+            # баланс карт и сама транзакция пишутся атомарно
+            try:
+                post_transaction(obj)
+            except InsufficientFunds:
+                raise ValidationError("Недостаточно средств для списания.")
+            return
 
         super().save_model(request, obj, form, change)
 
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class BankAccountsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "bank_accounts"
+
+    def ready(self):
+        from bank_accounts import signals  # noqa: F401
+        from bank_accounts.db import configure_sqlite
+        from bank_accounts.metrics import record_queries
+
+        connection_created.connect(configure_sqlite, dispatch_uid="bank_accounts.configure_sqlite")
+        connection_created.connect(record_queries, dispatch_uid="bank_accounts.record_queries")
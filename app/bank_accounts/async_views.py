@@ -0,0 +1,151 @@
+"""
+Асинхронные версии горячих GET-эндпоинтов (карта по id и по номеру, транзакция, лента транзакций).
+
+Работают на async ORM и не занимают поток на время ожидания БД, поэтому под ASGI
+(uvicorn / daphne) один воркер обслуживает много медленных клиентов одновременно.
+Ответы совпадают с синхронными /api/... (включая ETag / Last-Modified и 304),
+кэш сериализованных карт, аутентификация и курсоры ленты — общие с синхронными представлениями.
+
+На SQLite каждый запрос async ORM всё равно выполняется в потоке, и под нагрузкой эти
+эндпоинты медленнее синхронных (manage.py benchmark http-load), поэтому основными
+остаются /api/...; выигрыш возможен с сетевой БД и большим числом медленных клиентов.
+"""
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework import exceptions, serializers
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+
+from bank_accounts import cache as card_cache
+from bank_accounts.authentication import CachedJWTAuthentication
+from bank_accounts.conditional import card_validators, transaction_validators
+from bank_accounts.filters import filter_transactions, parse_as_of
+from bank_accounts.models import CardAccountModel, TransactionModel
+from bank_accounts.pagination import TransactionCursorPagination
+from bank_accounts.serializers import (
+    CardAccountSerializer,
+    TransactionRowSerializer,
+    TransactionSerializer,
+    aload_transactions_preview,
+)
+from bank_accounts.services import balances_as_of
+from bank_accounts.views import card_representation_variant, parse_transactions_preview_limit
+
+_jwt = CachedJWTAuthentication()
+
+
+def _json(data, status=200):
+    # тот же энкодер, что у DRF: Decimal, datetime и т. п. сериализуются одинаково
+    return JsonResponse(data, status=status, encoder=JSONEncoder, safe=False)
+
+
+def _error(exc):
+    # как exception_handler DRF: списки и словари (ошибки валидации, simplejwt) — без обёртки detail
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {"detail": exc.detail}
+    response = _json(data, status=exc.status_code)
+    if exc.status_code == 401:
+        response["WWW-Authenticate"] = _jwt.authenticate_header(None)
+    return response
+
+
+async def authenticate(request):
+    """
+    Та же CachedJWTAuthentication, что у синхронных представлений: подпись и срок токена
+    проверяет simplejwt, пользователь — из кэша процесса, при промахе из БД (поэтому в потоке).
+    Возвращает пользователя или бросает AuthenticationFailed / NotAuthenticated.
+    """
+    result = await sync_to_async(_jwt.authenticate)(request)
+    if result is None:
+        raise exceptions.NotAuthenticated()
+    return result[0]
+
+
+async def _card_response(request, **lookup):
+    limit = parse_transactions_preview_limit(request.GET.get("transactions"))
+    as_of = parse_as_of(request.GET)
+    variant = card_representation_variant(limit, as_of)
+    card = await CardAccountModel.objects.values("pk", "version", "updated_at", "user_id").aget(**lookup)
+    validators = card_validators(card, f"-{variant}")
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+
+    async def load():
+        instance = await CardAccountModel.objects.select_related("user").aget(pk=card["pk"])
+        context = {"request": request}
+        if limit:
+            context["transactions_preview"] = await aload_transactions_preview(
+                [instance.card_number], limit, until=as_of
+            )
+        if as_of:
+            context["as_of"] = as_of
+            context["balances_as_of"] = await sync_to_async(balances_as_of)([instance], as_of)
+        return CardAccountSerializer(instance, context=context).data
+
+    payload = await card_cache.aget_card_payload(card, variant, load)
+    return validators.apply(_json(payload))
+
+
+@require_GET
+async def card_detail(request, pk):
+    try:
+        user = await authenticate(request)
+        return await _card_response(request, pk=pk, user=user)
+    except exceptions.APIException as exc:
+        return _error(exc)
+    except CardAccountModel.DoesNotExist:
+        return _error(exceptions.NotFound())
+
+
+@require_GET
+async def card_by_number(request):
+    try:
+        await authenticate(request)
+    except exceptions.APIException as exc:
+        return _error(exc)
+
+    card_number = request.GET.get("card_number")
+    if not card_number:
+        return _json({"detail": "Номер карты не передан."}, status=400)
+    try:
+        return await _card_response(request, card_number=card_number)
+    except exceptions.APIException as exc:
+        return _error(exc)
+    except CardAccountModel.DoesNotExist:
+        return _json({"detail": "Карта не найдена."}, status=404)
+
+
+@require_GET
+async def transaction_detail(request, pk):
+    try:
+        tx = await TransactionModel.objects.aget(pk=pk)
+    except TransactionModel.DoesNotExist:
+        return _error(exceptions.NotFound())
+    validators = transaction_validators(tx.pk, tx.updated_at)
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+    return validators.apply(_json(TransactionSerializer(tx, context={"request": request}).data))
+
+
+@require_GET
+async def transaction_list(request):
+    """
+    Лента транзакций с теми же фильтрами и курсорами, что /api/transactions/
+    (TransactionCursorPagination): курсор одного эндпоинта подходит и другому.
+    """
+    drf_request = Request(request)
+    paginator = TransactionCursorPagination()
+    try:
+        queryset = filter_transactions(TransactionModel.objects.all(), request.GET)
+        queryset = queryset.values(*TransactionRowSerializer.source_fields())
+        # пагинатор DRF синхронный — страница читается в потоке
+        page = await sync_to_async(paginator.paginate_queryset)(queryset, drf_request)
+    except serializers.ValidationError as exc:
+        return _json(exc.detail, status=400)
+    except exceptions.APIException as exc:
+        return _error(exc)
+
+    data = TransactionRowSerializer(page, context={"request": drf_request}).data
+    return _json(paginator.get_paginated_response(data).data)
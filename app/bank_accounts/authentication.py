@@ -0,0 +1,123 @@
+"""
+JWT-аутентификация с кэшем пользователей в памяти процесса.
+
+simplejwt читает пользователя из БД на каждый запрос; при частом опросе балансов это
+заметная доля нагрузки на БД. Здесь подпись и срок токена проверяются как обычно,
+а пользователь берётся из кэша на JWT_USER_CACHE_TIMEOUT секунд (при промахе — из БД).
+
+Сохранение или удаление пользователя (деактивация, смена пароля) сразу сбрасывает
+его запись в этом процессе (bank_accounts.signals); в других воркерах запись живёт
+не дольше TTL. Изменения в обход сигналов (QuerySet.update) тоже видны не позже TTL.
+"""
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+_lock = threading.Lock()
+_users = {}
+_stats = {"hits": 0, "misses": 0}
+# растёт при каждой инвалидации: пользователь, прочитанный из БД до неё, в кэш не попадёт
+_generation = 0
+
+
+def _timeout():
+    return getattr(settings, "JWT_USER_CACHE_TIMEOUT", 30)
+
+
+def _max_size():
+    return getattr(settings, "JWT_USER_CACHE_SIZE", 10000)
+
+
+def cache_stats():
+    with _lock:
+        return dict(_stats, size=len(_users))
+
+
+def cache_generation():
+    return _generation
+
+
+def cached_user(user_id):
+    """
+    Копия пользователя из кэша или None. Копия — чтобы запросы не делили один объект.
+    """
+    now = time.monotonic()
+    with _lock:
+        entry = _users.get(str(user_id))
+        if entry is not None and entry[0] > now:
+            _stats["hits"] += 1
+            return copy.copy(entry[1])
+        _stats["misses"] += 1
+    return None
+
+
+def remember_user(user_id, user, generation):
+    """
+    Кладёт прочитанного из БД пользователя в кэш, если с момента чтения
+    (generation = cache_generation() до запроса) не было инвалидаций.
+    """
+    now = time.monotonic()
+    with _lock:
+        if generation != _generation:
+            return
+        if len(_users) >= _max_size():
+            for key in [key for key, (expires, _user) in _users.items() if expires <= now]:
+                del _users[key]
+            if len(_users) >= _max_size():
+                _users.clear()
+        _users[str(user_id)] = (now + _timeout(), copy.copy(user))
+
+
+def invalidate_user(user_id):
+    global _generation
+    with _lock:
+        _generation += 1
+        _users.pop(str(user_id), None)
+
+
+def clear_user_cache():
+    global _generation
+    with _lock:
+        _generation += 1
+        _users.clear()
+        _stats.update(hits=0, misses=0)
+
+
+def token_user_id(validated_token):
+    try:
+        return validated_token[jwt_settings.USER_ID_CLAIM]
+    except KeyError as e:
+        raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+
+def check_user(user, validated_token):
+    """
+    Те же проверки, что в JWTAuthentication.get_user; выполняются и для пользователя из кэша.
+    """
+    if jwt_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+        raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+    if jwt_settings.CHECK_REVOKE_TOKEN:
+        if validated_token.get(jwt_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        user_id = token_user_id(validated_token)
+        user = cached_user(user_id)
+        if user is None:
+            generation = cache_generation()
+            try:
+                user = self.user_model.objects.get(**{jwt_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist as e:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+            remember_user(user_id, user, generation)
+        check_user(user, validated_token)
+        return user
@@ -0,0 +1,271 @@
+"""
+Вспомогательные функции для management-команды benchmark.
+Всё выполняется на отдельной тестовой БД, рабочие данные не затрагиваются.
+"""
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import close_old_connections, connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from bank_accounts.models import CardAccountModel, CardLedgerEntry, TransactionModel
+
+BANKS = ("mono", "privat", "oschad", "raiff", "pumb", "abank", "izibank", "sense", "ukrsib", "others")
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, math.ceil(len(ordered) * pct / 100) - 1)
+    return ordered[index]
+
+
+def summarize(samples):
+    """
+    Сводка по замерам в миллисекундах.
+    """
+    total = sum(samples)
+    return {
+        "requests": len(samples),
+        "rps": round(len(samples) / total, 1) if total else 0.0,
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+def measure(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+@contextmanager
+def test_database(keepdb=False, verbosity=0):
+    """
+    Создаёт тестовую БД на время замера и удаляет её после.
+    SQLite в памяти не подходит для многопоточных сценариев — берём временный файл.
+    """
+    setup_test_environment()
+    test_settings = connection.settings_dict.setdefault("TEST", {})
+    if connection.vendor == "sqlite" and not test_settings.get("NAME"):
+        test_settings["NAME"] = os.path.join(tempfile.gettempdir(), "bank_accounts_benchmark.sqlite3")
+    old_name = connection.creation.create_test_db(verbosity=verbosity, keepdb=keepdb)
+    test_name = connection.settings_dict["NAME"]
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity, keepdb=keepdb)
+        if connection.vendor == "sqlite" and not keepdb:
+            # журнал WAL и разделяемая память остаются рядом с файлом БД
+            for suffix in ("-wal", "-shm"):
+                if os.path.exists(f"{test_name}{suffix}"):
+                    os.remove(f"{test_name}{suffix}")
+        teardown_test_environment()
+
+
+@contextmanager
+def manual_timestamps():
+    """
+    bulk_create с auto_now_add ставит всем строкам "сейчас";
+    для реалистичной истории временно отключаем автозаполнение.
+    """
+    field = TransactionModel._meta.get_field("timestamp")
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def api_client():
+    """
+    Клиент Django с JWT-токеном пользователя benchmark.
+    """
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    user, _ = User.objects.get_or_create(username="benchmark")
+    return Client(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+
+
+def seed_cards(count, balance=Decimal("1000000.00")):
+    user, _ = User.objects.get_or_create(username="benchmark")
+    existing = CardAccountModel.objects.count()
+    CardAccountModel.objects.bulk_create(
+        CardAccountModel(
+            user=user,
+            card_number=f"4{index:015d}",
+            expiration_date=date.today() + timedelta(days=365 * 3),
+            cvv="123",
+            balance=balance,
+        )
+        for index in range(existing, count)
+    )
+    return list(CardAccountModel.objects.order_by("id").values_list("card_number", flat=True)[:count])
+
+
+def seed_transactions(total, card_numbers, batch_size=5000, rng=None):
+    """
+    Доводит количество транзакций до total. Время идёт вперёд с шагом в секунду.
+    """
+    rng = rng or random.Random(42)
+    existing = TransactionModel.objects.count()
+    started = timezone.now() - timedelta(seconds=total)
+    with manual_timestamps():
+        for offset in range(existing, total, batch_size):
+            batch = []
+            for index in range(offset, min(offset + batch_size, total)):
+                card = rng.choice(card_numbers)
+                deposit = rng.random() < 0.6
+                batch.append(TransactionModel(
+                    to_card=card if deposit else f"5{index:015d}",
+                    from_card=None if deposit else card,
+                    amount=Decimal(rng.randint(100, 100000)) / 100,
+                    bank=rng.choice(BANKS),
+                    operation_type="deposit" if deposit else "withdraw",
+                    timestamp=started + timedelta(seconds=index),
+                ))
+            TransactionModel.objects.bulk_create(batch)
+            CardLedgerEntry.objects.bulk_create(
+                entry for tx in batch for entry in tx.build_ledger_entries({})
+            )
+
+
+def run_threads(worker, threads, per_thread):
+    """
+    Запускает worker(thread_index, iteration) в нескольких потоках,
+    возвращает (время, количество ошибок). У каждого потока своё соединение с БД.
+    """
+    errors = []
+
+    def target(thread_index):
+        try:
+            for iteration in range(per_thread):
+                try:
+                    worker(thread_index, iteration)
+                except Exception as exc:  # noqa: BLE001 — считаем любые сбои записи
+                    errors.append(exc)
+        finally:
+            close_old_connections()
+            connection.close()
+
+    pool = [threading.Thread(target=target, args=(index,)) for index in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return time.perf_counter() - started, errors
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def serve(argv, port, startup_timeout=30):
+    """
+    Запускает HTTP-сервер (gunicorn и т. п.) на тестовой БД и ждёт, пока он начнёт принимать соединения.
+    """
+    env = dict(os.environ, DATABASE_NAME=str(connection.settings_dict["NAME"]))
+    process = subprocess.Popen(
+        [sys.executable, "-m", *argv],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"{argv[0]} завершился с кодом {process.returncode}")
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{argv[0]} не запустился за {startup_timeout} с")
+                time.sleep(0.1)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def http_request(url, headers=None, body=None, method="GET"):
+    """
+    HTTP-запрос без сторонних клиентов; возвращает код ответа.
+    """
+    request = urllib.request.Request(url, data=body, headers=headers or {}, method=method)
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as exc:
+        return exc.code
+
+
+# поля, по которым строки результатов сопоставляются с прошлым запуском
+RESULT_KEY_FIELDS = ("rows", "target", "path", "mode", "server", "profile", "operation")
+# метрики и направление: True — чем больше, тем лучше
+RESULT_METRICS = {
+    "rps": True,
+    "tx_per_sec": True,
+    "rows_per_sec": True,
+    "reads_per_sec": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "queries": False,
+}
+
+
+def result_key(row):
+    return tuple((field, row[field]) for field in RESULT_KEY_FIELDS if field in row)
+
+
+def find_regressions(results, baseline, threshold_pct):
+    """
+    Сравнивает результаты с прошлым запуском (те же сценарий и ключевые поля строк).
+    Возвращает строки-описания метрик, ухудшившихся больше чем на threshold_pct процентов.
+    """
+    previous = {result_key(row): row for row in baseline}
+    regressions = []
+    for row in results:
+        before = previous.get(result_key(row))
+        if before is None:
+            continue
+        for metric, higher_is_better in RESULT_METRICS.items():
+            old, new = before.get(metric), row.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            if (-change if higher_is_better else change) > threshold_pct:
+                label = ", ".join(f"{field}={value}" for field, value in result_key(row))
+                regressions.append(f"{label}: {metric} {old} -> {new} ({change:+.1f}%)")
+    return regressions
@@ -0,0 +1,86 @@
+"""
+Кэш сериализованных карт (read-through), ключ — версия карты из БД.
+
+Ключ данных включает version и updated_at строки карты (их же читает проверка ETag),
+поэтому любое изменение карты в любом воркере сразу меняет ключ — старые записи просто
+перестают читаться и вытесняются по таймауту. Отдельной инвалидации не требуется.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def _cache():
+    return caches[getattr(settings, "CARD_CACHE_ALIAS", "default")]
+
+
+def _timeout():
+    return getattr(settings, "CARD_CACHE_TIMEOUT", 300)
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def cache_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def payload_key(card, variant):
+    """
+    card — словарь с pk, version и updated_at (values() из запроса для ETag).
+    """
+    return f"bank_accounts:card:{card['pk']}:v{card['version']}-{card['updated_at'].timestamp()}:{variant}"
+
+
+def get_card_payload(card, variant, loader):
+    """
+    Данные карты из кэша; при промахе вызывает loader() и кэширует результат.
+    variant различает представления одной карты (например, с превью транзакций).
+    """
+    cache = _cache()
+    key = payload_key(card, variant)
+    payload = cache.get(key)
+    if payload is not None:
+        _count("hits")
+        return payload
+
+    _count("misses")
+    payload = dict(loader())
+    cache.set(key, payload, _timeout())
+    return payload
+
+
+async def aget_card_payload(card, variant, loader):
+    """
+    То же для асинхронных представлений: loader — корутинная функция.
+    """
+    cache = _cache()
+    key = payload_key(card, variant)
+    payload = await cache.aget(key)
+    if payload is not None:
+        _count("hits")
+        return payload
+
+    _count("misses")
+    payload = dict(await loader())
+    await cache.aset(key, payload, _timeout())
+    return payload
+
+
+def get_card_suggestions(prefix, loader):
+    """
+    Подсказки номеров карт для автодополнения: горячие префиксы отдаются из кэша
+    (балансы в подписях могут отставать на CARD_AUTOCOMPLETE_CACHE_TIMEOUT секунд).
+    """
+    return _cache().get_or_set(
+        f"bank_accounts:card-suggestions:{prefix}",
+        loader,
+        getattr(settings, "CARD_AUTOCOMPLETE_CACHE_TIMEOUT", 30),
+    )
@@ -0,0 +1,37 @@
+"""
+Условные GET (ETag / Last-Modified) без сериализации ответа.
+"""
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+class Validators:
+    def __init__(self, etag, last_modified):
+        self.etag = etag
+        self.last_modified = int(last_modified.timestamp())
+
+    def not_modified(self, request):
+        """
+        304 (или 412), если копия клиента актуальна; иначе None.
+        """
+        return get_conditional_response(request, etag=self.etag, last_modified=self.last_modified)
+
+    def apply(self, response):
+        response["ETag"] = self.etag
+        response["Last-Modified"] = http_date(self.last_modified)
+        # данные персональные: кэшировать только у клиента и всегда перепроверять
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+def card_validators(card, variant=""):
+    """
+    card — объект или словарь с pk, version и updated_at.
+    """
+    get = card.get if isinstance(card, dict) else lambda name: getattr(card, name)
+    etag = f'"card-{get("pk")}-{get("version")}-{get("updated_at").timestamp()}{variant}"'
+    return Validators(etag, get("updated_at"))
+
+
+def transaction_validators(pk, updated_at):
+    return Validators(f'"transaction-{pk}-{updated_at.timestamp()}"', updated_at)
@@ -0,0 +1,40 @@
+"""
+Настройка соединений с БД под профиль из settings.DATABASE_PROFILE и оценки по статистике БД.
+"""
+from django.conf import settings
+from django.db import connections
+
+
+def sqlite_pragmas(pragmas):
+    return [f"PRAGMA {name} = {value}" for name, value in pragmas.items()]
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    connection_created: выполняет settings.SQLITE_PRAGMAS на каждом новом соединении SQLite.
+    """
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for statement in sqlite_pragmas(getattr(settings, "SQLITE_PRAGMAS", {})):
+            cursor.execute(statement)
+
+
+def estimate_row_count(model, using="default"):
+    """
+    Примерное число строк таблицы без COUNT(*). PostgreSQL — reltuples из статистики
+    планировщика (обновляется autovacuum / ANALYZE), SQLite — наибольший rowid
+    (точно, пока строки не удаляли). None — оценки нет.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+            row = cursor.fetchone()
+            # -1 — таблицу ещё ни разу не анализировали
+            return row[0] if row and row[0] >= 0 else None
+        if connection.vendor == "sqlite":
+            cursor.execute(f"SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}")
+            return cursor.fetchone()[0] or 0
+    return None
@@ -0,0 +1,177 @@
+"""
+Документация API: схемы OpenAPI из памяти процесса, Swagger UI и ReDoc.
+
+Схема не строится на каждый запрос: она читается из API_SCHEMA_DIR (файлы пишет
+manage.py build_api_schemas при сборке или деплое), а без каталога строится при первом
+запросе, и дальше ответ отдаётся из памяти. У ответа ETag (sha256 содержимого),
+на If-None-Match — 304. Cache-Control по умолчанию no-cache: кэш переспрашивает схему
+по ETag на каждый запрос и не отдаёт старую после деплоя; API_SCHEMA_MAX_AGE > 0 разрешает
+отдавать её без проверки столько секунд.
+
+Модуль лёгкий. Генераторы и представления drf-yasg / drf-spectacular (bank_accounts.schemas)
+импортируются при первом обращении к документации, поэтому воркеры, которые обслуживают
+только API, их не загружают.
+"""
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.views.decorators.http import require_GET
+
+# имя файла в API_SCHEMA_DIR: (генератор, формат)
+SCHEMAS = {
+    "openapi.yaml": ("spectacular", "yaml"),
+    "openapi.json": ("spectacular", "json"),
+    "swagger.json": ("yasg", "json"),
+    "swagger.yaml": ("yasg", "yaml"),
+}
+
+_lock = threading.Lock()
+_schemas = {}
+
+
+class Schema:
+    __slots__ = ("content", "etag")
+
+    def __init__(self, content):
+        self.content = content
+        self.etag = f'"{hashlib.sha256(content).hexdigest()}"'
+
+
+def _schema_dir():
+    return getattr(settings, "API_SCHEMA_DIR", None)
+
+
+def _max_age():
+    return getattr(settings, "API_SCHEMA_MAX_AGE", 0)
+
+
+def render_schema(name):
+    from bank_accounts import schemas
+
+    generator, fmt = SCHEMAS[name]
+    render = schemas.render_spectacular if generator == "spectacular" else schemas.render_yasg
+    return render(fmt)
+
+
+def _read_schema(name):
+    directory = _schema_dir()
+    if not directory:
+        return None
+    try:
+        with open(os.path.join(directory, name), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def get_schema(name):
+    schema = _schemas.get(name)
+    if schema is None:
+        with _lock:
+            schema = _schemas.get(name)
+            if schema is None:
+                content = _read_schema(name)
+                if content is None:
+                    content = render_schema(name)
+                schema = _schemas[name] = Schema(content)
+    return schema
+
+
+def reset_schemas():
+    with _lock:
+        _schemas.clear()
+
+
+def build_schemas(directory):
+    """
+    Строит все схемы и записывает их в directory (через временный файл, чтобы воркеры
+    не прочитали недописанную). Возвращает {имя файла: размер в байтах}.
+    """
+    os.makedirs(directory, exist_ok=True)
+    sizes = {}
+    for name in SCHEMAS:
+        content = render_schema(name)
+        path = os.path.join(directory, name)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(content)
+        os.replace(f"{path}.tmp", path)
+        sizes[name] = len(content)
+    reset_schemas()
+    return sizes
+
+
+def _schema_response(request, name, content_type):
+    schema = get_schema(name)
+    response = get_conditional_response(request, etag=schema.etag)
+    if response is None:
+        response = HttpResponse(schema.content, content_type=content_type)
+    response["ETag"] = schema.etag
+    max_age = _max_age()
+    if max_age:
+        patch_cache_control(response, public=True, max_age=max_age)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+@require_GET
+def openapi_schema(request):
+    """
+    Схема drf-spectacular: YAML по умолчанию, JSON — по ?format=json или по Accept,
+    с теми же Content-Type, что у SpectacularAPIView.
+    """
+    fmt = request.GET.get("format")
+    if fmt == "json":
+        response = _schema_response(request, "openapi.json", "application/vnd.oai.openapi+json")
+    elif fmt is None and "json" in request.headers.get("Accept", ""):
+        response = _schema_response(request, "openapi.json", "application/json")
+    else:
+        response = _schema_response(request, "openapi.yaml", "application/vnd.oai.openapi; charset=utf-8")
+    patch_vary_headers(response, ["Accept"])
+    return response
+
+
+@require_GET
+def swagger_schema(request, format):
+    """
+    Схема drf-yasg (Swagger 2.0): /swagger.json и /swagger.yaml.
+    """
+    if format == ".json":
+        return _schema_response(request, "swagger.json", "application/json; charset=utf-8")
+    return _schema_response(request, "swagger.yaml", "application/yaml; charset=utf-8")
+
+
+def lazy_view(factory):
+    """
+    Представление, которое создаётся factory() при первом запросе, а не при загрузке URLconf.
+    """
+    view = None
+
+    def wrapper(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            view = factory()
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def _yasg_ui(renderer):
+    from bank_accounts.schemas import schema_view
+
+    return schema_view.with_ui(renderer, cache_timeout=0)
+
+
+def _spectacular_ui():
+    from drf_spectacular.views import SpectacularSwaggerView
+
+    return SpectacularSwaggerView.as_view(url_name="api-schema")
+
+
+swagger_ui = lazy_view(lambda: _yasg_ui("swagger"))
+redoc_ui = lazy_view(lambda: _yasg_ui("redoc"))
+spectacular_ui = lazy_view(_spectacular_ui)
@@ -0,0 +1,140 @@
+from datetime import datetime, time, timedelta
+from django.db import models
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import serializers
+
+from bank_accounts.models import SUMMARY_PERIODS
+
+OPERATION_TYPES = ("deposit", "withdraw", "external")
+
+
+def _plain_date(value):
+    """
+    Дата без времени или None. parse_datetime здесь не подходит: на Python 3.11+
+    он принимает и "YYYY-MM-DD" (как полночь).
+    """
+    try:
+        return parse_date(value)
+    except ValueError:
+        return None
+
+
+def _parse_moment(value, param, end_of_day=False):
+    """
+    Принимает дату (YYYY-MM-DD) или дату-время в ISO 8601.
+    Для даты в date_to берём начало следующего дня, чтобы граница была включительной.
+    """
+    day = _plain_date(value)
+    if day is not None:
+        if end_of_day:
+            day += timedelta(days=1)
+        moment = datetime.combine(day, time.min)
+    else:
+        try:
+            moment = parse_datetime(value)
+        except ValueError:
+            moment = None
+        if moment is None:
+            raise serializers.ValidationError({param: "Неверный формат даты."})
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def parse_as_of(params):
+    """
+    ?as_of= для исторического баланса: дата-время, или дата — тогда на конец этого дня.
+    """
+    value = params.get("as_of")
+    if not value:
+        return None
+    if _plain_date(value) is not None:
+        return _parse_moment(value, "as_of", end_of_day=True) - timedelta(microseconds=1)
+    return _parse_moment(value, "as_of")
+
+
+def card_prefix_range(prefix):
+    """
+    Префикс номера карты как диапазон [prefix, upper) — поиск идёт по индексу card_number
+    в любой БД (LIKE 'x%' в SQLite индекс не использует). Для цифровых префиксов
+    upper — тот же префикс плюс единица; если разряд переполнился, верхней границы нет.
+    """
+    upper = str(int(prefix) + 1).zfill(len(prefix))
+    return prefix, upper if len(upper) == len(prefix) else None
+
+
+def card_prefix_q(field, prefix):
+    lower, upper = card_prefix_range(prefix)
+    condition = models.Q(**{f"{field}__gte": lower})
+    if upper is not None:
+        condition &= models.Q(**{f"{field}__lt": upper})
+    return condition
+
+
+def filter_card_prefix(queryset, field, prefix):
+    return queryset.filter(card_prefix_q(field, prefix))
+
+
+def filter_transactions(queryset, params):
+    """
+    Фильтры списка транзакций: card_number, operation_type, bank, date_from, date_to.
+    Каждый фильтр попадает в индекс из TransactionModel.Meta.indexes.
+    """
+    card_number = params.get("card_number")
+    if card_number:
+        queryset = queryset.filter(models.Q(from_card=card_number) | models.Q(to_card=card_number))
+
+    operation_type = params.get("operation_type")
+    if operation_type:
+        if operation_type not in OPERATION_TYPES:
+            raise serializers.ValidationError({"operation_type": "Неизвестный тип операции."})
+        queryset = queryset.filter(operation_type=operation_type)
+
+    bank = params.get("bank")
+    if bank:
+        queryset = queryset.filter(bank=bank)
+
+    date_from = params.get("date_from")
+    if date_from:
+        queryset = queryset.filter(timestamp__gte=_parse_moment(date_from, "date_from"))
+
+    date_to = params.get("date_to")
+    if date_to:
+        if _plain_date(date_to) is not None:
+            queryset = queryset.filter(timestamp__lt=_parse_moment(date_to, "date_to", end_of_day=True))
+        else:
+            queryset = queryset.filter(timestamp__lte=_parse_moment(date_to, "date_to"))
+
+    return queryset
+
+
+def _parse_day(value, param):
+    day = parse_date(value)
+    if day is None:
+        raise serializers.ValidationError({param: "Неверный формат даты, ожидается YYYY-MM-DD."})
+    return day
+
+
+def filter_card_summaries(queryset, params):
+    """
+    Сводки одной карты: period (day / month, по умолчанию month), date_from, date_to включительно.
+    Для месяцев границы округляются до начала месяца. Возвращает (queryset, period).
+    """
+    period = params.get("period") or "month"
+    if period not in SUMMARY_PERIODS:
+        raise serializers.ValidationError({"period": "Период: day или month."})
+    queryset = queryset.filter(period=period)
+
+    date_from = params.get("date_from")
+    if date_from:
+        start = _parse_day(date_from, "date_from")
+        if period == "month":
+            start = start.replace(day=1)
+        queryset = queryset.filter(period_start__gte=start)
+
+    date_to = params.get("date_to")
+    if date_to:
+        queryset = queryset.filter(period_start__lte=_parse_day(date_to, "date_to"))
+
+    return queryset.order_by("period_start"), period
@@ -1,19 +1,13 @@
 # forms.py
-import re
-import os
 from django import forms
 from django.utils.safestring import mark_safe
-from bank_accounts.models import TransactionModel, CardAccountModel
+from bank_accounts.images import sample_images
+from bank_accounts.models import TransactionModel
 from django.conf import settings
+from django.urls import reverse
 import math
 import random
 
-# функция для натуральной сортировки
-
-
-def natural_sort_key(s):
-    return [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', s)]
-
 
 class ImageSelectWidget(forms.RadioSelect):
     """
@@ -22,14 +16,19 @@ class ImageSelectWidget(forms.RadioSelect):
 
     def render(self, name, value, attrs=None, renderer=None):
         output = ['<div style="display:flex; flex-wrap:wrap; gap:5px;">']
+        thumbnails = sample_images.thumbnails()
         for opt_value, _ in self.choices:
             if not opt_value:
                 continue
             checked = 'checked' if str(value) == str(opt_value) else ''
+            # миниатюры 60px и 120px (retina) вместо оригинала; если их нет — оригинал
+            thumbs = thumbnails.get(opt_value, {})
+            src = thumbs.get(60, opt_value)
+            srcset = f'srcset="{src} 1x, {thumbs[120]} 2x"' if 120 in thumbs else ''
             output.append(f'''
                 <label style="cursor:pointer;">
                     <input type="radio" name="{name}" value="{opt_value}" {checked} style="display:none;">
-                    <img src="{opt_value}" width="60" height="60"
+                    <img src="{src}" {srcset} width="60" height="60" loading="lazy" decoding="async"
                          style="object-fit:cover; border:1px solid #ccc; border-radius:4px; transition:border 0.2s;">
                 </label>
             ''')
@@ -56,27 +55,52 @@ class CardNumberDatalistWidget(forms.TextInput):
     """
     Рендерит <input> + <datalist> внутри одного виджета.
     Никакой обязательной связи с БД: поле остаётся CharField (ввод вручную разрешён).
+    Варианты подгружаются по мере ввода из autocomplete_url (поиск по префиксу номера).
     """
 
-    def __init__(self, queryset=None, *args, **kwargs):
+    def __init__(self, autocomplete_url=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.qs = queryset or CardAccountModel.objects.none()
+        self.autocomplete_url = autocomplete_url
 
     def render(self, name, value, attrs=None, renderer=None):
         attrs = attrs or {}
         list_id = attrs.get("list") or f"{name}_datalist"
         attrs["list"] = list_id  # связываем <input list="..."> с <datalist id="...">
+        attrs.setdefault("autocomplete", "off")
         input_html = super().render(name, value, attrs, renderer)
+        datalist_html = f'<datalist id="{list_id}"></datalist>'
+        if not self.autocomplete_url:
+            return mark_safe(input_html + datalist_html)
 
-        # Ограничим, например, до 1000 карт, чтобы не раздуть страницу
-        options = []
-        for c in self.qs[:1000]:
-            # Показываем номер + владельца + баланс (можешь изменить формат)
-            options.append(
-                f'<option value="{c.card_number}">{c.user.username} (₴{c.balance})</option>'
-            )
-        datalist_html = f'<datalist id="{list_id}">{"".join(options)}</datalist>'
-        return mark_safe(input_html + datalist_html)
+        # запрос уходит после паузы в наборе; повторный префикс не запрашиваем
+        script = f"""
+        <script>
+        (function(){{
+            const input = document.querySelector('input[list="{list_id}"]');
+            const datalist = document.getElementById("{list_id}");
+            let timer = null, lastPrefix = null;
+            input.addEventListener("input", function(){{
+                clearTimeout(timer);
+                timer = setTimeout(function(){{
+                    const prefix = input.value.replace(/\\D/g, "");
+                    if (!prefix || prefix === lastPrefix) return;
+                    lastPrefix = prefix;
+                    fetch("{self.autocomplete_url}?q=" + encodeURIComponent(prefix), {{credentials: "same-origin"}})
+                        .then(r => r.json())
+                        .then(data => {{
+                            datalist.replaceChildren(...data.results.map(item => {{
+                                const option = document.createElement("option");
+                                option.value = item.card_number;
+                                option.textContent = item.label;
+                                return option;
+                            }}));
+                        }});
+                }}, 250);
+            }});
+        }})();
+        </script>
+        """
+        return mark_safe(input_html + datalist_html + script)
 
 
 class AnyChoiceField(forms.ChoiceField):
@@ -102,19 +126,14 @@ class TransactionAdminForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         choices = []
 
-        # --- datalist для выбора карты ---
-        cards_qs = CardAccountModel.objects.select_related("user").all()
+        # --- datalist для выбора карты (подсказки подгружаются по префиксу) ---
         self.fields["to_card"].widget = CardNumberDatalistWidget(
-            queryset=cards_qs,
+            autocomplete_url=reverse("admin:bank_accounts_transactionmodel_card_autocomplete"),
             attrs={"class": "vTextField"},
         )
 
-        # локальные картинки
-        samples_path = os.path.join(settings.MEDIA_ROOT, "transaction_imgs")
-        if os.path.exists(samples_path):
-            files = [f for f in os.listdir(samples_path) if f.lower().endswith((".jpg", ".png", ".jpeg", ".gif"))]
-            files.sort(key=natural_sort_key)
-            choices.extend([(os.path.join(settings.MEDIA_URL, "transaction_imgs", f), f) for f in files])
+        # локальные картинки — из манифеста процесса, без обращения к диску
+        choices.extend(sample_images.choices())
 
         # заголовок
         choices.append(("", "--- Рандомные аватарки ---"))
@@ -146,3 +165,85 @@ class TransactionAdminForm(forms.ModelForm):
         if commit:
             instance.save()
         return instance
+
+
+BULK_ADD_DEFAULT_ROWS = 20
+BULK_ADD_MAX_ROWS = 100
+
+
+class BulkTransactionDefaultsForm(forms.ModelForm):
+    """
+    Общие поля пакетного ввода: банк, инициатор и изображение — одни на все строки.
+    """
+    image_deposit_choice = AnyChoiceField(
+        label="Или выберите готовое изображение",
+        required=False,
+        choices=[],
+        widget=ImageSelectWidget,
+    )
+
+    class Meta:
+        model = TransactionModel
+        fields = ("bank", "cardholder_name", "image_deposit")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["image_deposit_choice"].choices = sample_images.choices()
+
+    def save_image(self):
+        """
+        Имя изображения для всех строк пакета. Загруженный файл сохраняется в хранилище
+        один раз, а не при вставке каждой строки.
+        """
+        upload = self.cleaned_data.get("image_deposit")
+        if upload:
+            field = TransactionModel._meta.get_field("image_deposit")
+            return field.storage.save(field.generate_filename(None, upload.name), upload)
+        choice = self.cleaned_data.get("image_deposit_choice")
+        if choice:
+            return choice.strip().replace(settings.MEDIA_URL, "").lstrip("/")
+        return ""
+
+
+class BulkTransactionRowForm(forms.ModelForm):
+    to_card = forms.CharField(max_length=16, label="Карта получателя")
+
+    class Meta:
+        model = TransactionModel
+        fields = ("to_card", "amount", "comment")
+        widgets = {
+            "comment": forms.TextInput(attrs={"class": "vTextField"}),
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["to_card"].widget = CardNumberDatalistWidget(
+            autocomplete_url=reverse("admin:bank_accounts_transactionmodel_card_autocomplete"),
+            attrs={"class": "vTextField"},
+        )
+
+    def clean_amount(self):
+        amount = self.cleaned_data["amount"]
+        if amount is not None and amount <= 0:
+            raise forms.ValidationError("Сумма должна быть больше 0.")
+        return amount
+
+
+class BaseBulkTransactionFormSet(forms.BaseFormSet):
+    def filled_forms(self):
+        # незаполненные строки пропускаются
+        return [form for form in self.forms if form.has_changed()]
+
+    def clean(self):
+        if not any(self.errors) and not self.filled_forms():
+            raise forms.ValidationError("Заполните хотя бы одну строку.")
+
+
+def bulk_transaction_formset(rows=BULK_ADD_DEFAULT_ROWS):
+    return forms.formset_factory(
+        BulkTransactionRowForm,
+        formset=BaseBulkTransactionFormSet,
+        extra=rows,
+        max_num=BULK_ADD_MAX_ROWS,
+        validate_max=True,
+    )
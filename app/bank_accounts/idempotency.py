@@ -0,0 +1,257 @@
+"""
+Идемпотентные POST по заголовку Idempotency-Key.
+
+Ключ принимается только от аутентифицированных клиентов: анонимных нечем отличить друг
+от друга (за прокси у всех один адрес), и один мог бы получить сохранённый ответ другого.
+Первый запрос с ключом занимает строку IdempotencyKey (уникальна по владельцу и ключу)
+и выполняется; ответ сохраняется в той же транзакции, что и сама операция, и кладётся
+во фронтальный кэш (CACHES). Повтор отдаётся из кэша одним обращением, при промахе —
+одним запросом по уникальному индексу. Одновременный повтор не выполняется второй раз,
+а ждёт первый: в том же процессе — на событии, из другого процесса — опрашивая строку.
+
+Если запрос завершился исключением или 5xx, ключ освобождается: операция не проведена,
+и повтор выполнится заново. Если запрос выполнялся дольше IDEMPOTENCY_ABANDONED_AFTER
+и повтор успел признать ключ брошенным, ответ не сохранится (строки уже нет) — тогда
+откатывается и сама операция, чтобы её не провели дважды.
+"""
+import hashlib
+import json
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated, ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from bank_accounts.models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+# как часто повтор из другого процесса перечитывает занятый ключ, секунд
+POLL_INTERVAL = 0.05
+
+_lock = threading.Lock()
+# ключи, которые выполняются в этом процессе: повторы ждут на событии, а не опрашивают БД
+_in_flight = {}
+
+
+class IdempotencyInProgress(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Запрос с этим Idempotency-Key ещё выполняется, повторите позже."
+    default_code = "idempotency_in_progress"
+
+
+class IdempotencyClaimLost(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Запрос с этим Idempotency-Key выполнялся слишком долго и отменён, повторите его."
+    default_code = "idempotency_claim_lost"
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = "Idempotency-Key уже использован для другого запроса."
+    default_code = "idempotency_key_reused"
+
+
+def _cache():
+    return caches[getattr(settings, "IDEMPOTENCY_CACHE_ALIAS", "default")]
+
+
+def _cache_timeout():
+    # запись в кэше не должна пережить сам ключ
+    return min(getattr(settings, "IDEMPOTENCY_CACHE_TIMEOUT", 600), _ttl())
+
+
+def _ttl():
+    return getattr(settings, "IDEMPOTENCY_KEY_TTL", 24 * 3600)
+
+
+def _wait_timeout():
+    return getattr(settings, "IDEMPOTENCY_WAIT_TIMEOUT", 10)
+
+
+def _abandoned_after():
+    return getattr(settings, "IDEMPOTENCY_ABANDONED_AFTER", 60)
+
+
+def _cache_key(scope, key):
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f"bank_accounts:idempotency:{scope}:{digest}"
+
+
+def request_scope(request):
+    """
+    Владелец ключей запроса; None — анонимный клиент.
+    """
+    user = request.user
+    return f"user:{user.pk}" if user and user.is_authenticated else None
+
+
+def request_fingerprint(request):
+    """
+    Хэш метода, пути и разобранного тела: тот же ключ с другим телом — ошибка клиента.
+    У файлов учитываются имя и размер.
+    """
+    digest = hashlib.sha256(f"{request.method} {request.path}".encode())
+    data = request.data
+    if not hasattr(data, "keys"):
+        digest.update(json.dumps(data, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+    for name in sorted(data.keys()):
+        values = data.getlist(name) if hasattr(data, "getlist") else [data[name]]
+        for value in values:
+            if hasattr(value, "size") and hasattr(value, "name"):
+                value = f"file:{value.name}:{value.size}"
+            digest.update(json.dumps([name, value], sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def idempotent_response(request, handler):
+    """
+    Выполняет handler() не больше одного раза на (владелец, Idempotency-Key).
+    Без заголовка — просто вызывает handler(); заголовок от анонимного клиента — 401.
+    """
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if key is None:
+        return handler()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise ValidationError({IDEMPOTENCY_HEADER: [f"Ожидается непустой ключ до {MAX_KEY_LENGTH} символов."]})
+
+    scope = request_scope(request)
+    if scope is None:
+        raise NotAuthenticated(f"{IDEMPOTENCY_HEADER} принимается только от аутентифицированных клиентов.")
+    fingerprint = request_fingerprint(request)
+    cache_key = _cache_key(scope, key)
+    deadline = time.monotonic() + _wait_timeout()
+    stored = _cache().get(cache_key)
+    while stored is None:
+        claimed = _claim(scope, key, fingerprint, cache_key)
+        if claimed is not None:
+            return _execute(handler, claimed, fingerprint, cache_key)
+        stored = _wait_for_response(scope, key, fingerprint, cache_key, deadline)
+    return _replay(stored, fingerprint)
+
+
+def _claim(scope, key, fingerprint, cache_key):
+    """
+    Занимает ключ. Возвращает pk строки или None, если ключ уже занят.
+    """
+    try:
+        with transaction.atomic():
+            row = IdempotencyKey.objects.create(
+                scope=scope,
+                key=key,
+                request_hash=fingerprint,
+                expires_at=timezone.now() + timedelta(seconds=_ttl()),
+            )
+    except IntegrityError:
+        return None
+    with _lock:
+        _in_flight[cache_key] = threading.Event()
+    return row.pk
+
+
+def _execute(handler, pk, fingerprint, cache_key):
+    completed = False
+    try:
+        # ответ сохраняется в одной транзакции с операцией: проведённая операция без ответа невозможна
+        with transaction.atomic():
+            response = handler()
+            if response.status_code < 500:
+                body = None if response.data is None else json.loads(JSONRenderer().render(response.data))
+                saved = IdempotencyKey.objects.filter(pk=pk, status_code__isnull=True).update(
+                    status_code=response.status_code, response_body=body
+                )
+                if not saved:
+                    # строку удалили как брошенную, ключ мог занять повтор — операцию откатываем
+                    raise IdempotencyClaimLost()
+                completed = True
+        if completed:
+            _cache().set(cache_key, (fingerprint, response.status_code, body), _cache_timeout())
+        return response
+    finally:
+        if not completed:
+            IdempotencyKey.objects.filter(pk=pk).delete()
+        with _lock:
+            event = _in_flight.pop(cache_key, None)
+        if event is not None:
+            event.set()
+
+
+def _lookup(scope, key, fingerprint):
+    """
+    (сохранённый ответ или None, выполняется ли запрос сейчас). Просроченные и брошенные
+    (процесс упал, не дописав ответ) ключи удаляются — их можно занять заново.
+    """
+    row = (
+        IdempotencyKey.objects.filter(scope=scope, key=key)
+        .values("pk", "request_hash", "status_code", "response_body", "created_at", "expires_at")
+        .first()
+    )
+    if row is None:
+        return None, False
+    now = timezone.now()
+    abandoned_before = now - timedelta(seconds=_abandoned_after())
+    abandoned = row["status_code"] is None and row["created_at"] <= abandoned_before
+    if row["expires_at"] <= now or abandoned:
+        # условие повторяется в DELETE: ответ, сохранённый после чтения строки, не удаляется
+        stale = Q(expires_at__lte=now) | Q(status_code__isnull=True, created_at__lte=abandoned_before)
+        if IdempotencyKey.objects.filter(stale, pk=row["pk"]).delete()[0]:
+            return None, False
+        return _lookup(scope, key, fingerprint)
+    if row["request_hash"] != fingerprint:
+        raise IdempotencyKeyReused()
+    if row["status_code"] is None:
+        return None, True
+    return (row["request_hash"], row["status_code"], row["response_body"]), False
+
+
+def _wait_for_response(scope, key, fingerprint, cache_key, deadline):
+    """
+    Ждёт, пока выполняющийся запрос с тем же ключом сохранит ответ.
+    None — ключ освободился и его можно занять.
+    """
+    while True:
+        stored, in_flight = _lookup(scope, key, fingerprint)
+        if stored is not None:
+            _cache().set(cache_key, stored, _cache_timeout())
+            return stored
+        if not in_flight:
+            return None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise IdempotencyInProgress()
+        with _lock:
+            event = _in_flight.get(cache_key)
+        if event is not None:
+            event.wait(remaining)
+        else:
+            time.sleep(min(remaining, POLL_INTERVAL))
+
+
+def _replay(stored, fingerprint):
+    request_hash, status_code, body = stored
+    if request_hash != fingerprint:
+        raise IdempotencyKeyReused()
+    return Response(body, status=status_code, headers={REPLAYED_HEADER: "true"})
+
+
+def delete_expired_keys(batch_size=5000):
+    """
+    Удаляет просроченные ключи пачками по индексу expires_at. Возвращает число удалённых.
+    """
+    deleted = 0
+    now = timezone.now()
+    while True:
+        pks = list(IdempotencyKey.objects.filter(expires_at__lte=now).values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(pk__in=pks).delete()[0]
@@ -0,0 +1,83 @@
+"""
+Манифест готовых изображений (MEDIA_ROOT/transaction_imgs) для формы транзакции.
+Строится один раз на процесс и перестраивается, когда меняется mtime каталога;
+сам каталог проверяется не чаще раза в SAMPLE_IMAGES_RECHECK_SECONDS.
+"""
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
+
+from bank_accounts.thumbnails import get_thumbnail_urls
+
+SAMPLE_IMAGES_DIR = "transaction_imgs"
+IMAGE_EXTENSIONS = (".jpg", ".png", ".jpeg", ".gif")
+
+
+# функция для натуральной сортировки
+def natural_sort_key(s):
+    return [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', s)]
+
+
+class SampleImageManifest:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = None
+        self._choices = ()
+        self._thumbnails = {}
+
+    @property
+    def path(self):
+        return os.path.join(settings.MEDIA_ROOT, SAMPLE_IMAGES_DIR)
+
+    def choices(self):
+        """
+        [(url, имя файла), ...] в натуральном порядке.
+        """
+        now = time.monotonic()
+        interval = getattr(settings, "SAMPLE_IMAGES_RECHECK_SECONDS", 60)
+        if self._checked_at is None or now - self._checked_at >= interval:
+            with self._lock:
+                if self._checked_at is None or now - self._checked_at >= interval:
+                    self._refresh_if_changed()
+                    self._checked_at = now
+        return self._choices
+
+    def thumbnails(self):
+        """
+        {url изображения: {размер: url миниатюры}}; миниатюры создаются при сборке манифеста.
+        """
+        self.choices()
+        return self._thumbnails
+
+    def _refresh_if_changed(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._mtime or self._checked_at is None:
+            self._choices, self._thumbnails = self._build() if mtime is not None else ((), {})
+            self._mtime = mtime
+
+    def _build(self):
+        files = [f for f in os.listdir(self.path) if f.lower().endswith(IMAGE_EXTENSIONS)]
+        files.sort(key=natural_sort_key)
+        choices = tuple((os.path.join(settings.MEDIA_URL, SAMPLE_IMAGES_DIR, f), f) for f in files)
+        thumbnails = {
+            url: get_thumbnail_urls(os.path.join(SAMPLE_IMAGES_DIR, f))
+            for url, f in choices
+        }
+        return choices, thumbnails
+
+    def rebuild(self):
+        with self._lock:
+            self._checked_at = None
+            self._refresh_if_changed()
+            self._checked_at = time.monotonic()
+        return self._choices
+
+
+sample_images = SampleImageManifest()
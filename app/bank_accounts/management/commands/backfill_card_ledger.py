@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from bank_accounts.models import CardLedgerEntry, TransactionModel
+
+
+class Command(BaseCommand):
+    help = "Заполняет журнал проводок по картам из существующих транзакций (порциями)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Транзакций за одну порцию")
+        parser.add_argument("--start-id", type=int, default=0, help="Продолжить с транзакций с id > start-id")
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        last_id = options["start_id"]
+        created = 0
+
+        while True:
+            chunk = list(
+                TransactionModel.objects.filter(id__gt=last_id).order_by("id")[:chunk_size]
+            )
+            if not chunk:
+                break
+
+            entries = []
+            for tx in chunk:
+                for entry in tx.build_ledger_entries({}):
+                    # исторический баланс известен только для карты, по которой классифицирована операция
+                    if (entry.leg, tx.operation_type) in (("credit", "deposit"), ("debit", "withdraw")):
+                        entry.balance_after = tx.balance_after
+                    entries.append(entry)
+
+            # повторный запуск безопасен: уже записанные проводки пропускаются по уникальному ключу,
+            # поэтому новые считаем по числу проводок порции до и после вставки
+            existing = CardLedgerEntry.objects.filter(transaction_id__gt=last_id, transaction_id__lte=chunk[-1].id)
+            with transaction.atomic():
+                before = existing.count()
+                CardLedgerEntry.objects.bulk_create(entries, ignore_conflicts=True)
+                created += existing.count() - before
+
+            last_id = chunk[-1].id
+            self.stdout.write(f"… до транзакции {last_id}: {created} новых проводок")
+
+        self.stdout.write(self.style.SUCCESS(f"Готово, новых проводок: {created}"))
+        # проводки записаны в обход CardLedgerEntry.objects.record — сводки нужно пересчитать
+        self.stdout.write("Сводки по периодам: запустите rebuild_card_summaries.")
@@ -0,0 +1,813 @@
+import importlib.util
+import json
+import os
+import random
+import threading
+import time
+import tracemalloc
+from base64 import b64encode
+from contextlib import nullcontext
+from decimal import Decimal
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from bank_accounts import benchmarking
+from bank_accounts.cache import cache_stats
+from bank_accounts.models import CardAccountModel, TransactionModel
+from bank_accounts.services import post_transaction
+
+
+def _cursor_for(instance):
+    # тот же формат, что у CursorPagination.encode_cursor
+    querystring = urlencode({"p": str(instance.timestamp)})
+    return b64encode(querystring.encode("ascii")).decode("ascii")
+
+
+def transactions_list(command, options):
+    """
+    p95 GET /api/transactions/ для первой страницы и страницы из глубины истории.
+    """
+    client = Client()
+    cards = benchmarking.seed_cards(options["cards"])
+    results = []
+    for size in sorted(options["sizes"]):
+        benchmarking.seed_transactions(size, cards)
+        deep_row = TransactionModel.objects.order_by("-timestamp", "-id")[int(size * 0.9)]
+        targets = {
+            "first_page": {},
+            "deep_page": {"cursor": _cursor_for(deep_row)},
+            "card_filter": {"card_number": cards[0]},
+        }
+        for name, params in targets.items():
+            samples = benchmarking.measure(
+                lambda: client.get("/api/transactions/", params), options["repeat"]
+            )
+            row = {"rows": size, "target": name, **benchmarking.summarize(samples)}
+            results.append(row)
+            command.stdout.write(
+                f"{size:>9} {name:<12} p50={row['p50_ms']:.2f}ms p95={row['p95_ms']:.2f}ms"
+            )
+    return results
+
+
+def export(command, options):
+    """
+    Потоковая выгрузка /api/transactions/export.* : время до первого куска, полное время
+    и пик памяти Python (tracemalloc) в зависимости от объёма таблицы.
+    """
+    client = benchmarking.api_client()
+    cards = benchmarking.seed_cards(options["cards"])
+    results = []
+    for size in sorted(options["sizes"]):
+        benchmarking.seed_transactions(size, cards)
+        for export_format in ("csv", "ndjson"):
+            tracemalloc.start()
+            started = time.perf_counter()
+            response = client.get(f"/api/transactions/export.{export_format}")
+            content = iter(response.streaming_content)
+            total_bytes = len(next(content))
+            first_chunk = time.perf_counter() - started
+            for chunk in content:
+                total_bytes += len(chunk)
+            elapsed = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            row = {
+                "rows": size,
+                "target": export_format,
+                "first_chunk_ms": round(first_chunk * 1000, 3),
+                "total_ms": round(elapsed * 1000, 1),
+                "rows_per_sec": round(size / elapsed, 1),
+                "mb": round(total_bytes / 2**20, 1),
+                "peak_memory_mb": round(peak / 2**20, 2),
+            }
+            results.append(row)
+            command.stdout.write(
+                f"{size:>9} {export_format:<7} первый кусок {row['first_chunk_ms']:.2f}ms, "
+                f"всего {row['total_ms']:.0f}ms ({row['mb']} МБ), пик памяти {row['peak_memory_mb']} МБ"
+            )
+    return results
+
+
+def card_summary(command, options):
+    """
+    Помесячная выписка карты: /api/cards/{id}/summary/ из сводок против агрегации
+    журнала проводок на лету; плюс время полного пересчёта сводок.
+    """
+    from django.core.management import call_command
+    from django.db.models import Count, Q, Sum
+    from django.db.models.functions import TruncMonth
+
+    from bank_accounts.models import CardLedgerEntry
+
+    client = benchmarking.api_client()
+    cards = benchmarking.seed_cards(options["cards"])
+    card = CardAccountModel.objects.get(card_number=cards[0])
+    results = []
+    for size in sorted(options["sizes"]):
+        benchmarking.seed_transactions(size, cards)
+        started = time.perf_counter()
+        call_command("rebuild_card_summaries", workers=options["threads"], stdout=open(os.devnull, "w"))
+        rebuild = time.perf_counter() - started
+
+        def from_ledger():
+            list(
+                CardLedgerEntry.objects.filter(card_number=card.card_number)
+                .annotate(month=TruncMonth("timestamp"))
+                .values("month")
+                .annotate(
+                    inflow=Sum("amount", filter=Q(amount__gte=0)),
+                    outflow=Sum("amount", filter=Q(amount__lt=0)),
+                    count=Count("id"),
+                )
+                .order_by("month")
+            )
+
+        targets = {
+            "summary": lambda: client.get(f"/api/cards/{card.pk}/summary/", {"period": "day"}),
+            "from_ledger": from_ledger,
+        }
+        for name, func in targets.items():
+            row = {"rows": size, "target": name, **benchmarking.summarize(benchmarking.measure(func, options["repeat"]))}
+            results.append(row)
+            command.stdout.write(f"{size:>9} {name:<12} p50={row['p50_ms']:.2f}ms p95={row['p95_ms']:.2f}ms")
+        command.stdout.write(f"{size:>9} пересчёт сводок: {rebuild:.1f}s")
+    return results
+
+
+SERIALIZER_RUNS = 5
+
+
+def serializer(command, options):
+    """
+    Сериализация списка транзакций: TransactionSerializer на моделях против TransactionRowSerializer
+    на .values(). Проверяется, что JSON совпадает байт в байт.
+    """
+    from django.db.models import F
+    from django.test import RequestFactory
+    from rest_framework.renderers import JSONRenderer
+
+    from bank_accounts.serializers import TransactionRowSerializer, TransactionSerializer
+
+    cards = benchmarking.seed_cards(options["cards"])
+    request = RequestFactory().get("/api/transactions/")
+    context = {"request": request}
+    results = []
+    for size in sorted(options["sizes"]):
+        benchmarking.seed_transactions(size, cards)
+        # у части строк — изображения с разными именами (файлов нет, миниатюры не создаются)
+        names = ("transactions/deposits/чек 1.jpg", f"transactions/deposits/ab/{'ab' * 32}.png")
+        for index, name in enumerate(names):
+            TransactionModel.objects.annotate(bucket=F("id") % 7).filter(bucket=index).update(image_deposit=name)
+
+        queryset = TransactionModel.objects.order_by("-timestamp", "-id")[:size]
+        instances = list(queryset)
+        rows = list(queryset.values(*TransactionRowSerializer.source_fields()))
+        paths = {
+            "model_serializer": lambda: TransactionSerializer(instances, many=True, context=context).data,
+            "row_serializer": lambda: TransactionRowSerializer(rows, context=context).data,
+        }
+        rendered = {}
+        for name, func in paths.items():
+            samples = []
+            for _ in range(SERIALIZER_RUNS):
+                started = time.perf_counter()
+                data = func()
+                samples.append(time.perf_counter() - started)
+            rendered[name] = JSONRenderer().render(data)
+            row = {"rows": size, "target": name, "p50_ms": round(benchmarking.percentile(samples, 50) * 1000, 1)}
+            results.append(row)
+            command.stdout.write(f"{size:>9} {name:<17} {row['p50_ms']:>10.1f}ms")
+
+        if rendered["model_serializer"] != rendered["row_serializer"]:
+            raise CommandError("JSON TransactionRowSerializer отличается от TransactionSerializer.")
+        command.stdout.write(
+            f"{size:>9} ускорение: x{results[-2]['p50_ms'] / results[-1]['p50_ms']:.1f}, JSON совпадает"
+        )
+    return results
+
+
+def _legacy_post(tx):
+    # прежний путь TransactionSerializer.create: чтение-изменение-запись без блокировок
+    to_card = CardAccountModel.objects.filter(card_number=tx.to_card).first()
+    if to_card:
+        to_card.balance += tx.amount
+        to_card.save()
+    from_card = CardAccountModel.objects.filter(card_number=tx.from_card).first()
+    if from_card:
+        if from_card.balance < tx.amount:
+            raise ValueError("Insufficient funds")
+        from_card.balance -= tx.amount
+        from_card.save()
+    tx.save()
+
+
+def transfers(command, options):
+    """
+    Стресс-тест параллельного проведения операций: потерянные обновления и пропускная способность.
+    Все потоки переводят деньги между небольшим набором "горячих" карт и пополняют их извне,
+    поэтому итоговая сумма балансов известна заранее.
+    """
+    cards = benchmarking.seed_cards(options["cards"])
+    amount = Decimal("1.00")
+    results = []
+    for name, post in (("legacy", _legacy_post), ("service", post_transaction)):
+        CardAccountModel.objects.update(balance=Decimal("1000000.00"))
+        total_before = sum(CardAccountModel.objects.values_list("balance", flat=True))
+        deposits = []
+
+        def worker(thread_index, iteration):
+            rng = random.Random(thread_index * 100_003 + iteration)
+            from_card, to_card = rng.sample(cards, 2)
+            if iteration % 2:
+                from_card = f"5{thread_index:015d}"  # пополнение с внешней карты
+            post(TransactionModel(from_card=from_card, to_card=to_card, amount=amount))
+            if iteration % 2:
+                deposits.append(amount)
+
+        elapsed, errors = benchmarking.run_threads(worker, options["threads"], options["repeat"])
+        posted = options["threads"] * options["repeat"] - len(errors)
+        expected = total_before + sum(deposits)
+        actual = sum(CardAccountModel.objects.values_list("balance", flat=True))
+        row = {
+            "path": name,
+            "posted": posted,
+            "errors": len(errors),
+            "tx_per_sec": round(posted / elapsed, 1),
+            # ненулевое расхождение означает потерянные (или частично записанные) обновления
+            "balance_drift": str(expected - actual),
+        }
+        results.append(row)
+        command.stdout.write(
+            f"{name:<8} {row['tx_per_sec']:>8} tx/s, ошибок: {row['errors']}, расхождение баланса: {row['balance_drift']}"
+        )
+    return results
+
+
+def bulk_ingest(command, options):
+    """
+    Загрузка выписки: построчные POST /api/transactions/ против одного POST /api/transactions/bulk/.
+    """
+    client = benchmarking.api_client()
+    cards = benchmarking.seed_cards(options["cards"])
+    rng = random.Random(7)
+    rows = [
+        {"to_card": rng.choice(cards), "from_card": f"5{index:015d}", "amount": "12.50", "bank": "mono"}
+        for index in range(options["repeat"])
+    ]
+
+    started = time.perf_counter()
+    for row in rows:
+        client.post("/api/transactions/", row, content_type="application/json")
+    single = time.perf_counter() - started
+
+    started = time.perf_counter()
+    client.post("/api/transactions/bulk/", json.dumps(rows), content_type="application/json")
+    bulk = time.perf_counter() - started
+
+    results = [
+        {"path": "single", "rows": len(rows), "rows_per_sec": round(len(rows) / single, 1)},
+        {"path": "bulk", "rows": len(rows), "rows_per_sec": round(len(rows) / bulk, 1)},
+    ]
+    for row in results:
+        command.stdout.write(f"{row['path']:<8} {row['rows_per_sec']:>10} строк/с")
+    command.stdout.write(f"ускорение: x{single / bulk:.1f}")
+    return results
+
+
+def card_cache(command, options):
+    """
+    Опрос баланса: карта по id и по номеру с кэшем и без него (DummyCache).
+    """
+    client = benchmarking.api_client()
+    cards = benchmarking.seed_cards(options["cards"])
+    benchmarking.seed_transactions(min(options["sizes"]), cards)
+    card = CardAccountModel.objects.get(card_number=cards[0])
+    targets = {
+        "retrieve": (f"/api/cards/{card.pk}/", {"transactions": 5}),
+        "by_number": ("/api/cards/by-number/", {"card_number": card.card_number, "transactions": 5}),
+    }
+    caches_settings = {
+        "cached": {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+        "uncached": {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+    }
+    results = []
+    for mode, caches_config in caches_settings.items():
+        with override_settings(CACHES=caches_config):
+            for name, (url, params) in targets.items():
+                samples = benchmarking.measure(lambda: client.get(url, params), options["repeat"])
+                row = {"mode": mode, "target": name, **benchmarking.summarize(samples)}
+                results.append(row)
+                command.stdout.write(
+                    f"{mode:<9} {name:<10} {row['rps']:>8} req/s p95={row['p95_ms']:.2f}ms"
+                )
+    command.stdout.write(f"cache: {cache_stats()}")
+    return results
+
+
+def idempotency(command, options):
+    """
+    POST /api/transactions/ с Idempotency-Key: новый ключ (операция проводится) против
+    повтора (ответ из фронтального кэша и из таблицы ключей при пустом кэше).
+    """
+    from itertools import count
+
+    from bank_accounts.idempotency import _cache as idempotency_cache
+
+    client = benchmarking.api_client()
+    cards = benchmarking.seed_cards(options["cards"])
+    body = json.dumps({"to_card": cards[0], "from_card": "5000000000000000", "amount": "10.00", "bank": "mono"})
+    keys = count()
+    targets = {
+        "no_key": lambda: {},
+        "new_key": lambda: {"HTTP_IDEMPOTENCY_KEY": f"new-{next(keys)}"},
+        "replay_cached": lambda: {"HTTP_IDEMPOTENCY_KEY": "replay"},
+        "replay_db": lambda: {"HTTP_IDEMPOTENCY_KEY": "replay"},
+    }
+    results = []
+    for name, headers in targets.items():
+        queries = []
+
+        def call():
+            if name == "replay_db":
+                idempotency_cache().clear()
+            with CaptureQueriesContext(connection) as captured:
+                response = client.post("/api/transactions/", body, content_type="application/json", **headers())
+            queries.append(len(captured))
+            if response.status_code != 201:
+                raise CommandError(f"{name}: POST -> {response.status_code}")
+
+        samples = benchmarking.measure(call, options["repeat"])
+        row = {"target": name, **benchmarking.summarize(samples), "queries": round(sum(queries) / len(queries), 2)}
+        results.append(row)
+        command.stdout.write(
+            f"{name:<14} {row['rps']:>8} req/s p50={row['p50_ms']:.2f}ms p95={row['p95_ms']:.2f}ms queries={row['queries']}"
+        )
+    posted = TransactionModel.objects.filter(to_card=cards[0]).count()
+    expected = options["repeat"] * 2 + 1
+    if posted != expected:
+        raise CommandError(f"Проведено {posted} операций вместо {expected}.")
+    return results
+
+
+def admin_changelist(command, options):
+    """
+    Список транзакций в админке: стандартные настройки ModelAdmin (icontains, COUNT(*),
+    DISTINCT для date_hierarchy) против поиска по индексу, оценки числа строк и
+    date_hierarchy через поиск по индексу. Время и запросов к БД на страницу по размерам таблицы.
+    """
+    from unittest import mock
+
+    from django.contrib import admin
+    from django.contrib.auth.models import User
+    from django.core.paginator import Paginator
+
+    from bank_accounts.admin import TransactionAdmin
+
+    legacy = {
+        "get_search_results": admin.ModelAdmin.get_search_results,
+        "get_queryset": admin.ModelAdmin.get_queryset,
+        "paginator": Paginator,
+        "show_full_result_count": True,
+        "ordering": None,
+    }
+    client = Client()
+    user, _ = User.objects.get_or_create(username="benchmark-admin", defaults={"is_staff": True, "is_superuser": True})
+    client.force_login(user)
+    cards = benchmarking.seed_cards(options["cards"])
+    url = "/admin/bank_accounts/transactionmodel/"
+    results = []
+    for size in sorted(options["sizes"]):
+        benchmarking.seed_transactions(size, cards)
+        last = timezone.localtime(TransactionModel.objects.order_by("-timestamp").values_list("timestamp", flat=True)[0])
+        targets = {
+            "changelist": {},
+            "search_prefix": {"q": cards[0][:15]},
+            "search_exact": {"q": cards[0]},
+            "date_day": {"timestamp__year": last.year, "timestamp__month": last.month, "timestamp__day": last.day},
+        }
+        for mode in ("legacy", "indexed"):
+            with mock.patch.multiple(TransactionAdmin, **legacy) if mode == "legacy" else nullcontext():
+                for name, params in targets.items():
+                    queries = []
+
+                    def call():
+                        with CaptureQueriesContext(connection) as captured:
+                            response = client.get(url, params)
+                        queries.append(len(captured))
+                        if response.status_code != 200:
+                            raise CommandError(f"{mode} {name}: GET {url} -> {response.status_code}")
+
+                    samples = benchmarking.measure(call, options["repeat"])
+                    row = {
+                        "rows": size,
+                        "mode": mode,
+                        "target": name,
+                        **benchmarking.summarize(samples),
+                        "queries": round(sum(queries) / len(queries), 2),
+                    }
+                    results.append(row)
+                    command.stdout.write(
+                        f"{size:>9} {mode:<8} {name:<14} p50={row['p50_ms']:>8.2f}ms "
+                        f"p95={row['p95_ms']:>8.2f}ms queries={row['queries']}"
+                    )
+    return results
+
+
+JWT_AUTHENTICATION_CLASSES = {
+    "db": "rest_framework_simplejwt.authentication.JWTAuthentication",
+    "cached": "bank_accounts.authentication.CachedJWTAuthentication",
+}
+
+
+def jwt_auth(command, options):
+    """
+    Опрос баланса с JWT: пользователь из БД на каждый запрос (simplejwt) против кэша
+    пользователей в процессе. Запросов к БД и задержка на запрос; в конце — проверка,
+    что деактивация пользователя сразу закрывает доступ.
+    """
+    from unittest import mock
+
+    from django.utils.module_loading import import_string
+    from rest_framework.views import APIView
+
+    from bank_accounts.authentication import cache_stats as user_cache_stats
+    from bank_accounts.authentication import clear_user_cache
+
+    client = benchmarking.api_client()
+    cards = benchmarking.seed_cards(options["cards"])
+    card = CardAccountModel.objects.get(card_number=cards[0])
+    targets = {
+        "retrieve": f"/api/cards/{card.pk}/",
+        "by_number": f"/api/cards/by-number/?card_number={card.card_number}",
+    }
+    results = []
+    for mode, auth_class in JWT_AUTHENTICATION_CLASSES.items():
+        # APIView читает DEFAULT_AUTHENTICATION_CLASSES при импорте — override_settings не поможет
+        with mock.patch.object(APIView, "authentication_classes", [import_string(auth_class)]):
+            clear_user_cache()
+            for name, path in targets.items():
+                queries = []
+
+                def call():
+                    with CaptureQueriesContext(connection) as captured:
+                        response = client.get(path)
+                    queries.append(len(captured))
+                    if response.status_code != 200:
+                        raise CommandError(f"{mode} {name}: GET {path} -> {response.status_code}")
+
+                samples = benchmarking.measure(call, options["repeat"])
+                row = {
+                    "mode": mode,
+                    "target": name,
+                    **benchmarking.summarize(samples),
+                    "queries": round(sum(queries) / len(queries), 2),
+                }
+                results.append(row)
+                command.stdout.write(
+                    f"{mode:<7} {name:<10} {row['rps']:>8} req/s p50={row['p50_ms']:.2f}ms "
+                    f"p95={row['p95_ms']:.2f}ms queries={row['queries']}"
+                )
+            if mode == "cached":
+                command.stdout.write(f"user cache: {user_cache_stats()}")
+                user = card.user
+                user.is_active = False
+                user.save(update_fields=["is_active"])
+                status = client.get(targets["retrieve"]).status_code
+                user.is_active = True
+                user.save(update_fields=["is_active"])
+                if status != 401:
+                    raise CommandError(f"Деактивированный пользователь получил {status} вместо 401.")
+                command.stdout.write("деактивация: 401 сразу после сохранения")
+    return results
+
+
+def _api_targets(card, tx_id):
+    """
+    Эндпоинты набора api: (метод, путь, тело, нужна ли сессия админки вместо JWT).
+    """
+    deposit = json.dumps({"to_card": card.card_number, "from_card": "5000000000000000", "amount": "10.00", "bank": "mono"})
+    return {
+        "card_list": ("GET", "/api/cards/", None, False),
+        "card_retrieve": ("GET", f"/api/cards/{card.pk}/?transactions=5", None, False),
+        "card_by_number": ("GET", f"/api/cards/by-number/?card_number={card.card_number}", None, False),
+        "transaction_list": ("GET", f"/api/transactions/?card_number={card.card_number}", None, False),
+        "transaction_create": ("POST", "/api/transactions/", deposit, False),
+        "transaction_detail": ("GET", f"/api/transactions/{tx_id}/", None, False),
+        "admin_add_form": ("GET", "/admin/bank_accounts/transactionmodel/add/", None, True),
+    }
+
+
+def api(command, options):
+    """
+    Основные эндпоинты API и форма добавления в админке: пропускная способность,
+    p50/p95/p99 и запросов к БД на запрос. По умолчанию — в процессе через тестовый клиент;
+    с --server gunicorn — по HTTP к gunicorn на той же тестовой БД (--threads клиентов,
+    запросы к БД при этом не считаются).
+    """
+    from django.contrib.auth.models import User
+
+    cards = benchmarking.seed_cards(options["cards"])
+    benchmarking.seed_transactions(min(options["sizes"]), cards)
+    card = CardAccountModel.objects.get(card_number=cards[0])
+    tx_id = TransactionModel.objects.order_by("-id").values_list("id", flat=True).first()
+    targets = _api_targets(card, tx_id)
+
+    client = benchmarking.api_client()
+    admin_client = Client()
+    admin, _ = User.objects.get_or_create(username="benchmark-admin", defaults={"is_staff": True, "is_superuser": True})
+    admin_client.force_login(admin)
+
+    results = []
+    if options["server"] == "gunicorn":
+        port = benchmarking.free_port()
+        argv = ("gunicorn", "settings.wsgi:application", "-w", str(options["workers"]), "-b", f"127.0.0.1:{port}")
+        jwt_headers = {"Authorization": client.defaults["HTTP_AUTHORIZATION"], "Content-Type": "application/json"}
+        session_headers = {"Cookie": f"sessionid={admin_client.cookies['sessionid'].value}"}
+        with benchmarking.serve(argv, port) as base_url:
+            for name, (method, path, body, session) in targets.items():
+                samples, statuses = [], []
+
+                def worker(thread_index, iteration):
+                    started = time.perf_counter()
+                    statuses.append(benchmarking.http_request(
+                        f"{base_url}{path}",
+                        session_headers if session else jwt_headers,
+                        body.encode() if body else None,
+                        method,
+                    ))
+                    samples.append(time.perf_counter() - started)
+
+                elapsed, errors = benchmarking.run_threads(worker, options["threads"], options["repeat"])
+                row = {
+                    "server": "gunicorn",
+                    "target": name,
+                    **benchmarking.summarize(samples),
+                    "rps": round(len(samples) / elapsed, 1),
+                    "queries": None,
+                    "errors": len(errors) + sum(1 for code in statuses if code >= 400),
+                }
+                results.append(row)
+    else:
+        for name, (method, path, body, session) in targets.items():
+            request_client = admin_client if session else client
+            queries = []
+
+            def call():
+                with CaptureQueriesContext(connection) as captured:
+                    if method == "POST":
+                        response = request_client.post(path, body, content_type="application/json")
+                    else:
+                        response = request_client.get(path)
+                queries.append(len(captured))
+                if response.status_code >= 400:
+                    raise CommandError(f"{name}: {method} {path} -> {response.status_code}")
+
+            samples = benchmarking.measure(call, options["repeat"])
+            row = {
+                "server": "in-process",
+                "target": name,
+                **benchmarking.summarize(samples),
+                "queries": round(sum(queries) / len(queries), 2),
+                "errors": 0,
+            }
+            results.append(row)
+
+    for row in results:
+        queries = "-" if row["queries"] is None else row["queries"]
+        command.stdout.write(
+            f"{row['target']:<19} {row['rps']:>8} req/s p50={row['p50_ms']:.2f}ms p95={row['p95_ms']:.2f}ms "
+            f"p99={row['p99_ms']:.2f}ms запросов: {queries} ошибок: {row['errors']}"
+        )
+    return results
+
+
+# PRAGMA по умолчанию в SQLite — точка отсчёта для SQLITE_PRAGMAS
+SQLITE_DEFAULT_PRAGMAS = {"journal_mode": "DELETE", "synchronous": "FULL"}
+
+
+def db_writes(command, options):
+    """
+    Пропускная способность записи при параллельных писателях (post_transaction между
+    горячими картами) — отдельно и вместе с таким же числом читателей.
+    Для SQLite сравниваются PRAGMA по умолчанию и SQLITE_PRAGMAS, для PostgreSQL — текущий профиль.
+    """
+    cards = benchmarking.seed_cards(options["cards"])
+    benchmarking.seed_transactions(min(options["sizes"]), cards)
+    if connection.vendor == "sqlite":
+        profiles = {"sqlite-default": SQLITE_DEFAULT_PRAGMAS, "sqlite-tuned": settings.SQLITE_PRAGMAS}
+    else:
+        profiles = {settings.DATABASE_PROFILE: getattr(settings, "SQLITE_PRAGMAS", {})}
+
+    results = []
+    for profile, pragmas in profiles.items():
+        with override_settings(SQLITE_PRAGMAS=pragmas):
+            connection.close()  # PRAGMA применяются к новым соединениям
+            for mode, readers in (("writers", 0), ("mixed", options["threads"])):
+                latencies = {"write": [], "read": []}
+
+                def worker(thread_index, iteration):
+                    rng = random.Random(thread_index * 100_003 + iteration)
+                    started = time.perf_counter()
+                    if thread_index < options["threads"]:
+                        from_card, to_card = rng.sample(cards, 2)
+                        post_transaction(TransactionModel(from_card=from_card, to_card=to_card, amount=Decimal("1.00")))
+                        latencies["write"].append(time.perf_counter() - started)
+                    else:
+                        card_number = rng.choice(cards)
+                        CardAccountModel.objects.filter(card_number=card_number).values_list("balance", flat=True).get()
+                        list(TransactionModel.objects.filter(to_card=card_number).order_by("-timestamp", "-id")[:50])
+                        latencies["read"].append(time.perf_counter() - started)
+
+                elapsed, errors = benchmarking.run_threads(worker, options["threads"] + readers, options["repeat"])
+                writes = benchmarking.summarize(latencies["write"])
+                row = {
+                    "profile": profile,
+                    "mode": mode,
+                    "writers": options["threads"],
+                    "readers": readers,
+                    "tx_per_sec": round(len(latencies["write"]) / elapsed, 1),
+                    "reads_per_sec": round(len(latencies["read"]) / elapsed, 1),
+                    "write_p95_ms": writes["p95_ms"],
+                    "read_p95_ms": benchmarking.summarize(latencies["read"])["p95_ms"],
+                    "errors": len(errors),
+                }
+                results.append(row)
+                command.stdout.write(
+                    f"{profile:<15} {mode:<8} {row['tx_per_sec']:>8} tx/s {row['reads_per_sec']:>8} чтений/с "
+                    f"p95 записи={row['write_p95_ms']:.2f}ms чтения={row['read_p95_ms']:.2f}ms ошибок: {row['errors']}"
+                )
+        connection.close()
+    return results
+
+
+HTTP_SERVERS = {
+    # синхронные представления DRF в процессах-воркерах gunicorn
+    "wsgi-sync": (("gunicorn", "settings.wsgi:application"), "/api"),
+    # асинхронные представления под ASGI (uvicorn-воркеры gunicorn)
+    "asgi-async": (("gunicorn", "settings.asgi:application", "-k", "uvicorn.workers.UvicornWorker"), "/api/async"),
+}
+
+
+def http_load(command, options):
+    """
+    Горячие GET-эндпоинты по настоящему HTTP: gunicorn с sync-воркерами против
+    асинхронных представлений под ASGI. --threads клиентов, по --repeat запросов каждый.
+    """
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    cards = benchmarking.seed_cards(options["cards"])
+    benchmarking.seed_transactions(min(options["sizes"]), cards)
+    card = CardAccountModel.objects.get(card_number=cards[0])
+    tx_id = TransactionModel.objects.order_by("-id").values_list("id", flat=True).first()
+    user = card.user
+    headers = {"Authorization": f"Bearer {AccessToken.for_user(user)}"}
+    targets = {
+        "card": f"/cards/{card.pk}/?transactions=5",
+        "by_number": f"/cards/by-number/?card_number={card.card_number}&transactions=5",
+        "transaction": f"/transactions/{tx_id}/",
+        "list": f"/transactions/?card_number={card.card_number}",
+    }
+
+    results = []
+    for server, (argv, prefix) in HTTP_SERVERS.items():
+        worker_class = argv[argv.index("-k") + 1] if "-k" in argv else None
+        if worker_class and importlib.util.find_spec(worker_class.split(".")[0]) is None:
+            command.stdout.write(f"{server:<10} пропущен: не установлен {worker_class.split('.')[0]}")
+            continue
+        port = benchmarking.free_port()
+        argv = (*argv, "-w", str(options["workers"]), "-b", f"127.0.0.1:{port}")
+        with benchmarking.serve(argv, port) as base_url:
+            for name, path in targets.items():
+                url = f"{base_url}{prefix}{path}"
+                samples, statuses, lock = [], [], threading.Lock()
+
+                def worker(thread_index, iteration):
+                    started = time.perf_counter()
+                    status_code = benchmarking.http_request(url, headers)
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        samples.append(elapsed)
+                        statuses.append(status_code)
+
+                elapsed, errors = benchmarking.run_threads(worker, options["threads"], options["repeat"])
+                row = {
+                    "server": server,
+                    "target": name,
+                    **benchmarking.summarize(samples),
+                    # пропускная способность при параллельных клиентах, а не 1 / среднее время
+                    "rps": round(len(samples) / elapsed, 1),
+                    "errors": len(errors) + sum(1 for code in statuses if code != 200),
+                }
+                results.append(row)
+                command.stdout.write(
+                    f"{server:<10} {name:<11} {row['rps']:>8} req/s "
+                    f"p50={row['p50_ms']:.2f}ms p99={row['p99_ms']:.2f}ms ошибок: {row['errors']}"
+                )
+    return results
+
+
+# запросов к БД на одну операцию через post_transaction, включая BEGIN и COMMIT
+# и одно обновление сводок по периодам для операций с картами системы;
+# без блокировки строк (SQLite в режиме DEFERRED) добавляется перечитывание балансов
+POST_QUERY_BUDGET = {
+    "deposit": 7,
+    "withdraw": 7,
+    "transfer": 8,
+    "external": 5,
+}
+
+
+def query_budget(command, options):
+    """
+    Количество запросов на проведение операции каждого типа против бюджета POST_QUERY_BUDGET.
+    """
+    cards = benchmarking.seed_cards(2)
+    external = "5000000000000000"
+    operations = {
+        "deposit": (external, cards[0]),
+        "withdraw": (cards[0], external),
+        "transfer": (cards[0], cards[1]),
+        "external": (external, "5000000000000001"),
+    }
+    results = []
+    failed = False
+    for name, (from_card, to_card) in operations.items():
+        tx = TransactionModel(from_card=from_card, to_card=to_card, amount=Decimal("1.00"))
+        with CaptureQueriesContext(connection) as queries:
+            post_transaction(tx)
+        budget = POST_QUERY_BUDGET[name]
+        failed = failed or len(queries) > budget
+        results.append({"operation": name, "queries": len(queries), "budget": budget})
+        command.stdout.write(f"{name:<9} запросов: {len(queries)} (бюджет {budget})")
+        if options["verbosity"] > 1:
+            for query in queries:
+                command.stdout.write(f"    {query['sql']}")
+    if failed:
+        raise CommandError("Превышен бюджет запросов.")
+    return results
+
+
+SCENARIOS = {
+    "admin-changelist": admin_changelist,
+    "api": api,
+    "bulk-ingest": bulk_ingest,
+    "card-cache": card_cache,
+    "card-summary": card_summary,
+    "db-writes": db_writes,
+    "export": export,
+    "http-load": http_load,
+    "idempotency": idempotency,
+    "jwt-auth": jwt_auth,
+    "query-budget": query_budget,
+    "serializer": serializer,
+    "transactions-list": transactions_list,
+    "transfers": transfers,
+}
+
+
+class Command(BaseCommand):
+    help = "Замеры производительности API на отдельной тестовой БД."
+
+    def add_arguments(self, parser):
+        parser.add_argument("scenario", choices=sorted(SCENARIOS))
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                            help="Объёмы таблицы транзакций")
+        parser.add_argument("--cards", type=int, default=100, help="Количество карт")
+        parser.add_argument("--repeat", type=int, default=200, help="Запросов на одну точку (на поток)")
+        parser.add_argument("--threads", type=int, default=8, help="Параллельных потоков")
+        parser.add_argument("--workers", type=int, default=2, help="Воркеров gunicorn (http-load, api)")
+        parser.add_argument("--server", choices=("in-process", "gunicorn"), default="in-process",
+                            help="Куда слать запросы в сценарии api")
+        parser.add_argument("--keepdb", action="store_true", help="Не удалять тестовую БД")
+        parser.add_argument("--json", dest="json_output", help="Сохранить результаты в JSON-файл")
+        parser.add_argument("--baseline", help="JSON прошлого запуска для поиска регрессий")
+        parser.add_argument("--threshold", type=float, default=20.0,
+                            help="Допустимое ухудшение метрик относительно --baseline, %%")
+
+    def handle(self, *args, **options):
+        scenario = SCENARIOS[options["scenario"]]
+        with benchmarking.test_database(keepdb=options["keepdb"]), override_settings(DEBUG=False):
+            results = scenario(self, options)
+
+        if options["json_output"]:
+            with open(options["json_output"], "w", encoding="utf-8") as fh:
+                json.dump({"scenario": options["scenario"], "results": results}, fh, indent=2)
+
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as fh:
+                baseline = json.load(fh)
+            if baseline.get("scenario") != options["scenario"]:
+                raise CommandError(f"{options['baseline']}: результаты сценария {baseline.get('scenario')}.")
+            regressions = benchmarking.find_regressions(results, baseline["results"], options["threshold"])
+            for line in regressions:
+                self.stderr.write(f"регрессия: {line}")
+            if regressions:
+                raise CommandError(f"Ухудшение больше {options['threshold']}%: {len(regressions)}.")
+            self.stdout.write(f"Регрессий больше {options['threshold']}% нет.")
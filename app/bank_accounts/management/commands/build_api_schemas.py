@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from bank_accounts.docs import build_schemas
+
+
+class Command(BaseCommand):
+    help = (
+        "Строит схемы OpenAPI (drf-spectacular и drf-yasg) в API_SCHEMA_DIR: "
+        "воркеры отдают их из файлов, не генерируя. Запускать при сборке или деплое."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", help="Каталог для схем (по умолчанию API_SCHEMA_DIR)")
+
+    def handle(self, *args, **options):
+        directory = options["dir"] or getattr(settings, "API_SCHEMA_DIR", None)
+        if not directory:
+            raise CommandError("Не задан каталог: укажите --dir или API_SCHEMA_DIR.")
+        for name, size in build_schemas(directory).items():
+            self.stdout.write(f"{name}: {size} байт")
+        self.stdout.write(self.style.SUCCESS(f"Схемы записаны в {directory}"))
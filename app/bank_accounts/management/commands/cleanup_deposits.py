@@ -0,0 +1,56 @@
+import os
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from bank_accounts.models import TransactionModel
+
+
+class Command(BaseCommand):
+    help = (
+        "Подсчитывает ссылки транзакций на файлы image_deposit и удаляет файлы "
+        "без ссылок (старше --min-age секунд)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Только показать, что будет удалено")
+        parser.add_argument("--min-age", type=int, default=24 * 3600,
+                            help="Не трогать файлы моложе N секунд (загрузка может быть ещё не сохранена)")
+
+    def handle(self, *args, **options):
+        field = TransactionModel._meta.get_field("image_deposit")
+        storage = field.storage
+        upload_dir = field.upload_to.rstrip("/")
+
+        references = Counter(
+            TransactionModel.objects.exclude(image_deposit="").exclude(image_deposit__isnull=True)
+            .values_list("image_deposit", flat=True).iterator(chunk_size=5000)
+        )
+
+        now = time.time()
+        kept = removed = freed = 0
+        for root, _, files in os.walk(storage.path(upload_dir)):
+            for filename in files:
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, storage.location).replace(os.sep, "/")
+                if references[name]:
+                    kept += 1
+                    continue
+                if now - os.path.getmtime(path) < options["min_age"]:
+                    continue
+                removed += 1
+                freed += os.path.getsize(path)
+                if options["dry_run"]:
+                    self.stdout.write(f"удалить: {name}")
+                else:
+                    os.remove(path)
+                    if root != storage.path(upload_dir) and not os.listdir(root):
+                        os.rmdir(root)
+
+        shared = sum(1 for count in references.values() if count > 1)
+        self.stdout.write(self.style.SUCCESS(
+            f"Файлов со ссылками: {kept} (из них общих: {shared}), "
+            f"без ссылок: {removed}, освобождено байт: {freed}"
+            + (" (dry run)" if options["dry_run"] else "")
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from bank_accounts.idempotency import delete_expired_keys
+
+
+class Command(BaseCommand):
+    help = "Удаляет просроченные ключи идемпотентности (IDEMPOTENCY_KEY_TTL). Запускать по расписанию."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000, help="Строк за один DELETE")
+
+    def handle(self, *args, **options):
+        deleted = delete_expired_keys(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Удалено ключей: {deleted}"))
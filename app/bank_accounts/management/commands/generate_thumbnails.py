@@ -0,0 +1,48 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from bank_accounts.images import IMAGE_EXTENSIONS, SAMPLE_IMAGES_DIR
+from bank_accounts.storage import content_hash_from_name
+from bank_accounts.thumbnails import THUMBNAIL_SIZES, generate_thumbnails
+
+SOURCE_DIRS = (SAMPLE_IMAGES_DIR, "transactions")
+
+
+class Command(BaseCommand):
+    help = "Заранее создаёт миниатюры для всех изображений транзакций (пул процессов)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Количество процессов")
+
+    def handle(self, *args, **options):
+        media_root = str(settings.MEDIA_ROOT)
+        sources = [
+            os.path.join(root, filename)
+            for directory in SOURCE_DIRS
+            for root, _, files in os.walk(os.path.join(media_root, directory))
+            for filename in files
+            if filename.lower().endswith(IMAGE_EXTENSIONS)
+        ]
+
+        failed = 0
+        with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+            futures = {
+                # у загрузок из ContentAddressedStorage хэш уже в имени — файл не перечитываем
+                pool.submit(
+                    generate_thumbnails, source, media_root, THUMBNAIL_SIZES, content_hash_from_name(source)
+                ): source
+                for source in sources
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except OSError as exc:
+                    failed += 1
+                    self.stderr.write(f"{futures[future]}: {exc}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Обработано изображений: {len(sources) - failed}, ошибок: {failed}"
+        ))
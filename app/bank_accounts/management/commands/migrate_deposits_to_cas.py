@@ -0,0 +1,64 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from bank_accounts.models import CardAccountModel, TransactionModel
+from bank_accounts.storage import content_addressed_name, content_hash_from_name
+from bank_accounts.thumbnails import file_hash, generate_upload_thumbnails
+
+
+class Command(BaseCommand):
+    help = "Переносит существующие файлы image_deposit в хранилище с адресацией по содержимому."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Только показать план переноса")
+
+    def handle(self, *args, **options):
+        field = TransactionModel._meta.get_field("image_deposit")
+        storage = field.storage
+        upload_dir = field.upload_to.rstrip("/")
+
+        names = (
+            TransactionModel.objects.filter(image_deposit__startswith=f"{upload_dir}/")
+            .values_list("image_deposit", flat=True).distinct().order_by("image_deposit")
+        )
+        moved = deduplicated = missing = 0
+        for name in list(names):
+            if content_hash_from_name(name):
+                continue
+            source = storage.path(name)
+            if not os.path.exists(source):
+                missing += 1
+                self.stderr.write(f"нет файла: {name}")
+                continue
+
+            digest = file_hash(source)
+            new_name = content_addressed_name(upload_dir, digest, name)
+            target = storage.path(new_name)
+            exists = os.path.exists(target)
+            self.stdout.write(f"{name} -> {new_name}" + (" (дубликат)" if exists else ""))
+            if options["dry_run"]:
+                continue
+
+            if exists:
+                deduplicated += 1
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.link(source, target)
+                moved += 1
+            # API выводит URL миниатюры из хэша в имени — она должна существовать
+            generate_upload_thumbnails(target, storage.location, digest)
+            with transaction.atomic():
+                rows = TransactionModel.objects.filter(image_deposit=name)
+                numbers = {number for pair in rows.values_list("from_card", "to_card") for number in pair}
+                # updated_at — чтобы ETag транзакций сменился вместе с URL файла
+                rows.update(image_deposit=new_name, updated_at=timezone.now())
+                # версия карт — ключ кэша превью ?transactions= со старыми URL
+                CardAccountModel.touch(CardAccountModel.objects.filter(card_number__in=numbers).values("pk"))
+            os.remove(source)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Перенесено: {moved}, совпало с существующими: {deduplicated}, без файла: {missing}"
+        ))
@@ -0,0 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from bank_accounts.models import CardAccountModel, CardPeriodSummary
+from bank_accounts.services import lock_cards
+
+
+def rebuild_chunk(card_numbers):
+    """
+    Пересчёт сводок порции карт в отдельной транзакции; карты блокируются так же,
+    как при проведении операций, поэтому параллельные проводки не теряются.
+    """
+    try:
+        with transaction.atomic():
+            lock_cards(card_numbers)
+            return CardPeriodSummary.objects.rebuild(card_numbers)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает сводки по картам за дни и месяцы из журнала проводок (параллельно, порциями)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=200, help="Карт в одной порции")
+        parser.add_argument("--workers", type=int, default=4, help="Параллельных потоков")
+
+    def handle(self, *args, **options):
+        numbers = list(CardAccountModel.objects.order_by("card_number").values_list("card_number", flat=True))
+        # сводки карт, которых больше нет в системе
+        CardPeriodSummary.objects.exclude(card_number__in=CardAccountModel.objects.values("card_number")).delete()
+        connection.close()
+
+        chunk_size = options["chunk_size"]
+        chunks = [numbers[index:index + chunk_size] for index in range(0, len(numbers), chunk_size)]
+        created = done = 0
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            for future in as_completed([pool.submit(rebuild_chunk, chunk) for chunk in chunks]):
+                created += future.result()
+                done += 1
+                self.stdout.write(f"… порций: {done}/{len(chunks)}, сводок: {created}")
+
+        self.stdout.write(self.style.SUCCESS(f"Готово, карт: {len(numbers)}, сводок: {created}"))
@@ -0,0 +1,18 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from bank_accounts.images import sample_images
+
+
+class Command(BaseCommand):
+    help = (
+        "Перестраивает манифест готовых изображений. Меняет mtime каталога, "
+        "чтобы рабочие процессы перечитали его при следующей проверке."
+    )
+
+    def handle(self, *args, **options):
+        if os.path.isdir(sample_images.path):
+            os.utime(sample_images.path)
+        choices = sample_images.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Изображений в манифесте: {len(choices)}"))
@@ -0,0 +1,234 @@
+"""
+Метрики запросов по именам URL: длительность, число запросов к БД, время в БД и размер ответа.
+
+Гистограммы копятся в памяти процесса (у каждого воркера gunicorn — свои) и отдаются
+в текстовом формате Prometheus. Медленные запросы пишутся в лог вместе с самыми долгими SQL.
+
+Запросы к БД считает обёртка, которая ставится на каждое соединение при его создании
+(record_queries, сигнал connection_created), а счётчик текущего запроса лежит в contextvar:
+так учитываются и запросы из потоков sync_to_async у асинхронных представлений.
+"""
+import contextvars
+import hmac
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+METRICS = (
+    # имя, описание, границы корзин
+    ("bank_accounts_request_duration_seconds", "Время обработки запроса", DURATION_BUCKETS),
+    ("bank_accounts_request_db_queries", "Запросов к БД на запрос", QUERY_BUCKETS),
+    ("bank_accounts_request_db_duration_seconds", "Время в БД на запрос", DURATION_BUCKETS),
+    ("bank_accounts_response_size_bytes", "Размер тела ответа", SIZE_BUCKETS),
+)
+
+WORST_QUERIES = 3
+# длиннее в лог не пишем: многострочный INSERT пакетной загрузки — десятки КБ плейсхолдеров
+SLOW_LOG_SQL_CHARS = 500
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последняя корзина — +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, view, method, values):
+        """
+        values — значения в порядке METRICS; None (например, размер потокового ответа) пропускается.
+        """
+        with self._lock:
+            histograms = self._series.get((view, method))
+            if histograms is None:
+                histograms = self._series[(view, method)] = [Histogram(buckets) for _, _, buckets in METRICS]
+            for histogram, value in zip(histograms, values):
+                if value is not None:
+                    histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        """
+        Текстовый формат экспозиции Prometheus 0.0.4.
+        """
+        with self._lock:
+            series = sorted(self._series.items())
+            lines = []
+            for index, (name, help_text, buckets) in enumerate(METRICS):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for (view, method), histograms in series:
+                    histogram = histograms[index]
+                    labels = f'view="{_escape(view)}",method="{method}"'
+                    cumulative = 0
+                    for bound, count in zip((*buckets, "+Inf"), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f"{name}_sum{{{labels}}} {histogram.total}")
+                    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = Registry()
+
+
+class QueryRecorder:
+    """
+    Запросы к БД одного HTTP-запроса: число, время в БД и самые долгие.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.duration = 0.0
+        self.worst = []
+
+    def add(self, elapsed, sql):
+        with self._lock:
+            self.count += 1
+            self.duration += elapsed
+            self.worst.append((elapsed, sql))
+            if len(self.worst) > WORST_QUERIES:
+                self.worst.sort(reverse=True)
+                self.worst.pop()
+
+
+_recorder = contextvars.ContextVar("bank_accounts_query_recorder", default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.add(time.perf_counter() - started, sql)
+
+
+def record_queries(sender, connection, **kwargs):
+    """
+    connection_created: обёртка учёта запросов на соединении любого потока.
+    """
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _view_name(request):
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match else "unresolved"
+
+
+def _short_sql(sql):
+    return sql if len(sql) <= SLOW_LOG_SQL_CHARS else sql[:SLOW_LOG_SQL_CHARS] + "…"
+
+
+def _slow_request_seconds():
+    return getattr(settings, "METRICS_SLOW_REQUEST_MS", 500) / 1000
+
+
+class MetricsMiddleware:
+    """
+    Снимает метрики с каждого запроса. Ставить первым в MIDDLEWARE, чтобы учесть всю обработку.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        token = _recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        self.record(request, response, recorder, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        # sync_to_async копирует контекст в поток — запросы ORM оттуда попадают в этот же счётчик
+        recorder = QueryRecorder()
+        token = _recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        self.record(request, response, recorder, time.perf_counter() - started)
+        return response
+
+    def record(self, request, response, recorder, duration):
+        view = _view_name(request)
+        size = None if response.streaming else len(response.content)
+        registry.observe(view, request.method, (duration, recorder.count, recorder.duration, size))
+
+        if duration >= _slow_request_seconds():
+            worst = "\n".join(
+                f"    {elapsed * 1000:.1f}ms {_short_sql(sql)}" for elapsed, sql in sorted(recorder.worst, reverse=True)
+            )
+            logger.warning(
+                "Медленный запрос %s %s (%s): %.0fms, запросов к БД: %d, в БД: %.0fms\n%s",
+                request.method, request.get_full_path(), view, duration * 1000,
+                recorder.count, recorder.duration * 1000, worst,
+            )
+
+
+def _has_metrics_token(request):
+    token = getattr(settings, "METRICS_TOKEN", None)
+    if not token:
+        return False
+    header = request.headers.get("Authorization", "")
+    return hmac.compare_digest(header.encode(), f"Bearer {token}".encode())
+
+
+def metrics_view(request):
+    """
+    Метрики для Prometheus. Доступ — для staff, по METRICS_TOKEN или с адресов из METRICS_ALLOWED_IPS.
+    """
+    if not (
+        request.user.is_staff
+        or _has_metrics_token(request)
+        or request.META.get("REMOTE_ADDR") in getattr(settings, "METRICS_ALLOWED_IPS", ())
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image_deposit', models.ImageField(blank=True, null=True, upload_to='transactions/deposits/', verbose_name='Изображение при пополнении')),
+                ('image_withdraw', models.CharField(blank=True, max_length=255, null=True, verbose_name='Изображение при списании')),
+                ('cardholder_name', models.CharField(blank=True, default='', max_length=64, null=True, verbose_name='Инициатор операции')),
+                ('to_user', models.CharField(blank=True, default='', max_length=32, null=True, verbose_name='Получатель')),
+                ('bank', models.CharField(choices=[('mono', 'Monobank'), ('privat', 'PrivatBank'), ('oschad', 'Oschadbank'), ('raiff', 'Raiffeisen Bank'), ('pumb', 'PUMB'), ('abank', 'A-Bank'), ('izibank', 'Izibank'), ('sense', 'Sense Bank'), ('ukrsib', 'Ukrsibbank'), ('others', 'Другой')], default='mono', max_length=16, verbose_name='Банк')),
+                ('from_card', models.CharField(blank=True, max_length=16, null=True, verbose_name='Карта отправителя')),
+                ('to_card', models.CharField(blank=True, max_length=16, null=True, verbose_name='Карта получателя')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Сумма')),
+                ('operation_type', models.CharField(choices=[('deposit', 'Пополнение'), ('withdraw', 'Списание'), ('external', 'Внешняя операция')], editable=False, max_length=10, verbose_name='Тип операции')),
+                ('balance_after', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Баланс после транзакции')),
+                ('timestamp', models.DateTimeField(auto_now_add=True, verbose_name='Дата и время')),
+                ('comment', models.TextField(blank=True, default='', null=True, verbose_name='Комментарий')),
+            ],
+            options={
+                'verbose_name': 'Транзакция',
+                'verbose_name_plural': 'Транзакции',
+            },
+        ),
+        migrations.CreateModel(
+            name='CardAccountModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('card_number', models.CharField(db_index=True, max_length=16, unique=True, verbose_name='Номер карты')),
+                ('expiration_date', models.DateField(verbose_name='Срок действия')),
+                ('cvv', models.CharField(max_length=4, verbose_name='CVV код')),
+                ('balance', models.DecimalField(decimal_places=2, default=0.0, max_digits=10, verbose_name='Баланс')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='card_accounts', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Банковская карта',
+                'verbose_name_plural': 'Банковские карты',
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transactionmodel',
+            index=models.Index(fields=['-timestamp', '-id'], name='tx_timestamp_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transactionmodel',
+            index=models.Index(fields=['from_card', '-timestamp'], name='tx_from_card_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transactionmodel',
+            index=models.Index(fields=['to_card', '-timestamp'], name='tx_to_card_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transactionmodel',
+            index=models.Index(fields=['operation_type', '-timestamp'], name='tx_operation_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transactionmodel',
+            index=models.Index(fields=['bank', '-timestamp'], name='tx_bank_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_accounts', '0002_transaction_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CardLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('card_number', models.CharField(max_length=16, verbose_name='Номер карты')),
+                ('leg', models.CharField(choices=[('debit', 'Списание'), ('credit', 'Зачисление')], max_length=6, verbose_name='Сторона проводки')),
+                ('timestamp', models.DateTimeField(verbose_name='Дата и время')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Сумма со знаком')),
+                ('balance_after', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Баланс после транзакции')),
+                ('transaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='bank_accounts.transactionmodel', verbose_name='Транзакция')),
+            ],
+            options={
+                'verbose_name': 'Проводка по карте',
+                'verbose_name_plural': 'Журнал по картам',
+                'indexes': [models.Index(fields=['card_number', '-timestamp', '-transaction'], name='ledger_card_ts_idx')],
+                'constraints': [models.UniqueConstraint(fields=('transaction', 'leg'), name='ledger_transaction_leg_uniq')],
+            },
+        ),
+    ]
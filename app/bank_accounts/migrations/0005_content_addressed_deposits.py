@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:00
+
+import bank_accounts.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_accounts', '0004_card_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transactionmodel',
+            name='image_deposit',
+            field=models.ImageField(blank=True, null=True, storage=bank_accounts.storage.deposit_storage, upload_to='transactions/deposits/', verbose_name='Изображение при пополнении'),
+        ),
+    ]
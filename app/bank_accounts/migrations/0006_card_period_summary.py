@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_accounts', '0005_content_addressed_deposits'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CardPeriodSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('card_number', models.CharField(max_length=16, verbose_name='Номер карты')),
+                ('period', models.CharField(choices=[('day', 'День'), ('month', 'Месяц')], max_length=5, verbose_name='Период')),
+                ('period_start', models.DateField(verbose_name='Начало периода')),
+                ('inflow', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Приход')),
+                ('outflow', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Расход')),
+                ('transactions_count', models.PositiveIntegerField(default=0, verbose_name='Проводок')),
+                ('closing_at', models.DateTimeField(blank=True, null=True, verbose_name='Последняя проводка')),
+                ('closing_balance', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Баланс на конец периода')),
+            ],
+            options={
+                'verbose_name': 'Сводка по карте',
+                'verbose_name_plural': 'Сводки по картам',
+                'constraints': [models.UniqueConstraint(fields=('card_number', 'period', 'period_start'), name='summary_card_period_uniq')],
+            },
+        ),
+    ]
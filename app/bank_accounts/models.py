@@ -1,6 +1,13 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models.functions import RowNumber, TruncDate, TruncMonth
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
+from bank_accounts.storage import deposit_storage
 
 
 class CardAccountModel(models.Model):
@@ -24,18 +31,43 @@ class CardAccountModel(models.Model):
         default=0.00,
         verbose_name=_("Баланс")
     )
+    # растут при каждом изменении баланса или операций карты — основа ETag/Last-Modified
+    version = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name=_("Версия")
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name=_("Изменено")
+    )
 
     class Meta:
         verbose_name = _("Банковская карта")
         verbose_name_plural = _("Банковские карты")
 
+    def save(self, *args, **kwargs):
+        self.version += 1
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.card_number
 
+    @classmethod
+    def touch(cls, pks):
+        """
+        Новая версия карт без изменения баланса (например, правка операции в админке).
+        """
+        return cls.objects.filter(pk__in=pks).update(
+            version=models.F("version") + 1,
+            updated_at=timezone.now(),
+        )
+
 
 class TransactionModel(models.Model):
     image_deposit = models.ImageField(
         upload_to='transactions/deposits/',
+        storage=deposit_storage,
         null=True,
         blank=True,
         verbose_name=_("Изображение при пополнении")
@@ -116,6 +148,10 @@ class TransactionModel(models.Model):
         auto_now_add=True,
         verbose_name=_("Дата и время")
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name=_("Изменено")
+    )
     comment = models.TextField(
         null=True,
         blank=True,
@@ -126,21 +162,466 @@ class TransactionModel(models.Model):
     class Meta:
         verbose_name = _("Транзакция")
         verbose_name_plural = _("Транзакции")
+        indexes = [
+            models.Index(fields=["-timestamp", "-id"], name="tx_timestamp_id_idx"),
+            models.Index(fields=["from_card", "-timestamp"], name="tx_from_card_ts_idx"),
+            models.Index(fields=["to_card", "-timestamp"], name="tx_to_card_ts_idx"),
+            models.Index(fields=["operation_type", "-timestamp"], name="tx_operation_ts_idx"),
+            models.Index(fields=["bank", "-timestamp"], name="tx_bank_ts_idx"),
+        ]
 
-    def save(self, *args, **kwargs):
-        if CardAccountModel.objects.filter(card_number=self.to_card).exists():
+    def classify(self, balances):
+        """
+        Тип операции и баланс после неё по картам, известным системе.
+        balances — {card_number: баланс после проведения операции}.
+        """
+        if self.to_card in balances:
             self.operation_type = "deposit"
-            card = CardAccountModel.objects.get(card_number=self.to_card)
-            self.balance_after = card.balance
-        elif CardAccountModel.objects.filter(card_number=self.from_card).exists():
+            self.balance_after = balances[self.to_card]
+        elif self.from_card in balances:
             self.operation_type = "withdraw"
-            card = CardAccountModel.objects.get(card_number=self.from_card)
-            self.balance_after = card.balance
+            self.balance_after = balances[self.from_card]
         else:
             self.operation_type = "external"
             self.balance_after = None
 
-        super().save(*args, **kwargs)
+    def build_ledger_entries(self, balances):
+        """
+        Проводки по картам: дебет для from_card и кредит для to_card.
+        balances — {card_number: баланс после проведения операции}.
+        """
+        entries = []
+        for card_number, leg, amount in (
+            (self.from_card, "debit", -self.amount),
+            (self.to_card, "credit", self.amount),
+        ):
+            if not card_number:
+                continue
+            entries.append(CardLedgerEntry(
+                transaction=self,
+                card_number=card_number,
+                leg=leg,
+                timestamp=self.timestamp,
+                amount=amount,
+                balance_after=balances.get(card_number),
+            ))
+        return entries
+
+    def historical_balances(self, cards, entries):
+        """
+        Балансы карт после этой операции на момент её проведения — для правки уже проведённой
+        операции (правка балансы карт не меняет). Берутся из её прежних проводок; для карты,
+        которой в них нет, — баланс на self.timestamp по журналу.
+        """
+        from bank_accounts.services import balance_as_of
+
+        stored = {entry.card_number: entry.balance_after for entry in entries if entry.balance_after is not None}
+        return {
+            number: stored[number] if number in stored else balance_as_of(card, self.timestamp)
+            for number, card in cards.items()
+            if number in (self.from_card, self.to_card)
+        }
+
+    def save(self, *args, cards=None, **kwargs):
+        """
+        cards — {card_number: CardAccountModel}, если вызывающий код уже получил карты
+        (например, заблокировал их при проведении); иначе обе карты читаются одним запросом.
+        """
+        numbers = [number for number in (self.from_card, self.to_card) if number]
+        # при проведении (services) версию карт уже подняло изменение баланса
+        posted = cards is not None
+        # операция и её проводки пишутся в одной транзакции БД
+        with transaction.atomic(savepoint=False):
+            if cards is None:
+                cards = CardAccountModel.objects.in_bulk(numbers, field_name="card_number")
+            adding = self._state.adding
+            if adding:
+                balances = {number: cards[number].balance for number in numbers if number in cards}
+            else:
+                old_entries = list(self.ledger_entries.all())
+                balances = self.historical_balances(cards, old_entries)
+            self.classify(balances)
+
+            super().save(*args, **kwargs)
+
+            if not adding:
+                CardPeriodSummary.objects.retract(old_entries)
+                self.ledger_entries.all().delete()
+            if not adding or not posted:
+                # превью транзакций карт изменилось — новая версия меняет ETag и ключ их кэша
+                CardAccountModel.touch([cards[number].pk for number in numbers if number in cards])
+            CardLedgerEntry.objects.record(self.build_ledger_entries(balances))
 
     def __str__(self):
         return f"Транзакция {self.id}: {self.amount} ({self.get_operation_type_display()})"
+
+
+class CardLedgerManager(models.Manager):
+    def record(self, entries):
+        """
+        Запись проводок; вызывается внутри той же транзакции БД, что и сохранение операции.
+        Сводки по периодам (CardPeriodSummary) обновляются тут же.
+
+        Строки вставляются многострочным INSERT без RETURNING: id проводок не нужны, а
+        построчная подготовка значений в bulk_create — половина времени пакетной загрузки.
+        """
+        connection = connections[self.db]
+        ops, qn = connection.ops, connection.ops.quote_name
+        columns = ("transaction_id", "card_number", "leg", "timestamp", "amount", "balance_after")
+        batch_size = ops.bulk_batch_size([self.model._meta.get_field(column) for column in columns], entries)
+        row_sql = "(" + ", ".join(["%s"] * len(columns)) + ")"
+        with connection.cursor() as cursor:
+            for start in range(0, len(entries), batch_size):
+                batch = entries[start:start + batch_size]
+                params = []
+                for entry in batch:
+                    params += [
+                        entry.transaction_id,
+                        entry.card_number,
+                        entry.leg,
+                        ops.adapt_datetimefield_value(entry.timestamp),
+                        ops.adapt_decimalfield_value(entry.amount),
+                        ops.adapt_decimalfield_value(entry.balance_after),
+                    ]
+                cursor.execute(
+                    f"INSERT INTO {qn(self.model._meta.db_table)} ({', '.join(map(qn, columns))}) "
+                    f"VALUES {', '.join([row_sql] * len(batch))}",
+                    params,
+                )
+        CardPeriodSummary.objects.add(entries)
+        return entries
+
+
+class CardLedgerEntry(models.Model):
+    """
+    Денормализованный журнал: одна строка на каждую карту-участника операции.
+    История карты читается одним проходом по индексу (card_number, timestamp DESC).
+    """
+    transaction = models.ForeignKey(
+        TransactionModel,
+        on_delete=models.CASCADE,
+        related_name="ledger_entries",
+        verbose_name=_("Транзакция")
+    )
+    card_number = models.CharField(
+        max_length=16,
+        verbose_name=_("Номер карты")
+    )
+    leg = models.CharField(
+        max_length=6,
+        choices=(
+            ("debit", _("Списание")),
+            ("credit", _("Зачисление")),
+        ),
+        verbose_name=_("Сторона проводки")
+    )
+    timestamp = models.DateTimeField(verbose_name=_("Дата и время"))
+    amount = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        verbose_name=_("Сумма со знаком")
+    )
+    balance_after = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        verbose_name=_("Баланс после транзакции")
+    )
+
+    objects = CardLedgerManager()
+
+    class Meta:
+        verbose_name = _("Проводка по карте")
+        verbose_name_plural = _("Журнал по картам")
+        constraints = [
+            models.UniqueConstraint(fields=["transaction", "leg"], name="ledger_transaction_leg_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["card_number", "-timestamp", "-transaction"], name="ledger_card_ts_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.card_number}: {self.amount}"
+
+
+SUMMARY_PERIODS = ("day", "month")
+
+
+def period_start(period, moment):
+    """
+    Начало дня или месяца (по TIME_ZONE), в который попадает момент.
+    """
+    day = timezone.localtime(moment).date()
+    return day.replace(day=1) if period == "month" else day
+
+
+def period_bounds(period, start):
+    """
+    [начало, конец) периода как aware datetime.
+    """
+    if period == "month":
+        end = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    else:
+        end = start + timedelta(days=1)
+    return (
+        timezone.make_aware(datetime.combine(start, time.min)),
+        timezone.make_aware(datetime.combine(end, time.min)),
+    )
+
+
+def summarize_ledger_entries(entries):
+    """
+    Свёртка проводок по (card_number, period, period_start):
+    [приход, расход, проводок, время последней проводки с балансом, баланс после неё].
+    Учитываются только карты системы — у их проводок известен balance_after.
+    """
+    rows = defaultdict(lambda: [Decimal("0"), Decimal("0"), 0, None, None])
+    for entry in entries:
+        if entry.balance_after is None:
+            continue
+        for period in SUMMARY_PERIODS:
+            row = rows[(entry.card_number, period, period_start(period, entry.timestamp))]
+            if entry.amount >= 0:
+                row[0] += entry.amount
+            else:
+                row[1] -= entry.amount
+            row[2] += 1
+            if row[3] is None or entry.timestamp >= row[3]:
+                row[3], row[4] = entry.timestamp, entry.balance_after
+    return dict(sorted(rows.items()))
+
+
+class CardPeriodSummaryManager(models.Manager):
+    def add(self, entries):
+        """
+        Добавляет проводки к сводкам одним INSERT ... ON CONFLICT DO UPDATE (SQLite, PostgreSQL):
+        суммы и счётчик увеличиваются, баланс на конец берётся у более поздней проводки.
+        """
+        rows = summarize_ledger_entries(entries)
+        if not rows:
+            return
+        connection = connections[self.db]
+        ops, qn = connection.ops, connection.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        columns = (
+            "card_number", "period", "period_start", "inflow", "outflow",
+            "transactions_count", "closing_at", "closing_balance",
+        )
+        params = []
+        for (card_number, period, start), (inflow, outflow, count, closing_at, closing_balance) in rows.items():
+            params += [
+                card_number,
+                period,
+                ops.adapt_datefield_value(start),
+                ops.adapt_decimalfield_value(inflow),
+                ops.adapt_decimalfield_value(outflow),
+                count,
+                ops.adapt_datetimefield_value(closing_at),
+                ops.adapt_decimalfield_value(closing_balance),
+            ]
+        later = f"{table}.{qn('closing_at')} IS NULL OR excluded.{qn('closing_at')} >= {table}.{qn('closing_at')}"
+        values = ", ".join(["(" + ", ".join(["%s"] * len(columns)) + ")"] * len(rows))
+        sql = (
+            f"INSERT INTO {table} ({', '.join(map(qn, columns))}) VALUES {values} "
+            f"ON CONFLICT ({qn('card_number')}, {qn('period')}, {qn('period_start')}) DO UPDATE SET "
+            + ", ".join(
+                f"{qn(column)} = {table}.{qn(column)} + excluded.{qn(column)}"
+                for column in ("inflow", "outflow", "transactions_count")
+            )
+            + "".join(
+                f", {qn(column)} = CASE WHEN {later} THEN excluded.{qn(column)} ELSE {table}.{qn(column)} END"
+                for column in ("closing_balance", "closing_at")
+            )
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def retract(self, entries):
+        """
+        Убирает проводки из сводок (правка или удаление операции). Вызывать до удаления
+        самих проводок: баланс на конец периода пересчитывается по оставшимся.
+        """
+        rows = summarize_ledger_entries(entries)
+        removed = [entry.pk for entry in entries]
+        for (card_number, period, start), (inflow, outflow, count, *_closing) in rows.items():
+            summary = self.filter(card_number=card_number, period=period, period_start=start)
+            summary.filter(transactions_count__lte=count).delete()
+            begin, end = period_bounds(period, start)
+            latest = (
+                CardLedgerEntry.objects.filter(
+                    card_number=card_number,
+                    timestamp__gte=begin,
+                    timestamp__lt=end,
+                    balance_after__isnull=False,
+                )
+                .exclude(pk__in=removed)
+                .order_by("-timestamp", "-transaction_id")
+                .values_list("timestamp", "balance_after")
+                .first()
+            ) or (None, None)
+            summary.update(
+                inflow=models.F("inflow") - inflow,
+                outflow=models.F("outflow") - outflow,
+                transactions_count=models.F("transactions_count") - count,
+                closing_at=latest[0],
+                closing_balance=latest[1],
+            )
+
+    def rebuild(self, card_numbers):
+        """
+        Пересчитывает сводки карт с нуля по журналу проводок (агрегаты в БД).
+        Вызывать внутри transaction.atomic() с заблокированными картами. Возвращает число сводок.
+        """
+        self.filter(card_number__in=card_numbers).delete()
+        ledger = CardLedgerEntry.objects.filter(card_number__in=card_numbers)
+        summaries = []
+        for period, trunc in (("day", TruncDate("timestamp")), ("month", TruncMonth("timestamp", output_field=models.DateField()))):
+            closing = {
+                (row["card_number"], row["start"]): row
+                for row in ledger.filter(balance_after__isnull=False)
+                .annotate(
+                    start=trunc,
+                    position=models.Window(
+                        RowNumber(),
+                        partition_by=[models.F("card_number"), trunc],
+                        order_by=[models.F("timestamp").desc(), models.F("transaction_id").desc()],
+                    ),
+                )
+                .filter(position=1)
+                .values("card_number", "start", "timestamp", "balance_after")
+            }
+            totals = (
+                ledger.annotate(start=trunc)
+                .values("card_number", "start")
+                .annotate(
+                    inflow=models.Sum("amount", filter=models.Q(amount__gte=0), default=Decimal("0")),
+                    outflow=models.Sum("amount", filter=models.Q(amount__lt=0), default=Decimal("0")),
+                    count=models.Count("id"),
+                )
+                .order_by()
+            )
+            for row in totals:
+                last = closing.get((row["card_number"], row["start"]), {})
+                summaries.append(self.model(
+                    card_number=row["card_number"],
+                    period=period,
+                    period_start=row["start"],
+                    inflow=row["inflow"],
+                    outflow=-row["outflow"],
+                    transactions_count=row["count"],
+                    closing_at=last.get("timestamp"),
+                    closing_balance=last.get("balance_after"),
+                ))
+        self.bulk_create(summaries, batch_size=1000)
+        return len(summaries)
+
+
+class CardPeriodSummary(models.Model):
+    """
+    Итоги карты за день или месяц: приход, расход, число проводок и баланс на конец периода.
+    Обновляются вместе с журналом проводок, выписка за N периодов читается из N строк.
+    """
+    card_number = models.CharField(
+        max_length=16,
+        verbose_name=_("Номер карты")
+    )
+    period = models.CharField(
+        max_length=5,
+        choices=(
+            ("day", _("День")),
+            ("month", _("Месяц")),
+        ),
+        verbose_name=_("Период")
+    )
+    period_start = models.DateField(verbose_name=_("Начало периода"))
+    inflow = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name=_("Приход")
+    )
+    outflow = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name=_("Расход")
+    )
+    transactions_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_("Проводок")
+    )
+    closing_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name=_("Последняя проводка")
+    )
+    closing_balance = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        verbose_name=_("Баланс на конец периода")
+    )
+
+    objects = CardPeriodSummaryManager()
+
+    class Meta:
+        verbose_name = _("Сводка по карте")
+        verbose_name_plural = _("Сводки по картам")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["card_number", "period", "period_start"], name="summary_card_period_uniq"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.card_number} {self.period} {self.period_start}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Ответ на POST с заголовком Idempotency-Key. Пока запрос выполняется, status_code пуст —
+    повтор с тем же ключом ждёт его завершения, после — получает сохранённый ответ.
+    Строки старше expires_at не действуют и удаляются cleanup_idempotency_keys.
+    """
+    scope = models.CharField(
+        max_length=64,
+        verbose_name=_("Владелец ключа")
+    )
+    key = models.CharField(
+        max_length=255,
+        verbose_name=_("Ключ")
+    )
+    request_hash = models.CharField(
+        max_length=64,
+        verbose_name=_("Хэш запроса")
+    )
+    status_code = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        verbose_name=_("Код ответа")
+    )
+    response_body = models.JSONField(
+        null=True,
+        blank=True,
+        verbose_name=_("Тело ответа")
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_("Создан")
+    )
+    expires_at = models.DateTimeField(verbose_name=_("Действует до"))
+
+    class Meta:
+        verbose_name = _("Ключ идемпотентности")
+        verbose_name_plural = _("Ключи идемпотентности")
+        constraints = [
+            models.UniqueConstraint(fields=["scope", "key"], name="idempotency_scope_key_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["expires_at"], name="idempotency_expires_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key}"
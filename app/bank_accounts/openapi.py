@@ -0,0 +1,17 @@
+"""
+Расширения схемы drf-spectacular для классов проекта.
+
+Модуль задан в REST_FRAMEWORK["DEFAULT_SCHEMA_CLASS"]: extend_schema импортирует его
+вместе с представлениями, так что расширения зарегистрированы к любой генерации схемы.
+"""
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from drf_spectacular.openapi import AutoSchema as SpectacularAutoSchema
+
+
+class AutoSchema(SpectacularAutoSchema):
+    pass
+
+
+class CachedJWTScheme(SimpleJWTScheme):
+    # расширения drf-spectacular не наследуются подклассами — схема безопасности та же, что у simplejwt
+    target_class = "bank_accounts.authentication.CachedJWTAuthentication"
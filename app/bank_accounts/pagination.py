@@ -0,0 +1,124 @@
+from django.core.paginator import EmptyPage, Page, Paginator
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination
+
+from bank_accounts.db import estimate_row_count
+
+
+class TransactionCursorPagination(CursorPagination):
+    """
+    Курсорная (keyset) пагинация по (timestamp, id).
+    Страница выбирается по индексу, поэтому её стоимость не зависит от того,
+    насколько глубоко клиент пролистал историю.
+    """
+    ordering = ("-timestamp", "-id")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+
+class CardLedgerCursorPagination(TransactionCursorPagination):
+    """
+    История карты по журналу проводок: диапазон индекса (card_number, timestamp DESC).
+    """
+    ordering = ("-timestamp", "-transaction_id")
+
+
+class EstimatedPage(Page):
+    """
+    Страница при неточном числе строк: есть ли следующая, известно по лишней строке выборки.
+    """
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+    def end_index(self):
+        return self.start_index() + len(self.object_list) - 1 if self.object_list else 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator для больших таблиц в админке: без фильтров число строк берётся из статистики БД
+    (estimate_row_count), с фильтрами считается не дальше count_limit строк — COUNT(*)
+    по всей таблице на каждой странице не выполняется.
+
+    Если число неточное (оценка или больше count_limit), номер страницы не ограничивается
+    им: страница существует, пока в ней есть строки, и ссылки ведут до следующей страницы
+    («…» дальше), а не на «последнюю» по оценке — она может оказаться пустой.
+    """
+    count_limit = 10000
+
+    @cached_property
+    def _counted(self):
+        # (число строк, точное ли оно)
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.count_limit:
+                return estimate, False
+        count = queryset[:self.count_limit + 1].count()
+        if count > self.count_limit:
+            return self.count_limit, False
+        return count, True
+
+    @cached_property
+    def count(self):
+        return self._counted[0]
+
+    @cached_property
+    def count_is_exact(self):
+        return self._counted[1]
+
+    @cached_property
+    def count_label(self):
+        """
+        Число строк для шаблона: «10000+» при пороге, «≈N» при оценке по статистике.
+        """
+        count, exact = self._counted
+        if exact:
+            return str(count)
+        return f"{count}+" if count == self.count_limit else f"≈{count}"
+
+    @cached_property
+    def _pages(self):
+        return {}
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            number = int(number)
+            if self.count_is_exact or number < 1:
+                raise
+            return number
+
+    def page(self, number):
+        if self.count_is_exact:
+            return super().page(number)
+        number = self.validate_number(number)
+        if number not in self._pages:
+            bottom = (number - 1) * self.per_page
+            rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+            if not rows and number > 1:
+                raise EmptyPage(self.error_messages["no_results"])
+            self._pages[number] = EstimatedPage(rows[:self.per_page], number, self, len(rows) > self.per_page)
+        return self._pages[number]
+
+    def get_elided_page_range(self, number=1, *, on_each_side=3, on_ends=2):
+        if self.count_is_exact:
+            yield from super().get_elided_page_range(number, on_each_side=on_each_side, on_ends=on_ends)
+            return
+        number = self.validate_number(number)
+        if number > (1 + on_each_side + on_ends) + 1:
+            yield from range(1, on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if self.page(number).has_next():
+            yield number + 1
+            yield self.ELLIPSIS
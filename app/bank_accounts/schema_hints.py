@@ -0,0 +1,29 @@
+"""
+Подсказки схемы для представлений: extend_schema, OpenApiParameter и OpenApiTypes.
+
+С документацией (API_DOCS_ENABLED) это объекты drf-spectacular. Без неё drf-spectacular
+не импортируется вовсе: extend_schema возвращает представление без изменений, а параметры
+только хранят аргументы — схему в таком процессе никто не строит.
+"""
+from django.conf import settings
+
+if getattr(settings, "API_DOCS_ENABLED", True):
+    from drf_spectacular.types import OpenApiTypes
+    from drf_spectacular.utils import OpenApiParameter, extend_schema
+else:
+    class OpenApiTypes:
+        STR = str
+
+    class OpenApiParameter:
+        QUERY = "query"
+        PATH = "path"
+        HEADER = "header"
+        COOKIE = "cookie"
+
+        def __init__(self, name, *args, **kwargs):
+            self.name = name
+            self.args = args
+            self.kwargs = kwargs
+
+    def extend_schema(*args, **kwargs):
+        return lambda view: view
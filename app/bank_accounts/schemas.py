@@ -0,0 +1,79 @@
+"""
+Построение схем OpenAPI: drf-spectacular (OpenAPI 3) и drf-yasg (Swagger 2.0).
+
+Модуль тяжёлый — импортирует генераторы и представления drf-yasg, поэтому загружается
+только когда схема действительно строится (bank_accounts.docs, build_api_schemas).
+"""
+import threading
+
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+from drf_yasg import openapi
+from drf_yasg.generators import OpenAPISchemaGenerator
+from drf_yasg.renderers import SwaggerJSONRenderer, SwaggerYAMLRenderer
+from drf_yasg.views import get_schema_view
+from rest_framework import permissions
+from rest_framework.request import Request
+
+API_INFO = openapi.Info(
+    title="Bank Accounts API",
+    default_version='v1',
+    description="Документация по API для карт и транзакций",
+    contact=openapi.Contact(email="support@example.com"),
+    license=openapi.License(name="BSD License"),
+)
+
+
+def schema_request():
+    """
+    Запрос, от которого строятся схемы: анонимный GET, как при открытии документации
+    без токена. Представления строят queryset от request.user, без запроса — падают.
+    """
+    request = Request(RequestFactory().get("/"))
+    request.user = AnonymousUser()
+    return request
+
+
+_lock = threading.Lock()
+_yasg_schemas = {}
+
+
+class CachedSchemaGenerator(OpenAPISchemaGenerator):
+    """
+    Генератор drf-yasg, который строит схему один раз на процесс, без привязки к хосту
+    запроса (host в схеме не указывается — клиенты берут хост, с которого её получили).
+    """
+
+    def __init__(self, info, version="", url=None, patterns=None, urlconf=None):
+        # пустой url, а не None: иначе host берётся из request.build_absolute_uri()
+        super().__init__(info, version, url or "", patterns, urlconf)
+
+    def get_schema(self, request=None, public=False):
+        key = (self.version, public)
+        with _lock:
+            if key not in _yasg_schemas:
+                _yasg_schemas[key] = super().get_schema(schema_request(), public)
+            return _yasg_schemas[key]
+
+
+schema_view = get_schema_view(
+    API_INFO,
+    public=True,
+    permission_classes=(permissions.AllowAny,),
+    generator_class=CachedSchemaGenerator,
+)
+
+
+def render_spectacular(fmt):
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    schema = generator.get_schema(request=schema_request(), public=spectacular_settings.SERVE_PUBLIC)
+    renderer = OpenApiJsonRenderer() if fmt == "json" else OpenApiYamlRenderer()
+    return renderer.render(schema, renderer_context={})
+
+
+def render_yasg(fmt):
+    schema = CachedSchemaGenerator(API_INFO, version="").get_schema(public=True)
+    renderer = SwaggerJSONRenderer() if fmt == "json" else SwaggerYAMLRenderer()
+    return renderer.render(schema)
@@ -1,36 +1,169 @@
+import decimal
+from collections import defaultdict
 from rest_framework import serializers
-from django.db import models
+from rest_framework.settings import api_settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.encoding import filepath_to_uri, iri_to_uri
+from django.db.models.expressions import RawSQL
 from django.contrib.auth.models import User
-from bank_accounts.models import CardAccountModel, TransactionModel
+from bank_accounts.models import CardAccountModel, CardLedgerEntry, CardPeriodSummary, TransactionModel
+from bank_accounts.thumbnails import thumbnail_url
+from bank_accounts.services import InsufficientFunds, post_transaction
 
 
 class TransactionSerializer(serializers.ModelSerializer):
+    image_deposit_thumbnail = serializers.SerializerMethodField()
+
     class Meta:
         model = TransactionModel
-        fields = "__all__"
+        exclude = ("updated_at",)
         read_only_fields = ("operation_type", "timestamp", "balance_after")
 
+    def get_image_deposit_thumbnail(self, obj):
+        if not obj.image_deposit:
+            return None
+        return thumbnail_url(obj.image_deposit.name)
+
     def create(self, validated_data):
         amount = validated_data.get("amount")
-        from_card = validated_data.get("from_card")
-        to_card_number = validated_data.get("to_card")
 
         if amount <= 0:
             raise serializers.ValidationError("Amount must be greater than 0.")
 
-        to_card = CardAccountModel.objects.filter(card_number=to_card_number).first()
-        if to_card:
-            to_card.balance += amount
-            to_card.save()
+        try:
+            return post_transaction(TransactionModel(**validated_data))
+        except InsufficientFunds:
+            raise serializers.ValidationError("Insufficient funds for withdrawal.")
+
+
+class TransactionRowSerializer:
+    """
+    Быстрый сериализатор списков транзакций только для чтения: работает со словарями
+    из .values() без создания моделей. Преобразователи полей готовятся один раз на запрос
+    по полям TransactionSerializer, поэтому вывод совпадает с ним байт в байт.
+    """
+
+    serializer_class = TransactionSerializer
+    # вычисляемые поля с быстрым преобразователем: имя -> (поле строки, метод-фабрика);
+    # остальные SerializerMethodField считаются методом сериализатора на модели из строки
+    method_converters = {"image_deposit_thumbnail": ("image_deposit", "_thumbnail_converter")}
+
+    def __init__(self, rows, context=None):
+        self.rows = rows
+        self.context = context or {}
+
+    @classmethod
+    def source_fields(cls):
+        """
+        Поля для .values(): все поля сериализатора, кроме вычисляемых.
+        """
+        return [
+            field.source
+            for field in cls.serializer_class().fields.values()
+            if not isinstance(field, serializers.SerializerMethodField)
+        ]
+
+    def get_converters(self):
+        """
+        [(имя, поле строки, преобразователь), ...]; поле строки None — преобразователь
+        получает всю строку (вычисляемые поля).
+        """
+        fields = self.serializer_class(context=self.context).fields
+        converters = []
+        for name, field in fields.items():
+            if name in self.method_converters:
+                source, factory = self.method_converters[name]
+                converters.append((name, source, getattr(self, factory)()))
+            elif isinstance(field, serializers.SerializerMethodField):
+                converters.append((name, None, self._method_converter(field)))
+            else:
+                converters.append((name, field.source, self._converter(field)))
+        return converters
+
+    def _method_converter(self, field):
+        # прочие вычисляемые поля — тем же методом сериализатора, на модели, собранной из строки
+        model = self.serializer_class.Meta.model
+        return lambda row: field.to_representation(model(**row))
+
+    def _converter(self, field):
+        if (
+            isinstance(field, serializers.DecimalField)
+            and getattr(field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING)
+            and not field.localize
+            and field.decimal_places is not None
+        ):
+            # то же округление, что DecimalField.quantize, без копирования контекста на каждое значение
+            exponent = decimal.Decimal(".1") ** field.decimal_places
+            context = decimal.getcontext().copy()
+            if field.max_digits is not None:
+                context.prec = field.max_digits
+            rounding = field.rounding
+            return lambda value: "{:f}".format(value.quantize(exponent, rounding=rounding, context=context))
+
+        if isinstance(field, serializers.DateTimeField) and (
+            getattr(field, "format", api_settings.DATETIME_FORMAT) or ""
+        ).lower() == "iso-8601":
+            field_timezone = field.timezone if hasattr(field, "timezone") else field.default_timezone()
 
-        from_card_acc = CardAccountModel.objects.filter(card_number=from_card).first()
-        if from_card_acc:
-            if from_card_acc.balance < amount:
-                raise serializers.ValidationError("Insufficient funds for withdrawal.")
-            from_card_acc.balance -= amount
-            from_card_acc.save()
+            def datetime_value(value):
+                if value.tzinfo is None:
+                    return field.to_representation(value)
+                if field_timezone is not None:
+                    value = value.astimezone(field_timezone)
+                value = value.isoformat()
+                return value[:-6] + "Z" if value.endswith("+00:00") else value
 
-        return TransactionModel.objects.create(**validated_data)
+            return datetime_value
+
+        if isinstance(field, serializers.ImageField) and getattr(field, "use_url", api_settings.UPLOADED_FILES_USE_URL):
+            return self._image_url_converter(field)
+
+        if type(field) in (serializers.CharField, serializers.ChoiceField, serializers.IntegerField):
+            if isinstance(field, serializers.ChoiceField):
+                choices = field.choice_strings_to_values
+                return lambda value: value if value == "" else choices.get(str(value), value)
+            return str if isinstance(field, serializers.CharField) else int
+
+        return field.to_representation
+
+    def _image_url_converter(self, field):
+        storage = TransactionModel._meta.get_field(field.source).storage
+        request = self.context.get("request")
+        if isinstance(storage, FileSystemStorage):
+            # префикс MEDIA (вместе со схемой и хостом запроса) считается один раз
+            prefix = request.build_absolute_uri(storage.base_url) if request else storage.base_url
+            return lambda name: iri_to_uri(prefix + filepath_to_uri(name).lstrip("/")) if name else None
+        if request is not None:
+            return lambda name: request.build_absolute_uri(storage.url(name)) if name else None
+        return lambda name: storage.url(name) if name else None
+
+    def _thumbnail_converter(self):
+        # одни и те же картинки повторяются в списке — URL миниатюры строим один раз на файл
+        urls = {}
+
+        def thumbnail(name):
+            if not name:
+                return None
+            if name not in urls:
+                urls[name] = thumbnail_url(name)
+            return urls[name]
+
+        return thumbnail
+
+    @property
+    def data(self):
+        converters = self.get_converters()
+        return [
+            {
+                name: (
+                    convert(row) if source is None
+                    else None if (value := row[source]) is None
+                    else convert(value)
+                )
+                for name, source, convert in converters
+            }
+            for row in self.rows
+        ]
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -39,6 +172,74 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ["id", "first_name", "last_name"]
 
 
+MAX_TRANSACTIONS_PREVIEW = 20
+
+
+# карт в одном запросе превью: у SQLite не больше 500 частей в UNION ALL (SQLITE_MAX_COMPOUND_SELECT)
+PREVIEW_CARDS_PER_QUERY = 200
+
+
+def _latest_entries_sql(card_number, limit, until):
+    entries = CardLedgerEntry.objects.filter(card_number=card_number)
+    if until is not None:
+        entries = entries.filter(timestamp__lte=until)
+    return entries.order_by("-timestamp", "-transaction_id").values("pk")[:limit].query.sql_with_params()
+
+
+def _transactions_preview_querysets(card_numbers, limit, until=None):
+    """
+    Последние `limit` проводок каждой карты: на карту — свой ORDER BY timestamp DESC,
+    transaction_id DESC LIMIT limit по индексу ledger_card_ts_idx (читается `limit` строк
+    индекса, сколько бы ни было истории), части собраны в один id IN (... UNION ALL ...).
+    Срезы внутри UNION ORM в SQLite не строит, поэтому объединение собирается из их SQL.
+    """
+    card_numbers = list(dict.fromkeys(card_numbers))
+    if limit < 1:
+        return []
+    querysets = []
+    for start in range(0, len(card_numbers), PREVIEW_CARDS_PER_QUERY):
+        parts, params = [], []
+        for index, number in enumerate(card_numbers[start:start + PREVIEW_CARDS_PER_QUERY]):
+            sql, part_params = _latest_entries_sql(number, limit, until)
+            parts.append(f"SELECT * FROM ({sql}) AS latest_{index}")
+            params.extend(part_params)
+        querysets.append(
+            CardLedgerEntry.objects.filter(pk__in=RawSQL(" UNION ALL ".join(parts), params))
+            .select_related("transaction")
+        )
+    return querysets
+
+
+def _group_transactions_preview(entries):
+    by_card = defaultdict(dict)
+    for entry in entries:
+        by_card[entry.card_number][entry.transaction_id] = entry.transaction
+
+    return {
+        card_number: sorted(txs.values(), key=lambda tx: (tx.timestamp, tx.id), reverse=True)
+        for card_number, txs in by_card.items()
+    }
+
+
+def load_transactions_preview(card_numbers, limit, until=None):
+    """
+    Последние `limit` транзакций для каждой карты (до момента until, если задан)
+    одним запросом к журналу проводок (до PREVIEW_CARDS_PER_QUERY карт на запрос).
+    Возвращает {card_number: [TransactionModel, ...]}.
+    """
+    querysets = _transactions_preview_querysets(card_numbers, limit, until)
+    return _group_transactions_preview(entry for queryset in querysets for entry in queryset)
+
+
+async def aload_transactions_preview(card_numbers, limit, until=None):
+    entries = [
+        entry
+        for queryset in _transactions_preview_querysets(card_numbers, limit, until)
+        async for entry in queryset
+    ]
+    return _group_transactions_preview(entries)
+
+
 class CardAccountSerializer(serializers.ModelSerializer):
     user = serializers.SerializerMethodField()
     transactions = serializers.SerializerMethodField()
@@ -50,11 +251,34 @@ class CardAccountSerializer(serializers.ModelSerializer):
             "expiration_date", "balance", "transactions"
         ]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # превью транзакций отдаём только по запросу (?transactions=N)
+        if "transactions_preview" not in self.context:
+            self.fields.pop("transactions")
+
     def get_user(self, obj):
         return UserSerializer(obj.user).data
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # ?as_of= — баланс на указанный момент вместо текущего
+        if "as_of" in self.context:
+            data["balance"] = self.fields["balance"].to_representation(self.context["balances_as_of"][instance.pk])
+            data["as_of"] = serializers.DateTimeField().to_representation(self.context["as_of"])
+        return data
+
     def get_transactions(self, obj):
-        transactions = TransactionModel.objects.filter(
-            models.Q(from_card=obj.card_number) | models.Q(to_card=obj.card_number)
-        )
-        return TransactionSerializer(transactions, many=True).data
+        transactions = self.context["transactions_preview"].get(obj.card_number, [])
+        return TransactionSerializer(transactions, many=True, context=self.context).data
+
+
+class CardPeriodSummarySerializer(serializers.ModelSerializer):
+    net = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CardPeriodSummary
+        fields = ["period_start", "inflow", "outflow", "net", "transactions_count", "closing_balance"]
+
+    def get_net(self, obj):
+        return serializers.DecimalField(max_digits=14, decimal_places=2).to_representation(obj.inflow - obj.outflow)
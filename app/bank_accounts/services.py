@@ -0,0 +1,259 @@
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Case, Exists, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.utils import timezone
+
+from bank_accounts.models import (
+    CardAccountModel,
+    CardLedgerEntry,
+    CardPeriodSummary,
+    TransactionModel,
+    period_start,
+)
+
+BULK_CREATE_BATCH_SIZE = 1000
+
+
+class InsufficientFunds(Exception):
+    """
+    На карте отправителя не хватает средств; ничего не записано.
+    """
+
+    def __init__(self, card_number):
+        super().__init__(card_number)
+        self.card_number = card_number
+
+
+def lock_cards(card_numbers):
+    """
+    Блокирует карты в порядке номера (детерминированно — без взаимоблокировок)
+    и возвращает {card_number: CardAccountModel}. Вызывать внутри transaction.atomic().
+    """
+    numbers = sorted({number for number in card_numbers if number})
+    if not numbers:
+        return {}
+    queryset = CardAccountModel.objects.select_for_update().filter(card_number__in=numbers).order_by("card_number")
+    return {card.card_number: card for card in queryset}
+
+
+def apply_balance_delta(card, delta):
+    """
+    Атомарное изменение баланса через F(); списание проходит только при достаточном остатке.
+    Тем же запросом поднимается версия карты (ETag) — даже при нулевой дельте.
+    """
+    queryset = CardAccountModel.objects.filter(pk=card.pk)
+    if delta < 0:
+        queryset = queryset.filter(balance__gte=-delta)
+    updated = queryset.update(
+        balance=F("balance") + delta,
+        version=F("version") + 1,
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        raise InsufficientFunds(card.card_number)
+
+
+def apply_balance_deltas(deltas):
+    """
+    apply_balance_delta для многих карт одним UPDATE ... CASE: deltas — [(карта, дельта), ...].
+    Условие на остаток то же: если хоть у одной карты списание не прошло, бросает
+    InsufficientFunds (вызывающая транзакция откатывается).
+    """
+    if not deltas:
+        return
+    balance_field = CardAccountModel._meta.get_field("balance")
+    sufficient = Q()
+    for card, delta in deltas:
+        sufficient |= Q(pk=card.pk, balance__gte=-delta) if delta < 0 else Q(pk=card.pk)
+    updated = CardAccountModel.objects.filter(sufficient).update(
+        balance=F("balance") + Case(
+            *[When(pk=card.pk, then=Value(delta, output_field=balance_field)) for card, delta in deltas],
+            output_field=balance_field,
+        ),
+        version=F("version") + 1,
+        updated_at=timezone.now(),
+    )
+    if updated != len(deltas):
+        for card, delta in deltas:
+            if delta < 0 and not CardAccountModel.objects.filter(pk=card.pk, balance__gte=-delta).exists():
+                raise InsufficientFunds(card.card_number)
+        raise InsufficientFunds(deltas[0][0].card_number)
+
+
+def _rows_locked():
+    """
+    Держит ли БД прочитанные в lock_cards строки до конца транзакции:
+    select_for_update или SQLite с BEGIN IMMEDIATE (блокировка всей БД на запись).
+    """
+    if connection.features.has_select_for_update:
+        return True
+    return (
+        connection.vendor == "sqlite"
+        and connection.settings_dict.get("OPTIONS", {}).get("transaction_mode") == "IMMEDIATE"
+    )
+
+
+def refresh_balances(cards):
+    """
+    Актуализирует balance у карт после update(). Если строки заблокированы с момента чтения,
+    значения уже верно посчитаны в памяти; иначе перечитываем их одним запросом.
+    """
+    if not cards or _rows_locked():
+        return
+    by_pk = {card.pk: card for card in cards.values()}
+    for pk, balance in CardAccountModel.objects.filter(pk__in=by_pk).values_list("pk", "balance"):
+        by_pk[pk].balance = balance
+
+
+def post_transaction(tx):
+    """
+    Проводит новую операцию: списание с from_card и зачисление на to_card
+    (для карт, известных системе) и сохранение самой транзакции — всё атомарно.
+    При нехватке средств бросает InsufficientFunds, изменения откатываются.
+    """
+    with transaction.atomic():
+        cards = lock_cards([tx.from_card, tx.to_card])
+        from_card = cards.get(tx.from_card)
+        to_card = cards.get(tx.to_card)
+
+        if from_card:
+            apply_balance_delta(from_card, -tx.amount)
+            from_card.balance -= tx.amount
+        if to_card:
+            apply_balance_delta(to_card, tx.amount)
+            to_card.balance += tx.amount
+
+        refresh_balances(cards)
+        tx.save(cards=cards)
+    return tx
+
+
+def post_transactions_bulk(transactions):
+    """
+    Пакетное проведение: карты читаются одним запросом, балансы и тип операции
+    считаются в памяти, на каждую карту — одно изменение баланса на чистую сумму,
+    строки вставляются через bulk_create. Операции, которым не хватает средств,
+    пропускаются. Возвращает (проведённые операции, {индекс: сообщение об ошибке}).
+    """
+    errors = {}
+    accepted = []
+    with transaction.atomic():
+        cards = lock_cards(number for tx in transactions for number in (tx.from_card, tx.to_card))
+        balances = {number: card.balance for number, card in cards.items()}
+        leg_balances = []
+
+        for index, tx in enumerate(transactions):
+            if tx.from_card in balances and balances[tx.from_card] < tx.amount:
+                errors[index] = "Insufficient funds for withdrawal."
+                continue
+            if tx.from_card in balances:
+                balances[tx.from_card] -= tx.amount
+            if tx.to_card in balances:
+                balances[tx.to_card] += tx.amount
+
+            row_balances = {
+                number: balances[number] for number in (tx.from_card, tx.to_card) if number in balances
+            }
+            tx.classify(row_balances)
+            accepted.append(tx)
+            leg_balances.append(row_balances)
+
+        # каждая карта пакета участвует хотя бы в одной строке — версию поднимаем всем
+        apply_balance_deltas([(card, balances[number] - card.balance) for number, card in cards.items()])
+        for number, card in cards.items():
+            card.balance = balances[number]
+
+        TransactionModel.objects.bulk_create(accepted, batch_size=BULK_CREATE_BATCH_SIZE)
+        CardLedgerEntry.objects.record([
+            entry
+            for tx, row_balances in zip(accepted, leg_balances)
+            for entry in tx.build_ledger_entries(row_balances)
+        ])
+    return accepted, errors
+
+
+def _ledger_sum(card_number, after, until):
+    """
+    Сумма проводок карты в полуинтервале (after, until] — диапазон по индексу (card_number, timestamp).
+    """
+    entries = CardLedgerEntry.objects.filter(card_number=card_number)
+    if after is not None:
+        entries = entries.filter(timestamp__gt=after)
+    if until is not None:
+        entries = entries.filter(timestamp__lte=until)
+    total = entries.aggregate(total=Sum("amount", default=Decimal("0")))["total"]
+    return total.quantize(Decimal("0.01"))
+
+
+def balance_as_of(card, moment):
+    """
+    Баланс одной карты на момент moment (см. balances_as_of).
+    """
+    return balances_as_of([card], moment)[card.pk]
+
+
+def balances_as_of(cards, moment):
+    """
+    Балансы карт на момент moment без проигрывания истории: {pk: баланс}.
+    Один запрос на любое число карт; на каждую карту — два поиска по индексу
+    (card_number, timestamp) с LIMIT 1, так что время не зависит от возраста карты:
+    - последняя проводка до moment — её balance_after и есть баланс;
+    - у карт без проводок до moment — первая проводка после него: баланс до неё
+      равен balance_after - amount; карта без проводок вовсе — текущий баланс.
+    Только если у нужной проводки нет balance_after (история, перенесённая
+    backfill_card_ledger), баланс карты считается от точек отсчёта в сводках.
+    """
+    by_pk = {card.pk: card for card in cards}
+    if not by_pk:
+        return {}
+    entries = CardLedgerEntry.objects.filter(card_number=OuterRef("card_number"))
+    before = entries.filter(timestamp__lte=moment).order_by("-timestamp", "-transaction_id")
+    after = entries.filter(timestamp__gt=moment).order_by("timestamp", "transaction_id")
+    rows = CardAccountModel.objects.filter(pk__in=by_pk).annotate(
+        has_before=Exists(before),
+        before_balance=Subquery(before.values("balance_after")[:1]),
+        after_balance=Subquery(after.values("balance_after")[:1]),
+        after_amount=Subquery(after.values("amount")[:1]),
+    ).values_list("pk", "has_before", "before_balance", "after_balance", "after_amount")
+
+    balances = {}
+    for pk, has_before, before_balance, after_balance, after_amount in rows:
+        card = by_pk[pk]
+        if has_before:
+            balance = before_balance
+        elif after_amount is None:
+            balance = card.balance
+        elif after_balance is not None:
+            balance = after_balance - after_amount
+        else:
+            balance = None
+        balances[pk] = _balance_from_checkpoints(card, moment) if balance is None else balance
+    return balances
+
+
+def _balance_from_checkpoints(card, moment):
+    """
+    Баланс на moment по балансам на конец дня из сводок CardPeriodSummary: от ближайшей
+    точки досчитываются только проводки между ней и moment, то есть не больше суток истории карты.
+    Карта без точек отсчёта считается от текущего баланса назад.
+    """
+    checkpoints = CardPeriodSummary.objects.filter(
+        card_number=card.card_number, period="day", closing_at__isnull=False
+    ).values_list("closing_at", "closing_balance")
+
+    before = (
+        checkpoints.filter(period_start__lte=period_start("day", moment), closing_at__lte=moment)
+        .order_by("-period_start")
+        .first()
+    )
+    if before:
+        closing_at, balance = before
+        return balance + _ledger_sum(card.card_number, closing_at, moment)
+
+    after = checkpoints.filter(closing_at__gt=moment).order_by("period_start").first()
+    if after:
+        closing_at, balance = after
+        return balance - _ledger_sum(card.card_number, moment, closing_at)
+
+    return card.balance - _ledger_sum(card.card_number, moment, None)
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from bank_accounts.authentication import invalidate_user
+from bank_accounts.models import CardAccountModel, CardPeriodSummary, TransactionModel
+
+
+@receiver(pre_delete, sender=TransactionModel)
+def retract_card_summaries(sender, instance, **kwargs):
+    """
+    Удаление операции убирает её проводки из сводок по периодам (сами проводки удалит CASCADE)
+    и поднимает версию карт — у них меняются ETag и ключ кэша с превью транзакций.
+    """
+    CardPeriodSummary.objects.retract(list(instance.ledger_entries.all()))
+    numbers = [number for number in (instance.from_card, instance.to_card) if number]
+    CardAccountModel.touch(CardAccountModel.objects.filter(card_number__in=numbers).values("pk"))
+
+
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def invalidate_jwt_user_cache(sender, instance, **kwargs):
+    """
+    Деактивация, смена пароля и любая другая правка пользователя сбрасывают его из кэша
+    JWT-аутентификации: сразу и ещё раз после коммита, чтобы параллельный запрос
+    не успел закэшировать незакоммиченное старое состояние.
+    """
+    user_id = getattr(instance, jwt_settings.USER_ID_FIELD)
+    invalidate_user(user_id)
+    transaction.on_commit(lambda: invalidate_user(user_id))
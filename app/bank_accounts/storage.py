@@ -0,0 +1,94 @@
+"""
+Хранилище с адресацией по содержимому для загружаемых изображений (image_deposit).
+
+Файл сохраняется как <upload_to>/<hh>/<sha256><ext>: одинаковые загрузки
+ложатся в один и тот же файл. Загрузка пишется на диск потоково, по частям,
+одновременно считается хэш — файл целиком в памяти не держится. Миниатюры
+(bank_accounts.thumbnails) создаются тут же, до того как на файл сошлётся операция.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+CAS_NAME_RE = re.compile(r"(?:^|/)(?P<prefix>[0-9a-f]{2})/(?P<digest>[0-9a-f]{64})(?:\.[\w]+)?$")
+
+
+def content_hash_from_name(name):
+    """
+    sha256 из имени файла, сохранённого ContentAddressedStorage, иначе None.
+    """
+    match = CAS_NAME_RE.search(name or "")
+    if match and match["digest"].startswith(match["prefix"]):
+        return match["digest"]
+    return None
+
+
+def content_addressed_name(directory, digest, filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return posixpath.join(directory, digest[:2], f"{digest}{ext}")
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    chunk_size = 64 * 1024
+
+    def get_available_name(self, name, max_length=None):
+        # итоговое имя определяется содержимым в _save, суффиксы для уникальности не нужны
+        return name
+
+    @staticmethod
+    def _reuse(path):
+        """
+        Такой файл уже есть — переиспользуем его. mtime обновляется: cleanup_deposits
+        не удаляет файлы моложе --min-age, даже если ссылка на них ещё не сохранена.
+        """
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _save(self, name, content):
+        directory, filename = posixpath.split(name)
+        upload_dir = self.path(directory)
+        os.makedirs(upload_dir, exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=upload_dir, suffix=".upload")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                if hasattr(content, "seek"):
+                    content.seek(0)
+                for chunk in content.chunks(self.chunk_size):
+                    digest.update(chunk)
+                    fh.write(chunk)
+
+            final_name = content_addressed_name(directory, digest.hexdigest(), filename)
+            final_path = self.path(final_name)
+            if self._reuse(final_path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(tmp_path, self.file_permissions_mode)
+                os.replace(tmp_path, final_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        # thumbnails импортирует этот модуль (content_hash_from_name)
+        from bank_accounts.thumbnails import generate_upload_thumbnails
+
+        generate_upload_thumbnails(final_path, self.location, digest.hexdigest())
+        return final_name
+
+
+_deposit_storage = ContentAddressedStorage()
+
+
+def deposit_storage():
+    return _deposit_storage
@@ -1,3 +1,1296 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.paginator import EmptyPage
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from bank_accounts import benchmarking, docs
+from bank_accounts.authentication import cache_generation, cache_stats, cached_user, clear_user_cache, remember_user
+from bank_accounts.filters import card_prefix_range
+from bank_accounts.forms import BULK_ADD_MAX_ROWS
+from bank_accounts.images import SAMPLE_IMAGES_DIR, SampleImageManifest
+from bank_accounts.metrics import SLOW_LOG_SQL_CHARS, registry
+from bank_accounts.models import (
+    CardAccountModel, CardLedgerEntry, CardPeriodSummary, IdempotencyKey, TransactionModel,
+)
+from bank_accounts.pagination import EstimatedCountPaginator
+from bank_accounts.serializers import (
+    TransactionRowSerializer, TransactionSerializer, aload_transactions_preview, load_transactions_preview,
+)
+from bank_accounts.services import (
+    InsufficientFunds, apply_balance_deltas, balances_as_of, post_transaction, post_transactions_bulk,
+)
+from bank_accounts.storage import deposit_storage
+from bank_accounts.thumbnails import THUMBNAIL_SIZES, thumbnail_name
+from bank_accounts.views import TransactionListCreateView
+
+EXTERNAL_CARD = "5000000000000000"
+
+
+def create_card(user, card_number, balance="1000.00"):
+    return CardAccountModel.objects.create(
+        user=user,
+        card_number=card_number,
+        expiration_date=date.today() + timedelta(days=365),
+        cvv="123",
+        balance=Decimal(balance),
+    )
+
+
+def make_image(path, color="red", size=(200, 100)):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.new("RGB", size, color).save(path)
+    return path
+
+
+def image_upload(name="check.png", color="red"):
+    content = io.BytesIO()
+    Image.new("RGB", (200, 100), color).save(content, "PNG")
+    return SimpleUploadedFile(name, content.getvalue(), content_type="image/png")
+
+
+class BankAccountsTestCase(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        caches["default"].clear()
+        clear_user_cache()
+        self.user = User.objects.create_user("owner", password="secret")
+        self.card = create_card(self.user, "4000000000000001")
+        self.other_card = create_card(self.user, "4000000000000002")
+
+    def post(self, from_card=None, to_card=None, amount="10.00", at=None, **fields):
+        """
+        Проводит операцию; at — время операции (timestamp заполняется автоматически,
+        поэтому на время проведения подменяем timezone.now — проводки и сводки получают то же время).
+        """
+        tx = TransactionModel(from_card=from_card, to_card=to_card, amount=Decimal(amount), **fields)
+        if at is None:
+            return post_transaction(tx)
+        with mock.patch("django.utils.timezone.now", return_value=at):
+            return post_transaction(tx)
+
+
+class TempMediaMixin:
+    """
+    MEDIA_ROOT во временном каталоге — тесты не трогают staticfiles/media.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root, MEDIA_URL="/media/")
+        media.enable()
+        self.addCleanup(media.disable)
+
+
+class PostTransactionQueriesTests(BankAccountsTestCase):
+    """
+    Запросов на проведение операции каждого типа: карты читаются одним запросом
+    и не перечитываются при классификации (включая SAVEPOINT / RELEASE SAVEPOINT).
+    """
+
+    def test_deposit(self):
+        with self.assertNumQueries(7):
+            self.post(EXTERNAL_CARD, self.card.card_number)
+
+    def test_withdraw(self):
+        with self.assertNumQueries(7):
+            self.post(self.card.card_number, EXTERNAL_CARD)
+
+    def test_transfer(self):
+        with self.assertNumQueries(8):
+            self.post(self.card.card_number, self.other_card.card_number)
+
+    def test_external(self):
+        with self.assertNumQueries(5):
+            self.post(EXTERNAL_CARD, "5000000000000001")
+
+
+class TransactionListTests(BankAccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.started = timezone.now() - timedelta(days=10)
+        self.transactions = [
+            self.post(EXTERNAL_CARD, self.card.card_number, at=self.started + timedelta(hours=index))
+            for index in range(7)
+        ]
+
+    def test_cursor_pages_cover_list_in_order(self):
+        ids = []
+        url = "/api/transactions/?page_size=3"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [row["id"] for row in response.json()["results"]]
+            url = response.json()["next"]
+        self.assertEqual(ids, [tx.pk for tx in reversed(self.transactions)])
+
+    def test_same_timestamp_is_not_skipped_between_pages(self):
+        moment = self.started + timedelta(days=1)
+        TransactionModel.objects.update(timestamp=moment)
+        first = self.client.get("/api/transactions/?page_size=4").json()
+        second = self.client.get(first["next"]).json()
+        ids = [row["id"] for row in first["results"] + second["results"]]
+        self.assertEqual(sorted(ids), sorted(tx.pk for tx in self.transactions))
+
+    def test_filters(self):
+        withdraw = self.post(self.card.card_number, EXTERNAL_CARD, at=self.started + timedelta(days=2), bank="privat")
+
+        response = self.client.get("/api/transactions/", {"operation_type": "withdraw"})
+        self.assertEqual([row["id"] for row in response.json()["results"]], [withdraw.pk])
+
+        response = self.client.get("/api/transactions/", {"bank": "privat"})
+        self.assertEqual([row["id"] for row in response.json()["results"]], [withdraw.pk])
+
+        response = self.client.get("/api/transactions/", {"card_number": self.other_card.card_number})
+        self.assertEqual(response.json()["results"], [])
+
+        day = timezone.localtime(self.transactions[0].timestamp).date()
+        response = self.client.get("/api/transactions/", {"date_from": day.isoformat(), "date_to": day.isoformat()})
+        expected = [tx.pk for tx in self.transactions if timezone.localtime(tx.timestamp).date() == day]
+        self.assertEqual(sorted(row["id"] for row in response.json()["results"]), sorted(expected))
+
+    def test_invalid_filters_are_rejected(self):
+        self.assertEqual(self.client.get("/api/transactions/", {"operation_type": "refund"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/transactions/", {"date_from": "yesterday"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/transactions/", {"date_to": "2026-10-08T25:00"}).status_code, 400)
+
+
+class CardHistoryTests(BankAccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        started = timezone.now() - timedelta(days=5)
+        self.history = [
+            self.post(EXTERNAL_CARD, self.card.card_number, at=started),
+            self.post(self.card.card_number, self.other_card.card_number, at=started + timedelta(hours=1)),
+            self.post(self.card.card_number, EXTERNAL_CARD, at=started + timedelta(hours=2)),
+        ]
+        # операция без участия карты в историю не попадает
+        self.post(EXTERNAL_CARD, self.other_card.card_number, at=started + timedelta(hours=3))
+
+    def test_card_history_is_paginated_newest_first(self):
+        url = f"/api/cards/{self.card.pk}/transactions/?page_size=2"
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [row["id"] for row in response.json()["results"]]
+            url = response.json()["next"]
+        self.assertEqual(ids, [tx.pk for tx in reversed(self.history)])
+
+    def test_card_does_not_embed_transactions_by_default(self):
+        response = self.client.get(f"/api/cards/{self.card.pk}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("transactions", response.json())
+
+    def test_transactions_preview(self):
+        response = self.client.get("/api/cards/", {"transactions": 2})
+        previews = {card["card_number"]: [row["id"] for row in card["transactions"]] for card in response.json()}
+        self.assertEqual(previews[self.card.card_number], [self.history[2].pk, self.history[1].pk])
+        self.assertEqual(len(previews[self.other_card.card_number]), 2)
+
+    def test_foreign_card_history_is_not_found(self):
+        stranger = User.objects.create_user("stranger", password="secret")
+        card = create_card(stranger, "4000000000000009")
+        self.assertEqual(self.client.get(f"/api/cards/{card.pk}/transactions/").status_code, 404)
+
+
+class LedgerTests(BankAccountsTestCase):
+    def test_transfer_writes_debit_and_credit(self):
+        tx = self.post(self.card.card_number, self.other_card.card_number, amount="25.00")
+        entries = {entry.leg: entry for entry in tx.ledger_entries.all()}
+        self.assertEqual(entries["debit"].card_number, self.card.card_number)
+        self.assertEqual(entries["debit"].amount, Decimal("-25.00"))
+        self.assertEqual(entries["debit"].balance_after, Decimal("975.00"))
+        self.assertEqual(entries["credit"].card_number, self.other_card.card_number)
+        self.assertEqual(entries["credit"].balance_after, Decimal("1025.00"))
+
+    def test_external_leg_has_no_balance(self):
+        tx = self.post(EXTERNAL_CARD, self.card.card_number)
+        entry = tx.ledger_entries.get(card_number=EXTERNAL_CARD)
+        self.assertIsNone(entry.balance_after)
+
+    def test_edit_keeps_historical_balances(self):
+        first = self.post(EXTERNAL_CARD, self.card.card_number, amount="10.00")
+        self.post(EXTERNAL_CARD, self.card.card_number, amount="20.00")
+
+        first = TransactionModel.objects.get(pk=first.pk)
+        first.comment = "исправлено"
+        first.save()
+
+        first.refresh_from_db()
+        self.assertEqual(first.operation_type, "deposit")
+        self.assertEqual(first.balance_after, Decimal("1010.00"))
+        self.assertEqual(first.ledger_entries.get(card_number=self.card.card_number).balance_after, Decimal("1010.00"))
+        summary = CardPeriodSummary.objects.get(card_number=self.card.card_number, period="day")
+        self.assertEqual(summary.closing_balance, Decimal("1030.00"))
+        self.assertEqual(summary.transactions_count, 2)
+
+    def test_edit_to_new_card_uses_balance_at_timestamp(self):
+        tx = self.post(EXTERNAL_CARD, self.card.card_number, amount="10.00", at=timezone.now() - timedelta(days=1))
+        self.post(EXTERNAL_CARD, self.other_card.card_number, amount="50.00")
+
+        tx = TransactionModel.objects.get(pk=tx.pk)
+        tx.to_card = self.other_card.card_number
+        tx.save()
+
+        # правка не двигает деньги: на момент операции у второй карты было 1000
+        self.assertEqual(tx.balance_after, Decimal("1000.00"))
+        self.assertEqual(CardLedgerEntry.objects.filter(transaction=tx, card_number=self.card.card_number).count(), 0)
+
+    def test_backfill_reports_only_new_entries(self):
+        first = self.post(EXTERNAL_CARD, self.card.card_number)
+        self.post(self.card.card_number, self.other_card.card_number)
+        first.ledger_entries.all().delete()
+
+        out = io.StringIO()
+        call_command("backfill_card_ledger", chunk_size=1, stdout=out)
+        self.assertIn("новых проводок: 2", out.getvalue())
+        self.assertEqual(CardLedgerEntry.objects.count(), 4)
+
+        out = io.StringIO()
+        call_command("backfill_card_ledger", stdout=out)
+        self.assertIn("новых проводок: 0", out.getvalue())
+
+
+class PostTransactionTests(BankAccountsTestCase):
+    def test_transfer_moves_balance_and_bumps_versions(self):
+        versions = (self.card.version, self.other_card.version)
+        self.post(self.card.card_number, self.other_card.card_number, amount="100.00")
+        self.card.refresh_from_db()
+        self.other_card.refresh_from_db()
+        self.assertEqual(self.card.balance, Decimal("900.00"))
+        self.assertEqual(self.other_card.balance, Decimal("1100.00"))
+        self.assertGreater(self.card.version, versions[0])
+        self.assertGreater(self.other_card.version, versions[1])
+
+    def test_insufficient_funds_rolls_back(self):
+        with self.assertRaises(InsufficientFunds):
+            self.post(self.card.card_number, self.other_card.card_number, amount="1000.01")
+        self.card.refresh_from_db()
+        self.other_card.refresh_from_db()
+        self.assertEqual(self.card.balance, Decimal("1000.00"))
+        self.assertEqual(self.other_card.balance, Decimal("1000.00"))
+        self.assertFalse(TransactionModel.objects.exists())
+        self.assertFalse(CardLedgerEntry.objects.exists())
+
+    def test_api_rejects_overdraft(self):
+        response = self.client.post("/api/transactions/", {
+            "from_card": self.card.card_number, "to_card": EXTERNAL_CARD, "amount": "5000.00",
+        }, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.card.refresh_from_db()
+        self.assertEqual(self.card.balance, Decimal("1000.00"))
+
+
+class BulkIngestTests(BankAccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def test_rows_are_posted_and_errors_reported_by_index(self):
+        rows = [
+            {"from_card": EXTERNAL_CARD, "to_card": self.card.card_number, "amount": "10.00"},
+            {"from_card": self.card.card_number, "to_card": EXTERNAL_CARD, "amount": "5000.00"},
+            {"from_card": self.card.card_number, "to_card": self.other_card.card_number, "amount": "-1"},
+            {"from_card": self.card.card_number, "to_card": self.other_card.card_number, "amount": "110.00"},
+            {"to_card": self.card.card_number},
+        ]
+        response = self.client.post("/api/transactions/bulk/", rows, format="json")
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual(body["created"], 2)
+        self.assertEqual([error["index"] for error in body["errors"]], [1, 2, 4])
+
+        self.card.refresh_from_db()
+        self.other_card.refresh_from_db()
+        self.assertEqual(self.card.balance, Decimal("900.00"))
+        self.assertEqual(self.other_card.balance, Decimal("1110.00"))
+        self.assertEqual(
+            list(TransactionModel.objects.order_by("id").values_list("operation_type", "balance_after")),
+            [("deposit", Decimal("1010.00")), ("deposit", Decimal("1110.00"))],
+        )
+        self.assertEqual(CardLedgerEntry.objects.count(), 4)
+
+    def test_ndjson_body(self):
+        body = "\n".join(json.dumps(row) for row in [
+            {"from_card": EXTERNAL_CARD, "to_card": self.card.card_number, "amount": "1.00"},
+            {"from_card": EXTERNAL_CARD, "to_card": self.card.card_number, "amount": "2.00"},
+        ])
+        response = self.client.post("/api/transactions/bulk/", body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["created"], 2)
+        self.card.refresh_from_db()
+        self.assertEqual(self.card.balance, Decimal("1003.00"))
+
+    def test_card_balances_updated_in_one_query(self):
+        cards = [self.card, self.other_card, create_card(self.user, "4000000000000003")]
+        rows = [
+            {"from_card": EXTERNAL_CARD, "to_card": card.card_number, "amount": f"{index + 1}.00"}
+            for index, card in enumerate(cards)
+        ]
+        versions = list(CardAccountModel.objects.order_by("card_number").values_list("version", flat=True))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/api/transactions/bulk/", rows, format="json")
+        self.assertEqual(response.json()["created"], 3)
+        card_updates = [
+            query for query in queries.captured_queries
+            if query["sql"].startswith('UPDATE "bank_accounts_cardaccountmodel"')
+        ]
+        self.assertEqual(len(card_updates), 1)
+        self.assertEqual(
+            list(CardAccountModel.objects.order_by("card_number").values_list("balance", "version")),
+            [
+                (Decimal("1001.00"), versions[0] + 1),
+                (Decimal("1002.00"), versions[1] + 1),
+                (Decimal("1003.00"), versions[2] + 1),
+            ],
+        )
+
+    def test_batched_update_keeps_funds_guard(self):
+        CardAccountModel.objects.filter(pk=self.card.pk).update(balance=Decimal("50.00"))
+        with self.assertRaises(InsufficientFunds):
+            with transaction.atomic():
+                apply_balance_deltas([(self.other_card, Decimal("10.00")), (self.card, Decimal("-100.00"))])
+        self.card.refresh_from_db()
+        self.other_card.refresh_from_db()
+        self.assertEqual((self.card.balance, self.other_card.balance), (Decimal("50.00"), Decimal("1000.00")))
+
+    def test_object_body_is_rejected(self):
+        response = self.client.post("/api/transactions/bulk/", {"amount": "1.00"}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+
+class CardCacheTests(BankAccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        self.url = f"/api/cards/{self.card.pk}/"
+
+    def test_repeated_read_is_served_from_cache(self):
+        self.client.get(self.url)
+        # только запрос версии карты для ETag, без сериализации
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.json()["balance"], "1000.00")
+
+    def test_change_from_another_process_is_visible_immediately(self):
+        self.client.get(self.url)
+        # запись без участия этого процесса: его кэш никто не сбрасывал
+        CardAccountModel.objects.filter(pk=self.card.pk).update(
+            balance=Decimal("1.00"), version=F("version") + 1, updated_at=timezone.now()
+        )
+        self.assertEqual(self.client.get(self.url).json()["balance"], "1.00")
+
+    def test_posting_refreshes_preview(self):
+        self.client.get(self.url, {"transactions": 5})
+        tx = self.post(EXTERNAL_CARD, self.card.card_number)
+        card = self.client.get(self.url, {"transactions": 5}).json()
+        self.assertEqual(card["balance"], "1010.00")
+        self.assertEqual([row["id"] for row in card["transactions"]], [tx.pk])
+
+
+class ConditionalGetTests(BankAccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        self.url = f"/api/cards/{self.card.pk}/"
+
+    def test_card_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertIn("no-cache", response["Cache-Control"])
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # другой вариант представления — другой ETag
+        self.assertEqual(self.client.get(self.url, {"transactions": 3}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_posting_changes_card_etag(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.post(EXTERNAL_CARD, self.card.card_number)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_deleting_transaction_changes_card_etag_and_preview(self):
+        tx = self.post(EXTERNAL_CARD, self.card.card_number)
+        response = self.client.get(self.url, {"transactions": 5})
+        self.assertEqual(len(response.json()["transactions"]), 1)
+
+        tx.delete()
+
+        response = self.client.get(self.url, {"transactions": 5}, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["transactions"], [])
+
+    def test_transaction_not_modified(self):
+        tx = self.post(EXTERNAL_CARD, self.card.card_number)
+        url = f"/api/transactions/{tx.pk}/"
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        tx = TransactionModel.objects.get(pk=tx.pk)
+        tx.comment = "правка"
+        tx.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class CardAutocompleteTests(BankAccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser("admin", password="secret")
+        self.url = reverse("admin:bank_accounts_transactionmodel_card_autocomplete")
+
+    def test_prefix_range(self):
+        self.assertEqual(card_prefix_range("4000"), ("4000", "4001"))
+        self.assertEqual(card_prefix_range("0199"), ("0199", "0200"))
+        self.assertEqual(card_prefix_range("99"), ("99", None))
+
+    def test_suggestions_by_prefix(self):
+        create_card(self.user, "4100000000000001")
+        self.client.force_login(self.admin)
+        results = self.client.get(self.url, {"q": "40000"}).json()["results"]
+        self.assertEqual(
+            [row["card_number"] for row in results],
+            [self.card.card_number, self.other_card.card_number],
+        )
+        self.assertEqual(results[0]["label"], "owner (₴1000.00)")
+
+    def test_non_numeric_prefix_returns_nothing(self):
+        self.client.force_login(self.admin)
+        with self.assertNumQueries(2):  # сессия и пользователь админки
+            response = self.client.get(self.url, {"q": "40x"})
+        self.assertEqual(response.json(), {"results": []})
+
+    def test_requires_admin(self):
+        self.client.force_login(self.user)
+        self.assertNotEqual(self.client.get(self.url, {"q": "4"}).status_code, 200)
+
+
+@override_settings(SAMPLE_IMAGES_RECHECK_SECONDS=0)
+class SampleImageManifestTests(TempMediaMixin, BankAccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = os.path.join(self.media_root, SAMPLE_IMAGES_DIR)
+        make_image(os.path.join(self.directory, "card10.png"))
+        make_image(os.path.join(self.directory, "card2.png"), "blue")
+        self.manifest = SampleImageManifest()
+
+    def test_choices_in_natural_order_with_thumbnails(self):
+        choices = self.manifest.choices()
+        self.assertEqual([name for _url, name in choices], ["card2.png", "card10.png"])
+        thumbnails = self.manifest.thumbnails()
+        self.assertEqual(set(thumbnails), {url for url, _name in choices})
+        self.assertEqual(set(thumbnails[choices[0][0]]), {60, 120})
+
+    def test_rebuilt_when_directory_changes(self):
+        self.assertEqual(len(self.manifest.choices()), 2)
+        make_image(os.path.join(self.directory, "card3.jpg"), "green")
+        os.utime(self.directory, ns=(0, os.stat(self.directory).st_mtime_ns + 1))
+        self.assertEqual([name for _url, name in self.manifest.choices()], ["card2.png", "card3.jpg", "card10.png"])
+
+    @override_settings(SAMPLE_IMAGES_RECHECK_SECONDS=3600)
+    def test_directory_is_not_rescanned_within_interval(self):
+        self.manifest.choices()
+        make_image(os.path.join(self.directory, "card3.jpg"), "green")
+        self.assertEqual(len(self.manifest.choices()), 2)
+        self.assertEqual(len(self.manifest.rebuild()), 3)
+
+
+class ThumbnailTests(TempMediaMixin, BankAccountsTestCase):
+    def upload(self, **fields):
+        response = self.client.post("/api/transactions/", {
+            "from_card": EXTERNAL_CARD, "to_card": self.card.card_number, "amount": "10.00",
+            "image_deposit": image_upload(), **fields,
+        }, format="multipart")
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+    def test_thumbnails_are_created_on_upload(self):
+        tx = TransactionModel.objects.get(pk=self.upload()["id"])
+        digest = os.path.basename(tx.image_deposit.name).split(".")[0]
+        for size in THUMBNAIL_SIZES:
+            self.assertTrue(os.path.exists(os.path.join(self.media_root, thumbnail_name(digest, size))))
+
+    def test_read_path_does_not_touch_files(self):
+        created = self.upload()
+        shutil.rmtree(os.path.join(self.media_root, "thumbnails"))
+
+        detail = self.client.get(f"/api/transactions/{created['id']}/").json()
+        listed = self.client.get("/api/transactions/").json()["results"][0]
+        # URL выводится из хэша в имени файла, миниатюра заново не создаётся
+        self.assertEqual(detail["image_deposit_thumbnail"], created["image_deposit_thumbnail"])
+        self.assertEqual(listed["image_deposit_thumbnail"], created["image_deposit_thumbnail"])
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, "thumbnails")))
+
+    def test_legacy_file_name_has_no_thumbnail(self):
+        tx = self.post(EXTERNAL_CARD, self.card.card_number, image_deposit="transactions/deposits/old.png")
+        self.assertIsNone(self.client.get(f"/api/transactions/{tx.pk}/").json()["image_deposit_thumbnail"])
+
+
+class ContentAddressedStorageTests(TempMediaMixin, BankAccountsTestCase):
+    def test_same_content_is_stored_once(self):
+        first = deposit_storage().save("transactions/deposits/a.png", image_upload("a.png"))
+        second = deposit_storage().save("transactions/deposits/b.PNG", image_upload("b.PNG"))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, deposit_storage().save("transactions/deposits/c.png", image_upload(color="blue")))
+
+    def test_reused_orphan_survives_cleanup(self):
+        name = deposit_storage().save("transactions/deposits/a.png", image_upload())
+        path = deposit_storage().path(name)
+        os.utime(path, (0, 0))  # давно загруженный файл без ссылок
+
+        self.assertEqual(deposit_storage().save("transactions/deposits/b.png", image_upload()), name)
+        call_command("cleanup_deposits", min_age=3600, stdout=io.StringIO())
+        self.assertTrue(os.path.exists(path))
+
+    def test_cleanup_removes_old_orphans_only(self):
+        orphan = deposit_storage().path(deposit_storage().save("transactions/deposits/a.png", image_upload()))
+        used = deposit_storage().save("transactions/deposits/b.png", image_upload(color="blue"))
+        self.post(EXTERNAL_CARD, self.card.card_number, image_deposit=used)
+        for path in (orphan, deposit_storage().path(used)):
+            os.utime(path, (0, 0))
+
+        call_command("cleanup_deposits", min_age=3600, stdout=io.StringIO())
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(deposit_storage().path(used)))
+
+    def test_migration_refreshes_cached_card_preview(self):
+        legacy = "transactions/deposits/old.png"
+        make_image(deposit_storage().path(legacy), "red")
+        self.post(EXTERNAL_CARD, self.card.card_number, image_deposit=legacy)
+        self.client.force_authenticate(self.user)
+        url = f"/api/cards/{self.card.pk}/"
+        response = self.client.get(url, {"transactions": 5})
+        self.assertIsNone(response.json()["transactions"][0]["image_deposit_thumbnail"])
+
+        call_command("migrate_deposits_to_cas", stdout=io.StringIO())
+
+        refreshed = self.client.get(url, {"transactions": 5}, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(refreshed.status_code, 200)
+        row = refreshed.json()["transactions"][0]
+        self.assertNotIn("old.png", row["image_deposit"])
+        self.assertIsNotNone(row["image_deposit_thumbnail"])
+
+
+class AsyncViewsTests(BankAccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(self.user)}"}
+        started = timezone.now() - timedelta(days=1)
+        self.transactions = [
+            self.post(EXTERNAL_CARD, self.card.card_number, at=started + timedelta(minutes=index))
+            for index in range(5)
+        ]
+
+    def test_card_matches_sync_endpoint(self):
+        self.client.force_authenticate(self.user)
+        sync = self.client.get(f"/api/cards/{self.card.pk}/", {"transactions": 2})
+        self.client.force_authenticate(None)
+        response = self.client.get(f"/api/async/cards/{self.card.pk}/", {"transactions": 2}, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), sync.json())
+        self.assertEqual(response["ETag"], sync["ETag"])
+        response = self.client.get(
+            f"/api/async/cards/{self.card.pk}/", {"transactions": 2}, HTTP_IF_NONE_MATCH=sync["ETag"], **self.auth
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_authentication_is_required(self):
+        self.assertEqual(self.client.get(f"/api/async/cards/{self.card.pk}/").status_code, 401)
+        response = self.client.get(f"/api/async/cards/{self.card.pk}/", HTTP_AUTHORIZATION="Bearer broken")
+        self.assertEqual(response.status_code, 401)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(f"/api/async/cards/{self.card.pk}/", **self.auth).status_code, 401)
+
+    def test_cursors_are_shared_with_sync_list(self):
+        first = self.client.get("/api/transactions/", {"page_size": 2}).json()
+        cursor = first["next"].split("cursor=")[1].split("&")[0]
+        second = self.client.get("/api/async/transactions/", {"page_size": 2, "cursor": cursor}).json()
+        third = self.client.get(second["next"].replace("/api/async/", "/api/")).json()
+        ids = [row["id"] for page in (first, second, third) for row in page["results"]]
+        self.assertEqual(ids, [tx.pk for tx in reversed(self.transactions)])
+        self.assertEqual(second["results"], self.client.get(first["next"]).json()["results"])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get("/api/async/transactions/", {"cursor": "junk"}).status_code, 404)
+
+
+class SqliteProfileTests(TestCase):
+    def test_pragmas_are_applied_to_connection(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("только для SQLite")
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 20000)
+
+
+class BenchmarkingTests(SimpleTestCase):
+    def test_summarize(self):
+        summary = benchmarking.summarize([0.001] * 98 + [0.01, 0.02])
+        self.assertEqual(summary["requests"], 100)
+        self.assertEqual(summary["p50_ms"], 1.0)
+        self.assertEqual(summary["p99_ms"], 10.0)
+        self.assertEqual(benchmarking.percentile([], 50), 0.0)
+
+    def test_find_regressions(self):
+        baseline = [
+            {"rows": 1000, "mode": "cursor", "rps": 100.0, "p99_ms": 10.0},
+            {"rows": 1000, "mode": "offset", "rps": 50.0, "p99_ms": 20.0},
+        ]
+        results = [
+            {"rows": 1000, "mode": "cursor", "rps": 70.0, "p99_ms": 11.0},
+            {"rows": 1000, "mode": "offset", "rps": 55.0, "p99_ms": 30.0},
+            {"rows": 5000, "mode": "cursor", "rps": 1.0},
+        ]
+        regressions = benchmarking.find_regressions(results, baseline, threshold_pct=20)
+        self.assertEqual(len(regressions), 2)
+        self.assertIn("mode=cursor: rps 100.0 -> 70.0", regressions[0])
+        self.assertIn("mode=offset: p99_ms 20.0 -> 30.0", regressions[1])
+        self.assertEqual(benchmarking.find_regressions(results, baseline, threshold_pct=60), [])
+
+
+class MetricsTests(BankAccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+
+    def test_metrics_are_not_public(self):
+        # за локальным прокси все запросы приходят с 127.0.0.1
+        self.assertEqual(self.client.get("/metrics/", REMOTE_ADDR="127.0.0.1").status_code, 403)
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_access_by_token_staff_or_allowed_address(self):
+        self.assertEqual(self.client.get("/metrics/", HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        self.assertEqual(self.client.get("/metrics/", HTTP_AUTHORIZATION="Bearer s3cret").status_code, 200)
+        with override_settings(METRICS_ALLOWED_IPS=("10.0.0.5",)):
+            self.assertEqual(self.client.get("/metrics/", REMOTE_ADDR="10.0.0.5").status_code, 200)
+        self.client.force_login(User.objects.create_user("staff", password="secret", is_staff=True))
+        self.assertEqual(self.client.get("/metrics/").status_code, 200)
+
+    def db_queries(self, view):
+        line = f'bank_accounts_request_db_queries_sum{{view="{view}",method="GET"}}'
+        for row in registry.render().splitlines():
+            if row.startswith(line):
+                return float(row.split()[-1])
+        return None
+
+    def test_sync_view_queries_are_counted(self):
+        self.post(EXTERNAL_CARD, self.card.card_number)
+        self.client.get("/api/transactions/")
+        self.assertGreaterEqual(self.db_queries("transactions"), 1)
+
+    @override_settings(METRICS_SLOW_REQUEST_MS=0)
+    def test_slow_request_log_truncates_sql(self):
+        self.client.force_authenticate(self.user)
+        rows = [{"from_card": EXTERNAL_CARD, "to_card": self.card.card_number, "amount": "1.00"}] * 100
+        with self.assertLogs("bank_accounts.metrics", "WARNING") as logs:
+            self.client.post("/api/transactions/bulk/", rows, format="json")
+        queries = logs.records[0].getMessage().splitlines()[1:]
+        self.assertTrue(queries)
+        self.assertTrue(all(len(line) < SLOW_LOG_SQL_CHARS + 30 for line in queries))
+        self.assertTrue(any(line.endswith("…") for line in queries))
+
+    async def test_async_view_queries_are_counted(self):
+        # под ASGI запросы ORM идут из потока sync_to_async, а не из потока event loop
+        response = await AsyncClient().get("/api/async/transactions/")
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(self.db_queries("async-transactions"), 1)
+
+
+class ExportTests(BankAccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        self.transactions = [
+            self.post(EXTERNAL_CARD, self.card.card_number, amount="12.50", comment="первая"),
+            self.post(self.card.card_number, EXTERNAL_CARD, amount="2.00"),
+        ]
+
+    def export(self, export_format, **params):
+        response = self.client.get(f"/api/transactions/export.{export_format}", params)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode()
+
+    def test_ndjson_matches_api(self):
+        api = {row["id"]: row for row in self.client.get("/api/transactions/").json()["results"]}
+        rows = [json.loads(line) for line in self.export("ndjson").splitlines()]
+        self.assertEqual([row["id"] for row in rows], [tx.pk for tx in self.transactions])
+        for row in rows:
+            for field in ("timestamp", "amount", "balance_after", "operation_type", "comment"):
+                self.assertEqual(row[field], api[row["id"]][field], field)
+
+    def test_csv_with_filters(self):
+        rows = list(csv.DictReader(io.StringIO(self.export("csv", operation_type="withdraw"))))
+        self.assertEqual([int(row["id"]) for row in rows], [self.transactions[1].pk])
+        self.assertEqual(rows[0]["amount"], "2.00")
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get("/api/transactions/export.xml").status_code, 404)
+
+
+class CardPeriodSummaryTests(BankAccountsTestCase):
+    def summaries(self):
+        return list(
+            CardPeriodSummary.objects.order_by("card_number", "period", "period_start").values(
+                "card_number", "period", "period_start", "inflow", "outflow",
+                "transactions_count", "closing_at", "closing_balance",
+            )
+        )
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        self.post(EXTERNAL_CARD, self.card.card_number, amount="100.00", at=now - timedelta(days=40))
+        self.post(self.card.card_number, self.other_card.card_number, amount="30.00", at=now - timedelta(days=40))
+        self.post(self.card.card_number, EXTERNAL_CARD, amount="5.00", at=now - timedelta(days=1))
+        self.removed = self.post(EXTERNAL_CARD, self.card.card_number, amount="7.00", at=now)
+        self.post(EXTERNAL_CARD, "5000000000000001", amount="1.00")
+
+    def test_incremental_summaries_match_rebuild(self):
+        self.removed.delete()
+        edited = TransactionModel.objects.filter(operation_type="withdraw").first()
+        edited.amount = Decimal("6.00")
+        edited.save()
+
+        incremental = self.summaries()
+        CardPeriodSummary.objects.rebuild([self.card.card_number, self.other_card.card_number])
+        self.assertEqual(incremental, self.summaries())
+
+    def test_summary_endpoint(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(f"/api/cards/{self.card.pk}/summary/", {"period": "month"})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["totals"], {
+            "inflow": "107.00", "outflow": "35.00", "net": "72.00", "transactions_count": 4,
+        })
+        self.assertEqual(body["results"][-1]["closing_balance"], "1072.00")
+        self.assertEqual(self.client.get(f"/api/cards/{self.card.pk}/summary/", {"period": "year"}).status_code, 400)
+
+
+class BalanceAsOfTests(BankAccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        self.start = timezone.now() - timedelta(days=3)
+        self.post(EXTERNAL_CARD, self.card.card_number, amount="100.00", at=self.start)
+        self.post(self.card.card_number, self.other_card.card_number, amount="40.00", at=self.start + timedelta(days=1))
+        self.post(self.card.card_number, EXTERNAL_CARD, amount="10.00", at=self.start + timedelta(days=2))
+
+    def balances(self, as_of):
+        response = self.client.get("/api/cards/", {"as_of": as_of.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        return {card["card_number"]: card["balance"] for card in response.json()}
+
+    def test_balances_at_moments(self):
+        self.assertEqual(self.balances(self.start - timedelta(hours=1)), {
+            self.card.card_number: "1000.00", self.other_card.card_number: "1000.00",
+        })
+        self.assertEqual(self.balances(self.start + timedelta(hours=36)), {
+            self.card.card_number: "1060.00", self.other_card.card_number: "1040.00",
+        })
+        self.assertEqual(self.balances(timezone.now()), {
+            self.card.card_number: "1050.00", self.other_card.card_number: "1040.00",
+        })
+
+    def test_list_queries_do_not_grow_with_cards(self):
+        moment = (self.start + timedelta(hours=1)).isoformat()
+        with CaptureQueriesContext(connection) as few:
+            self.client.get("/api/cards/", {"as_of": moment})
+        for index in range(5):
+            create_card(self.user, f"40000000000001{index:02d}")
+        with CaptureQueriesContext(connection) as many:
+            self.client.get("/api/cards/", {"as_of": moment})
+        self.assertEqual(len(few), len(many))
+
+    def test_one_indexed_query_for_all_cards(self):
+        idle = create_card(self.user, "4000000000000003", balance="7.00")
+        cards = [self.card, self.other_card, idle]
+        with CaptureQueriesContext(connection) as queries:
+            balances = balances_as_of(cards, self.start + timedelta(hours=1))
+        self.assertEqual(balances, {
+            self.card.pk: Decimal("1100.00"), self.other_card.pk: Decimal("1000.00"), idle.pk: Decimal("7.00"),
+        })
+        self.assertEqual(len(queries), 1)
+        # последняя проводка — поиском по индексу с LIMIT 1, без окна и суммы по всей истории
+        sql = queries[0]["sql"].upper()
+        self.assertIn("LIMIT 1", sql)
+        self.assertNotIn("ROW_NUMBER", sql)
+        self.assertNotIn("SUM(", sql)
+
+    def test_entries_without_balance_after_use_checkpoints(self):
+        moments = [self.start - timedelta(hours=1), self.start + timedelta(hours=36), timezone.now()]
+        expected = [balances_as_of([self.card, self.other_card], moment) for moment in moments]
+        CardLedgerEntry.objects.update(balance_after=None)
+        self.assertEqual([balances_as_of([self.card, self.other_card], moment) for moment in moments], expected)
+
+    def test_edit_does_not_change_history(self):
+        tx = TransactionModel.objects.get(operation_type="deposit", amount=Decimal("100.00"))
+        tx.comment = "правка"
+        tx.save()
+        self.assertEqual(self.balances(self.start + timedelta(hours=1))[self.card.card_number], "1100.00")
+
+
+class LabelledTransactionSerializer(TransactionSerializer):
+    label = serializers.SerializerMethodField()
+
+    class Meta(TransactionSerializer.Meta):
+        pass
+
+    def get_label(self, obj):
+        return f"{obj.get_operation_type_display()}: {obj.amount}"
+
+
+class LabelledTransactionRowSerializer(TransactionRowSerializer):
+    serializer_class = LabelledTransactionSerializer
+
+
+class FastLabelledTransactionRowSerializer(LabelledTransactionRowSerializer):
+    method_converters = {**TransactionRowSerializer.method_converters, "label": (None, "_label_converter")}
+
+    def _label_converter(self):
+        labels = dict(TransactionModel._meta.get_field("operation_type").flatchoices)
+        return lambda row: f"{labels[row['operation_type']]}: {row['amount']}"
+
+
+class TransactionRowSerializerTests(BankAccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.post(EXTERNAL_CARD, self.card.card_number, amount="10.5", comment="", bank="privat",
+                  image_deposit=f"transactions/deposits/ab/ab{'0' * 62}.png")
+        self.post(self.card.card_number, EXTERNAL_CARD, amount="3", cardholder_name=None)
+        self.post(EXTERNAL_CARD, "5000000000000001", amount="1.99")
+        self.context = {"request": APIRequestFactory().get("/api/transactions/")}
+
+    def assert_same_output(self, row_serializer_class):
+        serializer_class = row_serializer_class.serializer_class
+        instances = TransactionModel.objects.order_by("-timestamp", "-id")
+        rows = instances.values(*row_serializer_class.source_fields())
+        self.assertEqual(
+            json.dumps(row_serializer_class(list(rows), context=self.context).data),
+            json.dumps(serializer_class(instances, many=True, context=self.context).data),
+        )
+
+    def test_output_matches_model_serializer(self):
+        self.assert_same_output(TransactionRowSerializer)
+
+    def test_other_method_fields_fall_back_to_serializer(self):
+        self.assert_same_output(LabelledTransactionRowSerializer)
+
+    def test_method_converters_declared_on_subclass(self):
+        # до метода сериализатора дело не доходит ни для одного вычисляемого поля
+        with mock.patch.object(TransactionRowSerializer, "_method_converter", side_effect=AssertionError):
+            self.assert_same_output(FastLabelledTransactionRowSerializer)
+
+
+class CachedJWTAuthenticationTests(BankAccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        self.url = f"/api/cards/{self.card.pk}/"
+
+    def user_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return [query["sql"] for query in queries if query["sql"].startswith(f'SELECT "{User._meta.db_table}".')]
+
+    def test_user_is_read_from_db_once(self):
+        self.assertEqual(len(self.user_queries()), 1)
+        self.assertEqual(self.user_queries(), [])
+        self.assertEqual(cache_stats(), {"hits": 1, "misses": 1, "size": 1})
+
+    def test_deactivation_takes_effect_immediately(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_deletion_takes_effect_immediately(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.user.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_update_bypassing_signals_is_seen_after_ttl(self):
+        now = 1000.0
+        with mock.patch("bank_accounts.authentication.time.monotonic", side_effect=lambda: now):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+            User.objects.filter(pk=self.user.pk).update(is_active=False)
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+            now += 31
+            self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_user_read_before_invalidation_is_not_cached(self):
+        generation = cache_generation()
+        self.user.save()
+        remember_user(self.user.pk, self.user, generation)
+        self.assertIsNone(cached_user(self.user.pk))
+
+    def test_cached_user_is_a_copy(self):
+        remember_user(self.user.pk, self.user, cache_generation())
+        first, second = cached_user(self.user.pk), cached_user(self.user.pk)
+        self.assertEqual(first.pk, self.user.pk)
+        self.assertIsNot(first, second)
+        self.assertIsNot(first, self.user)
+
+    @override_settings(JWT_USER_CACHE_SIZE=2)
+    def test_cache_size_is_bounded(self):
+        for user_id in range(1, 6):
+            remember_user(user_id, self.user, cache_generation())
+        self.assertLessEqual(cache_stats()["size"], 2)
+
+
+class IdempotencyTests(BankAccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        self.body = {"from_card": self.card.card_number, "to_card": EXTERNAL_CARD, "amount": "10.00"}
+
+    def create(self, key="key-1", body=None):
+        return self.client.post(
+            "/api/transactions/", body or self.body, format="json", HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def assert_balance(self, balance):
+        self.card.refresh_from_db()
+        self.assertEqual(self.card.balance, Decimal(balance))
+
+    def test_retry_replays_stored_response(self):
+        first = self.create()
+        self.assertEqual(first.status_code, 201)
+        self.assertNotIn("Idempotent-Replayed", first)
+        caches["default"].clear()
+        for _ in range(2):
+            # второй повтор — уже из фронтального кэша
+            retry = self.create()
+            self.assertEqual(retry.status_code, 201)
+            self.assertEqual(retry["Idempotent-Replayed"], "true")
+            self.assertEqual(retry.json(), first.json())
+        self.assertEqual(TransactionModel.objects.count(), 1)
+        self.assert_balance("990.00")
+
+    def test_anonymous_clients_cannot_share_key(self):
+        self.client.force_authenticate(None)
+        first = self.create()
+        second = APIClient().post("/api/transactions/", self.body, format="json", HTTP_IDEMPOTENCY_KEY="key-1")
+        # ни один анонимный клиент не получает чужой сохранённый ответ — ключ без аутентификации не принимается
+        self.assertEqual((first.status_code, second.status_code), (401, 401))
+        self.assertNotIn("Idempotent-Replayed", second)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assert_balance("1000.00")
+
+    def test_other_key_posts_again(self):
+        self.assertEqual(self.create("key-1").status_code, 201)
+        self.assertEqual(self.create("key-2").status_code, 201)
+        self.assert_balance("980.00")
+
+    def test_same_key_with_other_body_is_rejected(self):
+        self.assertEqual(self.create().status_code, 201)
+        response = self.create(body={**self.body, "amount": "20.00"})
+        self.assertEqual(response.status_code, 422)
+        self.assert_balance("990.00")
+
+    def test_keys_are_scoped_by_user(self):
+        self.assertEqual(self.create().status_code, 201)
+        other = User.objects.create_user("other", password="secret")
+        self.client.force_authenticate(other)
+        response = self.create(body={**self.body, "from_card": EXTERNAL_CARD})
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn("Idempotent-Replayed", response)
+
+    def test_rejected_request_releases_key(self):
+        body = {**self.body, "amount": "1500.00"}
+        self.assertEqual(self.create(body=body).status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        CardAccountModel.objects.filter(pk=self.card.pk).update(balance=Decimal("2000.00"))
+        response = self.create(body=body)
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn("Idempotent-Replayed", response)
+
+    def test_abandoned_claim_is_taken_over(self):
+        IdempotencyKey.objects.create(
+            scope=f"user:{self.user.pk}", key="key-1", request_hash="", expires_at=timezone.now() + timedelta(days=1)
+        )
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(self.create().status_code, 201)
+        self.assert_balance("990.00")
+
+    def test_posting_is_rolled_back_when_claim_was_taken_over(self):
+        perform_create = TransactionListCreateView.perform_create
+
+        def slow_perform_create(view, serializer):
+            perform_create(view, serializer)
+            # тем временем повтор признал ключ брошенным и удалил строку
+            IdempotencyKey.objects.all().delete()
+
+        with mock.patch.object(TransactionListCreateView, "perform_create", slow_perform_create):
+            response = self.create()
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(TransactionModel.objects.exists())
+        self.assert_balance("1000.00")
+        self.assertEqual(self.create().status_code, 201)
+        self.assert_balance("990.00")
+
+
+@mock.patch.object(EstimatedCountPaginator, "count_limit", 3)
+class EstimatedCountPaginatorTests(BankAccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        for _ in range(7):
+            self.post(EXTERNAL_CARD, self.card.card_number, amount="1.00")
+        self.queryset = TransactionModel.objects.order_by("-timestamp", "-id")
+        self.ids = list(self.queryset.values_list("id", flat=True))
+        self.admin = User.objects.create_superuser("admin", password="secret")
+        self.client.force_login(self.admin)
+        self.url = reverse("admin:bank_accounts_transactionmodel_changelist")
+
+    def test_small_filtered_count_is_exact(self):
+        paginator = EstimatedCountPaginator(self.queryset.filter(id__in=self.ids[:3]), 2)
+        self.assertEqual((paginator.count, paginator.count_is_exact, paginator.count_label), (3, True, "3"))
+        self.assertEqual(list(paginator.get_elided_page_range(1)), [1, 2])
+
+    def test_pages_past_the_limit_are_reachable(self):
+        paginator = EstimatedCountPaginator(self.queryset.filter(to_card=self.card.card_number), 2)
+        self.assertEqual((paginator.count, paginator.count_label), (3, "3+"))
+        page = paginator.page(4)
+        self.assertEqual([tx.id for tx in page], self.ids[6:])
+        self.assertEqual((page.start_index(), page.end_index(), page.has_next()), (7, 7, False))
+        self.assertTrue(paginator.page(3).has_next())
+        self.assertEqual(list(paginator.get_elided_page_range(3)), [1, 2, 3, 4, paginator.ELLIPSIS])
+        with self.assertRaises(EmptyPage):
+            paginator.page(5)
+
+    def test_overcounting_estimate_does_not_link_to_empty_pages(self):
+        # SQLite оценивает по MAX(rowid): удалённые строки остаются в оценке
+        TransactionModel.objects.filter(id__in=self.ids[1:]).delete()
+        paginator = EstimatedCountPaginator(self.queryset, 2)
+        self.assertEqual(paginator.count_label, "≈7")
+        self.assertEqual(list(paginator.get_elided_page_range(1)), [1])
+        self.assertEqual([tx.id for tx in paginator.page(1)], self.ids[:1])
+
+    @mock.patch("bank_accounts.admin.TransactionAdmin.list_per_page", 2)
+    def test_changelist_pages_past_the_limit(self):
+        response = self.client.get(self.url, {"q": self.card.card_number, "p": 4})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([tx.id for tx in response.context["cl"].result_list], self.ids[6:])
+        self.assertContains(response, "3+ ")
+        self.assertRedirects(
+            self.client.get(self.url, {"q": self.card.card_number, "p": 5}),
+            f"{self.url}?e=1", fetch_redirect_response=False,
+        )
+
+
+class BulkAddAdminTests(TempMediaMixin, BankAccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser("admin", password="secret"))
+        self.url = reverse("admin:bank_accounts_transactionmodel_bulk_add")
+
+    def submit(self, rows, total=5, **defaults):
+        data = {
+            "rows-TOTAL_FORMS": str(total), "rows-INITIAL_FORMS": "0",
+            "rows-MIN_NUM_FORMS": "0", "rows-MAX_NUM_FORMS": str(BULK_ADD_MAX_ROWS),
+            "bank": "mono", "cardholder_name": "Касир", **defaults,
+        }
+        for index, (to_card, amount, comment) in enumerate(rows):
+            data.update({
+                f"rows-{index}-to_card": to_card, f"rows-{index}-amount": amount, f"rows-{index}-comment": comment,
+            })
+        return self.client.post(f"{self.url}?rows={total}", data)
+
+    def assert_balances(self, card_balance, other_balance):
+        self.card.refresh_from_db()
+        self.other_card.refresh_from_db()
+        self.assertEqual((self.card.balance, self.other_card.balance), (Decimal(card_balance), Decimal(other_balance)))
+
+    def test_form_rows_are_clamped(self):
+        for rows, expected in (("3", 3), ("1000", BULK_ADD_MAX_ROWS), ("0", 1), ("x", 20)):
+            response = self.client.get(self.url, {"rows": rows})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.context["formset"].forms), expected)
+
+    def test_requires_add_permission(self):
+        self.client.force_login(User.objects.create_user("staff", password="secret", is_staff=True))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_filled_rows_are_posted_with_shared_fields(self):
+        response = self.submit([
+            (self.card.card_number, "10.00", "перша"),
+            ("", "", ""),
+            (self.other_card.card_number, "2.50", ""),
+            (EXTERNAL_CARD, "1.00", "зовнішня"),
+        ], image_deposit=image_upload())
+        self.assertRedirects(response, reverse("admin:bank_accounts_transactionmodel_changelist"))
+        self.assert_balances("1010.00", "1002.50")
+        transactions = TransactionModel.objects.order_by("id")
+        self.assertEqual(
+            [(tx.to_card, tx.amount, tx.comment) for tx in transactions],
+            [(self.card.card_number, Decimal("10.00"), "перша"),
+             (self.other_card.card_number, Decimal("2.50"), ""),
+             (EXTERNAL_CARD, Decimal("1.00"), "зовнішня")],
+        )
+        self.assertEqual({(tx.bank, tx.cardholder_name) for tx in transactions}, {("mono", "Касир")})
+        # файл сохранён один раз, все строки ссылаются на него
+        self.assertEqual(len({tx.image_deposit.name for tx in transactions}), 1)
+        self.assertEqual(CardLedgerEntry.objects.filter(card_number=self.card.card_number).count(), 1)
+
+    def test_invalid_row_saves_nothing(self):
+        response = self.submit([(self.card.card_number, "10.00", ""), (self.other_card.card_number, "0", "")])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["formset"].errors[1], {"amount": ["Сумма должна быть больше 0."]})
+        self.assertFalse(TransactionModel.objects.exists())
+        self.assert_balances("1000.00", "1000.00")
+
+    def test_empty_formset_is_rejected(self):
+        response = self.submit([])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["formset"].non_form_errors())
+        self.assertFalse(TransactionModel.objects.exists())
+
+    def test_rejected_row_rolls_back_the_batch(self):
+        def reject_last(transactions):
+            created, _rejected = post_transactions_bulk(transactions)
+            return created, {len(transactions) - 1: "Insufficient funds for withdrawal."}
+
+        with mock.patch("bank_accounts.admin.post_transactions_bulk", side_effect=reject_last):
+            response = self.submit([(self.card.card_number, "10.00", ""), (self.other_card.card_number, "5.00", "")])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["formset"].errors[1], {"amount": ["Insufficient funds for withdrawal."]})
+        self.assertFalse(TransactionModel.objects.exists())
+        self.assertFalse(CardLedgerEntry.objects.exists())
+        self.assert_balances("1000.00", "1000.00")
+
+
+class ApiSchemaTests(BankAccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        docs.reset_schemas()
+        self.addCleanup(docs.reset_schemas)
+        render = mock.patch("bank_accounts.docs.render_schema", side_effect=lambda name: f"schema {name}\n".encode())
+        self.render = render.start()
+        self.addCleanup(render.stop)
+
+    def test_schema_is_revalidated_by_etag(self):
+        response = self.client.get("/api/schema/")
+        self.assertEqual(response.content, b"schema openapi.yaml\n")
+        self.assertEqual(response["Cache-Control"], "public, no-cache")
+        not_modified = self.client.get("/api/schema/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified["Cache-Control"], "public, no-cache")
+        self.assertEqual(self.render.call_count, 1)
+
+    def test_formats(self):
+        self.assertEqual(self.client.get("/api/schema/", {"format": "json"}).content, b"schema openapi.json\n")
+        self.assertEqual(self.client.get("/api/schema/", HTTP_ACCEPT="application/json").content, b"schema openapi.json\n")
+        self.assertEqual(self.client.get("/swagger.yaml").content, b"schema swagger.yaml\n")
+
+    @override_settings(API_SCHEMA_MAX_AGE=60)
+    def test_short_max_age(self):
+        self.assertEqual(self.client.get("/swagger.json")["Cache-Control"], "public, max-age=60")
+
+    def test_prebuilt_schema_dir(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.assertEqual(docs.build_schemas(directory)["openapi.json"], len(b"schema openapi.json\n"))
+        self.render.reset_mock()
+        with override_settings(API_SCHEMA_DIR=directory):
+            self.assertEqual(self.client.get("/api/schema/").content, b"schema openapi.yaml\n")
+        self.render.assert_not_called()
+
+
+class ApiDocsDisabledTests(SimpleTestCase):
+    def test_docs_libraries_are_not_imported(self):
+        # настройки читаются при запуске процесса — проверяем в отдельном интерпретаторе
+        script = (
+            "import sys, django; django.setup(); "
+            "import settings.urls, bank_accounts.views, bank_accounts.admin, bank_accounts.async_views; "
+            "from django.urls import resolve, Resolver404\n"
+            "try:\n    resolve('/api/schema/'); sys.exit('docs url')\nexcept Resolver404:\n    pass\n"
+            "print(sorted(m for m in sys.modules if m.startswith(('drf_spectacular', 'drf_yasg'))))"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=settings.BASE_DIR,
+            env={**os.environ, "API_DOCS_ENABLED": "0", "DJANGO_SETTINGS_MODULE": "settings.settings"},
+            capture_output=True, text=True, timeout=120,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "[]")
+
+
+class TransactionsPreviewTests(BankAccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.start = timezone.now() - timedelta(days=1)
+        self.ids = {self.card.card_number: [], self.other_card.card_number: []}
+        for minute in range(5):
+            at = self.start + timedelta(minutes=minute)
+            tx = self.post(EXTERNAL_CARD, self.card.card_number, amount="1.00", at=at)
+            self.ids[self.card.card_number].append(tx.id)
+            if minute % 2:
+                tx = self.post(self.other_card.card_number, EXTERNAL_CARD, amount="1.00", at=at)
+                self.ids[self.other_card.card_number].append(tx.id)
+        self.numbers = [self.card.card_number, self.other_card.card_number, "4000000000000099"]
+
+    def preview_ids(self, preview):
+        return {number: [tx.id for tx in txs] for number, txs in preview.items()}
+
+    def test_latest_per_card_in_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            preview = load_transactions_preview(self.numbers, 2)
+        self.assertEqual(self.preview_ids(preview), {
+            self.card.card_number: self.ids[self.card.card_number][:-3:-1],
+            self.other_card.card_number: self.ids[self.other_card.card_number][::-1],
+        })
+        self.assertEqual(len(queries), 1)
+        # на карту — LIMIT по индексу, без окна по всей истории
+        self.assertNotIn("ROW_NUMBER", queries[0]["sql"].upper())
+        self.assertEqual(queries[0]["sql"].upper().count("LIMIT 2"), len(self.numbers))
+
+    def test_until(self):
+        preview = load_transactions_preview(self.numbers, 3, until=self.start + timedelta(minutes=1))
+        self.assertEqual(self.preview_ids(preview), {
+            self.card.card_number: self.ids[self.card.card_number][1::-1],
+            self.other_card.card_number: self.ids[self.other_card.card_number][:1],
+        })
+
+    @mock.patch("bank_accounts.serializers.PREVIEW_CARDS_PER_QUERY", 1)
+    def test_cards_are_split_across_queries(self):
+        expected = self.preview_ids(load_transactions_preview(self.numbers, 2))
+        with CaptureQueriesContext(connection) as queries:
+            preview = load_transactions_preview(self.numbers, 2)
+        self.assertEqual(self.preview_ids(preview), expected)
+        self.assertEqual(len(queries), len(self.numbers))
+
+    async def test_async_matches_sync(self):
+        expected = await sync_to_async(load_transactions_preview)(self.numbers, 2)
+        preview = await aload_transactions_preview(self.numbers, 2)
+        self.assertEqual(self.preview_ids(preview), self.preview_ids(expected))
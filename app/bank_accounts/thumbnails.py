@@ -0,0 +1,124 @@
+"""
+Миниатюры изображений транзакций.
+
+Миниатюра создаётся один раз на изображение и размер и лежит рядом с медиа:
+MEDIA_ROOT/thumbnails/<hh>/<sha256>_<size>.webp — ключ по содержимому файла,
+поэтому одинаковые картинки делят одни и те же миниатюры.
+
+Для загрузок (image_deposit) миниатюры создаются при сохранении файла
+(ContentAddressedStorage) или командой generate_thumbnails, а API только выводит
+их URL из хэша в имени файла (thumbnail_url) — без обращения к диску.
+"""
+import functools
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from bank_accounts.storage import content_hash_from_name
+
+THUMBNAILS_DIR = "thumbnails"
+# 60 — сетка в админке (1x), 120 — она же на retina (2x) и превью в API
+THUMBNAIL_SIZES = (60, 120)
+API_THUMBNAIL_SIZE = 120
+# сколько хэшей файлов помнить (файлы без хэша в имени, например готовые изображения)
+HASH_CACHE_SIZE = 1024
+
+
+def file_hash(path, chunk_size=64 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def thumbnail_name(digest, size):
+    return os.path.join(THUMBNAILS_DIR, digest[:2], f"{digest}_{size}.webp")
+
+
+def render_thumbnail(source_path, target_path, size):
+    """
+    Квадратная миниатюра с обрезкой по центру (как object-fit: cover).
+    Пишется во временный файл и переименовывается — параллельные генераторы не мешают друг другу.
+    """
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        tmp_path = f"{target_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        thumbnail.save(tmp_path, "WEBP", quality=80)
+    os.replace(tmp_path, target_path)
+
+
+def generate_thumbnails(source_path, media_root, sizes=THUMBNAIL_SIZES, digest=None):
+    """
+    Создаёт недостающие миниатюры для файла. Не зависит от настроек Django,
+    поэтому годится для пула процессов. Возвращает {size: имя относительно media_root}.
+    """
+    digest = digest or file_hash(source_path)
+    names = {}
+    for size in sizes:
+        name = thumbnail_name(digest, size)
+        target = os.path.join(media_root, name)
+        if not os.path.exists(target):
+            render_thumbnail(source_path, target, size)
+        names[size] = name
+    return names
+
+
+def generate_upload_thumbnails(source_path, media_root, digest):
+    """
+    Миниатюры только что сохранённой загрузки. Не изображение или битый файл — без миниатюр,
+    сама загрузка от этого не падает. Возвращает {size: имя} или {}.
+    """
+    try:
+        return generate_thumbnails(source_path, media_root, digest=digest)
+    except (OSError, Image.DecompressionBombError):
+        return {}
+
+
+@functools.lru_cache(maxsize=HASH_CACHE_SIZE)
+def _file_hash_cached(path, mtime_ns, size):
+    return file_hash(path)
+
+
+def _cached_hash(path):
+    """
+    Хэш файла считается один раз, пока не изменились mtime/размер.
+    """
+    stat = os.stat(path)
+    return _file_hash_cached(path, stat.st_mtime_ns, stat.st_size)
+
+
+def get_thumbnail_urls(name, sizes=THUMBNAIL_SIZES):
+    """
+    URL миниатюр для файла из MEDIA_ROOT (name — относительный путь, как в ImageField).
+    Недостающие миниатюры создаются. Для отсутствующего или битого файла — {}.
+    """
+    if not name:
+        return {}
+    source = os.path.join(settings.MEDIA_ROOT, name)
+    try:
+        # у файлов из ContentAddressedStorage хэш уже в имени
+        digest = content_hash_from_name(name) or _cached_hash(source)
+        names = generate_thumbnails(source, str(settings.MEDIA_ROOT), sizes, digest=digest)
+    except (OSError, Image.DecompressionBombError):
+        return {}
+    return {size: default_storage.url(thumb) for size, thumb in names.items()}
+
+
+def thumbnail_url(name, size=API_THUMBNAIL_SIZE):
+    """
+    URL миниатюры файла из ContentAddressedStorage по хэшу в его имени, без обращения к диску.
+    Для файлов без хэша в имени (до migrate_deposits_to_cas) — None.
+    """
+    digest = content_hash_from_name(name)
+    if digest is None:
+        return None
+    return default_storage.url(thumbnail_name(digest, size))
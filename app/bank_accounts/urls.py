@@ -1,6 +1,13 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from bank_accounts.views import CardAccountViewSet, TransactionListCreateView, TransactionDetailView
+from bank_accounts import async_views
+from bank_accounts.views import (
+    CardAccountViewSet,
+    TransactionBulkCreateView,
+    TransactionListCreateView,
+    TransactionDetailView,
+    TransactionExportView,
+)
 
 router = DefaultRouter()
 router.register(r'cards', CardAccountViewSet, basename="card")
@@ -8,5 +15,13 @@ router.register(r'cards', CardAccountViewSet, basename="card")
 urlpatterns = [
     path("", include(router.urls)),
     path("transactions/", TransactionListCreateView.as_view(), name="transactions"),
+    path("transactions/export.<str:export_format>", TransactionExportView.as_view(), name="transactions-export"),
+    path("transactions/bulk/", TransactionBulkCreateView.as_view(), name="transactions-bulk"),
     path('transactions/<int:pk>/', TransactionDetailView.as_view(), name='transaction-detail'),
+
+    # асинхронные версии горячих GET-эндпоинтов (для запуска под ASGI)
+    path("async/cards/by-number/", async_views.card_by_number, name="async-card-by-number"),
+    path("async/cards/<int:pk>/", async_views.card_detail, name="async-card-detail"),
+    path("async/transactions/", async_views.transaction_list, name="async-transactions"),
+    path("async/transactions/<int:pk>/", async_views.transaction_detail, name="async-transaction-detail"),
 ]
@@ -1,10 +1,66 @@
+from decimal import Decimal
+from functools import partial
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from rest_framework import viewsets, generics, status
 from rest_framework.permissions import IsAuthenticated
-from bank_accounts.models import CardAccountModel, TransactionModel
-from bank_accounts.serializers import CardAccountSerializer, TransactionSerializer
+from bank_accounts.models import CardAccountModel, CardLedgerEntry, CardPeriodSummary, TransactionModel
+from bank_accounts.serializers import (
+    CardAccountSerializer,
+    CardPeriodSummarySerializer,
+    TransactionRowSerializer,
+    TransactionSerializer,
+    MAX_TRANSACTIONS_PREVIEW,
+    load_transactions_preview,
+)
+from bank_accounts.pagination import CardLedgerCursorPagination, TransactionCursorPagination
+from bank_accounts.idempotency import IDEMPOTENCY_HEADER, idempotent_response
+from bank_accounts.filters import filter_card_summaries, filter_transactions, parse_as_of
+from bank_accounts.export import EXPORT_FORMATS
+from bank_accounts.parsers import NDJSONParser
+from bank_accounts.services import balances_as_of, post_transactions_bulk
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
-from drf_spectacular.utils import extend_schema, OpenApiParameter
+from rest_framework.exceptions import NotFound, ValidationError
+from bank_accounts import cache as card_cache
+from bank_accounts.conditional import card_validators, transaction_validators
+from bank_accounts.schema_hints import OpenApiParameter, OpenApiTypes, extend_schema
+
+TRANSACTIONS_PREVIEW_PARAMETER = OpenApiParameter(
+    name='transactions', required=False, type=int, location=OpenApiParameter.QUERY,
+    description=f'Добавить последние N транзакций каждой карты (не больше {MAX_TRANSACTIONS_PREVIEW})'
+)
+
+AS_OF_PARAMETER = OpenApiParameter(
+    name='as_of', required=False, type=str, location=OpenApiParameter.QUERY,
+    description='Баланс (и превью транзакций) на момент: YYYY-MM-DD (конец дня) или ISO 8601'
+)
+
+IDEMPOTENCY_KEY_PARAMETER = OpenApiParameter(
+    name=IDEMPOTENCY_HEADER, required=False, type=str, location=OpenApiParameter.HEADER,
+    description='Ключ идемпотентности (только с аутентификацией): повтор с тем же ключом и телом вернёт первый ответ, не проводя операцию'
+)
+
+
+def parse_transactions_preview_limit(value):
+    """
+    ?transactions=N, ограниченное сверху MAX_TRANSACTIONS_PREVIEW; некорректное значение — 0.
+    """
+    try:
+        limit = int(value or 0)
+    except ValueError:
+        return 0
+    return max(0, min(limit, MAX_TRANSACTIONS_PREVIEW))
+
+
+def card_representation_variant(limit, as_of=None):
+    """
+    Вариант представления карты для кэша и ETag: превью транзакций и момент as_of.
+    """
+    variant = f"p{limit}"
+    return f"{variant}-a{as_of.timestamp()}" if as_of else variant
 
 
 class CardAccountViewSet(viewsets.ReadOnlyModelViewSet):
@@ -12,12 +68,129 @@ class CardAccountViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return CardAccountModel.objects.filter(user=self.request.user)
+        return CardAccountModel.objects.filter(user=self.request.user).select_related("user")
+
+    def get_transactions_preview_limit(self):
+        return parse_transactions_preview_limit(self.request.query_params.get("transactions"))
+
+    def get_as_of(self):
+        return parse_as_of(self.request.query_params)
+
+    def get_representation_variant(self):
+        return card_representation_variant(self.get_transactions_preview_limit(), self.get_as_of())
+
+    def get_serializer(self, *args, **kwargs):
+        """
+        Превью транзакций и балансы на момент as_of для всех сериализуемых карт грузим пакетом.
+        """
+        limit = self.get_transactions_preview_limit()
+        as_of = self.get_as_of()
+        if (limit or as_of) and args and args[0] is not None:
+            cards = list(args[0]) if kwargs.get("many") else [args[0]]
+            if kwargs.get("many"):
+                args = (cards,) + args[1:]
+            context = self.get_serializer_context()
+            if limit:
+                context["transactions_preview"] = load_transactions_preview(
+                    [card.card_number for card in cards], limit, until=as_of
+                )
+            if as_of:
+                context["as_of"] = as_of
+                context["balances_as_of"] = balances_as_of(cards, as_of)
+            kwargs["context"] = context
+        return super().get_serializer(*args, **kwargs)
+
+    @extend_schema(parameters=[TRANSACTIONS_PREVIEW_PARAMETER, AS_OF_PARAMETER])
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def get_card_validators(self, **lookup):
+        """
+        ETag/Last-Modified по версии карты — один лёгкий запрос без сериализации.
+        """
+        card = CardAccountModel.objects.values("pk", "version", "updated_at", "user_id").get(**lookup)
+        return card, card_validators(card, f"-{self.get_representation_variant()}")
+
+    def get_cached_card(self, card):
+        """
+        Сериализованная карта через кэш (ключ — версия из get_card_validators);
+        при промахе — обычная сериализация.
+        """
+        return card_cache.get_card_payload(
+            card,
+            self.get_representation_variant(),
+            lambda: self.get_serializer(
+                CardAccountModel.objects.select_related("user").get(pk=card["pk"])
+            ).data,
+        )
+
+    @extend_schema(parameters=[TRANSACTIONS_PREVIEW_PARAMETER, AS_OF_PARAMETER])
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            card, validators = self.get_card_validators(pk=int(self.kwargs["pk"]), user=request.user)
+            not_modified = validators.not_modified(request)
+            if not_modified is not None:
+                return not_modified
+            payload = self.get_cached_card(card)
+        except (ValueError, CardAccountModel.DoesNotExist):
+            raise NotFound
+        return validators.apply(Response(payload))
+
+    @extend_schema(responses={200: TransactionSerializer(many=True)})
+    @action(detail=True, methods=["get"], pagination_class=CardLedgerCursorPagination)
+    def transactions(self, request, pk=None):
+        """
+        История операций карты с курсорной пагинацией (по журналу проводок).
+        """
+        card = self.get_object()
+        entries = CardLedgerEntry.objects.filter(card_number=card.card_number).select_related("transaction")
+        page = self.paginate_queryset(entries)
+        serializer = TransactionSerializer(
+            [entry.transaction for entry in page], many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name='period', required=False, type=str,
+                             location=OpenApiParameter.QUERY, description='day / month (по умолчанию month)'),
+            OpenApiParameter(name='date_from', required=False, type=str,
+                             location=OpenApiParameter.QUERY, description='Начало диапазона (YYYY-MM-DD)'),
+            OpenApiParameter(name='date_to', required=False, type=str,
+                             location=OpenApiParameter.QUERY, description='Конец диапазона включительно (YYYY-MM-DD)'),
+        ],
+        responses={200: CardPeriodSummarySerializer(many=True)},
+    )
+    @action(detail=True, methods=["get"])
+    def summary(self, request, pk=None):
+        """
+        Приход, расход и баланс на конец по дням или месяцам — из готовых сводок, без чтения операций.
+        """
+        card = self.get_object()
+        summaries, period = filter_card_summaries(
+            CardPeriodSummary.objects.filter(card_number=card.card_number), request.query_params
+        )
+        data = CardPeriodSummarySerializer(summaries, many=True).data
+        inflow = sum((summary.inflow for summary in summaries), Decimal("0"))
+        outflow = sum((summary.outflow for summary in summaries), Decimal("0"))
+        return Response({
+            "card_number": card.card_number,
+            "period": period,
+            "results": data,
+            "totals": {
+                "inflow": f"{inflow:.2f}",
+                "outflow": f"{outflow:.2f}",
+                "net": f"{inflow - outflow:.2f}",
+                "transactions_count": sum(summary.transactions_count for summary in summaries),
+            },
+        })
 
     @extend_schema(
         parameters=[
             OpenApiParameter(name='card_number', required=True, type=str,
-                             location=OpenApiParameter.QUERY, description='Номер карты')
+                             location=OpenApiParameter.QUERY, description='Номер карты'),
+            TRANSACTIONS_PREVIEW_PARAMETER,
+            AS_OF_PARAMETER,
         ],
         responses={200: CardAccountSerializer}
     )
@@ -28,19 +201,150 @@ class CardAccountViewSet(viewsets.ReadOnlyModelViewSet):
             return Response({"detail": "Номер карты не передан."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            card = CardAccountModel.objects.get(card_number=card_number)
+            card, validators = self.get_card_validators(card_number=card_number)
         except CardAccountModel.DoesNotExist:
             return Response({"detail": "Карта не найдена."}, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = CardAccountSerializer(card)
-        return Response(serializer.data)
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        return validators.apply(Response(self.get_cached_card(card)))
+
+
+TRANSACTION_FILTER_PARAMETERS = [
+    OpenApiParameter(name='card_number', required=False, type=str,
+                     location=OpenApiParameter.QUERY, description='Номер карты (отправитель или получатель)'),
+    OpenApiParameter(name='operation_type', required=False, type=str,
+                     location=OpenApiParameter.QUERY, description='deposit / withdraw / external'),
+    OpenApiParameter(name='bank', required=False, type=str,
+                     location=OpenApiParameter.QUERY, description='Код банка'),
+    OpenApiParameter(name='date_from', required=False, type=str,
+                     location=OpenApiParameter.QUERY, description='Начало периода (YYYY-MM-DD или ISO 8601)'),
+    OpenApiParameter(name='date_to', required=False, type=str,
+                     location=OpenApiParameter.QUERY, description='Конец периода включительно (YYYY-MM-DD или ISO 8601)'),
+]
 
 
 class TransactionListCreateView(generics.ListCreateAPIView):
     queryset = TransactionModel.objects.all()
     serializer_class = TransactionSerializer
+    pagination_class = TransactionCursorPagination
+
+    def get_queryset(self):
+        return filter_transactions(super().get_queryset(), self.request.query_params)
+
+    @extend_schema(parameters=TRANSACTION_FILTER_PARAMETERS)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    @extend_schema(parameters=[IDEMPOTENCY_KEY_PARAMETER])
+    def post(self, request, *args, **kwargs):
+        return super().post(request, *args, **kwargs)
+
+    def create(self, request, *args, **kwargs):
+        """
+        С заголовком Idempotency-Key повтор запроса не проводит операцию второй раз,
+        а возвращает сохранённый ответ (с заголовком Idempotent-Replayed).
+        """
+        return idempotent_response(request, partial(super().create, request, *args, **kwargs))
+
+    def list(self, request, *args, **kwargs):
+        """
+        Список читается через .values() и быстрый TransactionRowSerializer — ответ тот же,
+        что у TransactionSerializer, без создания моделей на каждую строку.
+        """
+        queryset = self.filter_queryset(self.get_queryset()).values(*TransactionRowSerializer.source_fields())
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(
+            TransactionRowSerializer(page, context=self.get_serializer_context()).data
+        )
+
+
+class TransactionExportView(generics.GenericAPIView):
+    """
+    Выгрузка всей истории (с фильтрами списка) в CSV или NDJSON потоком, по возрастанию времени.
+    """
+    queryset = TransactionModel.objects.all()
+    permission_classes = [IsAuthenticated]
+    pagination_class = None
+
+    @extend_schema(parameters=TRANSACTION_FILTER_PARAMETERS, responses={200: OpenApiTypes.STR})
+    def get(self, request, export_format):
+        if export_format not in EXPORT_FORMATS:
+            raise NotFound
+        # фильтры разбираются до начала ответа — ошибки в них приходят обычным 400
+        queryset = filter_transactions(self.get_queryset(), request.query_params).order_by("timestamp", "id")
+        stream, content_type = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(stream(queryset), content_type=content_type)
+        filename = f"transactions-{timezone.localdate():%Y%m%d}.{export_format}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        # nginx не должен копить поток целиком перед отдачей
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+MAX_BULK_TRANSACTIONS = 10000
+
+
+class TransactionBulkCreateView(generics.GenericAPIView):
+    """
+    Пакетная загрузка выписки: JSON-массив или NDJSON-поток транзакций.
+    Ошибочные строки возвращаются в errors, остальные проводятся одним пакетом.
+    """
+    serializer_class = TransactionSerializer
+    permission_classes = [IsAuthenticated]
+    parser_classes = [JSONParser, NDJSONParser]
+
+    @extend_schema(request=TransactionSerializer(many=True))
+    def post(self, request, *args, **kwargs):
+        rows = request.data
+        if not isinstance(rows, list):
+            raise ValidationError({"detail": "Ожидается массив транзакций."})
+        if len(rows) > MAX_BULK_TRANSACTIONS:
+            raise ValidationError({"detail": f"Не больше {MAX_BULK_TRANSACTIONS} транзакций за запрос."})
+
+        # один экземпляр сериализатора на весь пакет, как в ListSerializer
+        child = self.get_serializer()
+        errors = {}
+        transactions, indexes = [], []
+        for index, row in enumerate(rows):
+            try:
+                validated = child.run_validation(row)
+            except ValidationError as exc:
+                errors[index] = exc.detail
+                continue
+            if validated["amount"] <= 0:
+                errors[index] = ["Amount must be greater than 0."]
+                continue
+            transactions.append(TransactionModel(**validated))
+            indexes.append(index)
+
+        created, rejected = post_transactions_bulk(transactions)
+        for position, message in rejected.items():
+            errors[indexes[position]] = [message]
+
+        return Response(
+            {
+                "created": len(created),
+                "ids": [tx.id for tx in created],
+                "errors": [{"index": index, "errors": errors[index]} for index in sorted(errors)],
+            },
+            status=status.HTTP_201_CREATED,
+        )
 
 
 class TransactionDetailView(generics.RetrieveAPIView):
     queryset = TransactionModel.objects.all()
     serializer_class = TransactionSerializer
+
+    def retrieve(self, request, *args, **kwargs):
+        updated_at = (
+            self.get_queryset().filter(pk=self.kwargs["pk"]).values_list("updated_at", flat=True).first()
+        )
+        if updated_at is None:
+            raise NotFound
+        validators = transaction_validators(self.kwargs["pk"], updated_at)
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        return validators.apply(super().retrieve(request, *args, **kwargs))
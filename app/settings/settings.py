@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -67,7 +68,19 @@ INSTALLED_APPS = [
 
 ]
 
+# документация API (Swagger UI, ReDoc, схемы OpenAPI; bank_accounts.docs). API_DOCS_ENABLED=0 —
+# для воркеров только под API: без маршрутов документации, её приложений и класса схемы,
+# drf-spectacular и drf-yasg не импортируются (bank_accounts.schema_hints). build_api_schemas
+# запускать с включённой документацией
+API_DOCS_ENABLED = os.environ.get("API_DOCS_ENABLED", "1") == "1"
+if not API_DOCS_ENABLED:
+    INSTALLED_APPS = [
+        app for app in INSTALLED_APPS if app not in ("drf_spectacular", "drf_spectacular_sidecar", "drf_yasg")
+    ]
+
 MIDDLEWARE = [
+    # первым — чтобы время и запросы к БД учитывали всю цепочку middleware
+    "bank_accounts.metrics.MetricsMiddleware",
     'corsheaders.middleware.CorsMiddleware',
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -102,13 +115,100 @@ WSGI_APPLICATION = "settings.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    "default": {
+# DATABASE_PROFILE: "sqlite" (по умолчанию) или "postgresql"
+DATABASE_PROFILE = os.environ.get("DATABASE_PROFILE", "sqlite")
+
+DATABASE_PROFILES = {
+    "sqlite": {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        # DATABASE_NAME задаёт, например, benchmark при запуске gunicorn на тестовой БД
+        "NAME": os.environ.get("DATABASE_NAME", BASE_DIR / "db.sqlite3"),
+        "OPTIONS": {
+            # проведение операций пишет в atomic-блоке: берём блокировку на запись сразу,
+            # иначе параллельные операции падают с "database is locked"
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 20,
+        },
+        # соединение живёт между запросами: открытие файла БД и PRAGMA из SQLITE_PRAGMAS
+        # (synchronous, busy_timeout, mmap_size действуют только на своё соединение) стоят
+        # ~1.5 мс на каждый запрос, если соединение создаётся заново (CONN_MAX_AGE = 0)
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+    },
+    "postgresql": {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.environ.get("DATABASE_NAME", "bank_accounts"),
+        "USER": os.environ.get("DATABASE_USER", "bank_accounts"),
+        "PASSWORD": os.environ.get("DATABASE_PASSWORD", ""),
+        "HOST": os.environ.get("DATABASE_HOST", "localhost"),
+        "PORT": os.environ.get("DATABASE_PORT", "5432"),
+        "OPTIONS": {
+            # пул соединений psycopg 3 внутри процесса (psycopg[pool] в requirements.txt);
+            # с пулом CONN_MAX_AGE должен быть 0
+            "pool": {
+                "min_size": int(os.environ.get("DATABASE_POOL_MIN", 2)),
+                "max_size": int(os.environ.get("DATABASE_POOL_MAX", 10)),
+            },
+        },
+        # .iterator() читает выгрузки через серверный курсор; за PgBouncer в режиме
+        # transaction серверные курсоры нужно отключить (DATABASE_SERVER_SIDE_CURSORS=0)
+        "DISABLE_SERVER_SIDE_CURSORS": os.environ.get("DATABASE_SERVER_SIDE_CURSORS", "1") == "0",
+    },
+}
+
+DATABASES = {"default": DATABASE_PROFILES[DATABASE_PROFILE]}
+
+# запросы дольше этого порога пишутся в лог вместе с самыми долгими SQL
+METRICS_SLOW_REQUEST_MS = 500
+# доступ к /metrics/ без входа под staff: заголовок "Authorization: Bearer <METRICS_TOKEN>"
+# или адрес из METRICS_ALLOWED_IPS (через запятую). За nginx на той же машине REMOTE_ADDR
+# у всех запросов 127.0.0.1, поэтому по умолчанию список пуст
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN") or None
+METRICS_ALLOWED_IPS = tuple(
+    address.strip() for address in os.environ.get("METRICS_ALLOWED_IPS", "").split(",") if address.strip()
+)
+
+# PRAGMA для каждого нового соединения SQLite (bank_accounts.db.configure_sqlite):
+# WAL — читатели не ждут писателя; synchronous=NORMAL в WAL безопасен при сбое процесса;
+# busy_timeout — ожидание блокировки вместо "database is locked"; mmap — чтение без копирования
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 20000,
+    "mmap_size": 256 * 1024 * 1024,
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "bank-accounts",
     }
 }
 
+# кэш сериализованных карт (bank_accounts.cache): алиас из CACHES и TTL в секундах
+CARD_CACHE_ALIAS = "default"
+CARD_CACHE_TIMEOUT = 300
+
+# кэш пользователей JWT-аутентификации (bank_accounts.authentication): TTL в секундах и число записей
+JWT_USER_CACHE_TIMEOUT = 30
+JWT_USER_CACHE_SIZE = 10000
+
+# Idempotency-Key для POST /api/transactions/ (bank_accounts.idempotency): срок жизни ключа,
+# время в фронтальном кэше и сколько повтор ждёт выполняющийся запрос, в секундах
+IDEMPOTENCY_KEY_TTL = 24 * 3600
+IDEMPOTENCY_CACHE_TIMEOUT = 600
+IDEMPOTENCY_WAIT_TIMEOUT = 10
+
+# готовые схемы OpenAPI (manage.py build_api_schemas): каталог с файлами и max-age ответов в секундах.
+# Без каталога схема строится при первом запросе и хранится в памяти процесса. max-age 0 — no-cache:
+# клиент каждый раз переспрашивает по ETag (304 без тела) и видит новую схему сразу после деплоя
+API_SCHEMA_DIR = os.environ.get("API_SCHEMA_DIR") or None
+API_SCHEMA_MAX_AGE = 0
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -148,6 +248,8 @@ STATIC_URL = "static/"
 STATIC_ROOT = BASE_DIR / '..' / "staticfiles"
 MEDIA_URL = "https://shironenergy.com/media/"
 MEDIA_ROOT = BASE_DIR / '..' / 'staticfiles' / 'media'
+# как часто (сек) проверять mtime каталога готовых изображений (bank_accounts.images)
+SAMPLE_IMAGES_RECHECK_SECONDS = 60
 
 
 # Default primary key field type
@@ -156,8 +258,13 @@ MEDIA_ROOT = BASE_DIR / '..' / 'staticfiles' / 'media'
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
-    "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "bank_accounts.authentication.CachedJWTAuthentication",
     )
 }
+if API_DOCS_ENABLED:
+    REST_FRAMEWORK["DEFAULT_SCHEMA_CLASS"] = "bank_accounts.openapi.AutoSchema"
+
+# страницы drf-yasg берут готовую схему по ссылке, а не строят её сами (?format=openapi)
+SWAGGER_SETTINGS = {"SPEC_URL": ("schema-json", {"format": ".json"})}
+REDOC_SETTINGS = {"SPEC_URL": ("schema-json", {"format": ".json"})}
@@ -17,28 +17,14 @@ Including another URLconf
 
 from django.contrib import admin
 from django.urls import path, re_path, include
-from rest_framework import permissions
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
 )
 from django.conf import settings
 from django.conf.urls.static import static
-
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Bank Accounts API",
-        default_version='v1',
-        description="Документация по API для карт и транзакций",
-        contact=openapi.Contact(email="support@example.com"),
-        license=openapi.License(name="BSD License"),
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny,),
-)
+from bank_accounts import docs
+from bank_accounts.metrics import metrics_view
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -47,13 +33,17 @@ urlpatterns = [
 
     path('api/', include('bank_accounts.urls')),
     path('api-auth/', include('rest_framework.urls')),
-
-    re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
-    path('api/swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('api/redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
-    path('api/schema/', SpectacularAPIView.as_view(), name='api-schema'),
-    path('api/docs/', SpectacularSwaggerView.as_view(url_name='api-schema'), name='swagger-ui'),
+    path("metrics/", metrics_view, name="metrics"),
 ]
 
+if settings.API_DOCS_ENABLED:
+    urlpatterns += [
+        re_path(r'^swagger(?P<format>\.json|\.yaml)$', docs.swagger_schema, name='schema-json'),
+        path('api/swagger/', docs.swagger_ui, name='schema-swagger-ui'),
+        path('api/redoc/', docs.redoc_ui, name='schema-redoc'),
+        path('api/schema/', docs.openapi_schema, name='api-schema'),
+        path('api/docs/', docs.spectacular_ui, name='swagger-ui'),
+    ]
+
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)